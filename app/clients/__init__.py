@@ -1,6 +1,8 @@
 from ._authenticationclient import AuthenticationClient
+from ._collectionscache import CollectionsCache
+from ._embeddingscache import EmbeddingsCache
 from ._internetclient import InternetClient
 from ._modelclients import ModelClients
 from ._searchclient import SearchClient
 
-__all__ = ["AuthenticationClient", "InternetClient", "ModelClients", "SearchClient"]
+__all__ = ["AuthenticationClient", "CollectionsCache", "EmbeddingsCache", "InternetClient", "ModelClients", "SearchClient"]
@@ -0,0 +1,187 @@
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from prometheus_client import Counter
+from redis import Redis
+
+from app.schemas.collections import Collection
+from app.schemas.security import User
+from app.utils.cache import LRUCache
+from app.utils.exceptions import CollectionNotFoundException
+from app.utils.logging import logger
+from app.utils.variables import PUBLIC_COLLECTION_TYPE
+
+
+class CollectionsCache:
+    """
+    Cache of the metadata of collections (owner and type included, to check access rights), keyed by collection ID. Each
+    collection has a version counter in Redis, incremented when the collection is created or its documents change (see bump) and
+    removed when the collection is deleted (see delete), so that deleted collections leave no key behind. Metadata are stored in an in-process LRU cache and in Redis with a TTL, along with the version they were read at.
+
+    In-process entries are used without any round trip for `revalidate_interval` seconds, then their version is checked in Redis:
+    changes made by other API instances are seen after at most `revalidate_interval` seconds, changes made by the instance itself
+    immediately. Search clients are synchronous, so is the Redis client of this cache.
+    """
+
+    PREFIX = "collections"
+
+    lookups = Counter(
+        name="collections_cache_lookups_total",
+        documentation="Number of collections cache lookups by result (memory, redis or miss)",
+        labelnames=["result"],
+    )
+
+    def __init__(self, redis: Redis, max_size: int, ttl: int, revalidate_interval: float) -> None:
+        self.redis = redis
+        self.ttl = ttl
+        self.revalidate_interval = revalidate_interval
+        self.memory = LRUCache(max_size=max_size)  # collection ID -> (version, checked at, collection)
+        self.lock = threading.Lock()  # search clients are called from the threadpool
+
+    def get(self, collection_ids: List[str], user: User) -> Tuple[Optional[List[Collection]], Dict[str, int]]:
+        """
+        Get the cached metadata of collections, checking the access rights of the user.
+
+        Args:
+            collection_ids (List[str]): The collection IDs, collections listings are not cached.
+            user (User): The user retrieving the collections.
+
+        Returns:
+            Tuple[Optional[List[Collection]], Dict[str, int]]: The collections, None if any of them is not cached, and the versions
+            of the collections read from Redis, to cache the collections read from the search database (see set).
+
+        Raises:
+            CollectionNotFoundException: If a cached collection is not visible by the user.
+        """
+        if not collection_ids:
+            return None, dict()
+
+        now = time.monotonic()
+        with self.lock:
+            entries = {collection_id: self.memory.get(collection_id) for collection_id in collection_ids}
+        stale = [collection_id for collection_id, entry in entries.items() if entry is None or now - entry[1] >= self.revalidate_interval]
+
+        versions = dict()
+        if stale:
+            try:
+                pipeline = self.redis.pipeline(transaction=False)
+                pipeline.mget([self._get_version_key(collection_id=collection_id) for collection_id in stale])
+                pipeline.mget([self._get_key(collection_id=collection_id) for collection_id in stale])
+                current_versions, values = pipeline.execute()
+            except Exception as e:
+                logger.warning(msg=f"collections cache unreachable: {e}")
+                self.lookups.labels(result="miss").inc(len(stale))
+                return None, dict()
+
+            for collection_id, version, value in zip(stale, current_versions, values):
+                versions[collection_id] = int(version or 0)
+                entry = entries[collection_id]
+                if entry is not None and entry[0] == versions[collection_id]:
+                    entries[collection_id] = (entry[0], now, entry[2])
+                    with self.lock:
+                        self.memory.set(key=collection_id, value=entries[collection_id])
+                    self.lookups.labels(result="memory").inc()
+                elif value is not None and json.loads(value)["version"] == versions[collection_id]:
+                    entries[collection_id] = (versions[collection_id], now, Collection(**json.loads(value)["collection"]))
+                    with self.lock:
+                        self.memory.set(key=collection_id, value=entries[collection_id])
+                    self.lookups.labels(result="redis").inc()
+                else:
+                    entries[collection_id] = None
+                    self.lookups.labels(result="miss").inc()
+        self.lookups.labels(result="memory").inc(len(collection_ids) - len(stale))
+
+        if any(entry is None for entry in entries.values()):
+            return None, versions
+
+        collections = [entries[collection_id][2] for collection_id in collection_ids]
+        for collection in collections:
+            if collection.user != user.id and collection.type != PUBLIC_COLLECTION_TYPE:
+                raise CollectionNotFoundException()
+
+        return [collection.model_copy() for collection in collections], versions
+
+    def get_versions(self, collection_ids: List[str]) -> Optional[Dict[str, int]]:
+        """
+        Get the current versions of collections, to cache data depending on their documents (see SemanticCache).
+
+        Args:
+            collection_ids (List[str]): The collection IDs.
+
+        Returns:
+            Optional[Dict[str, int]]: The versions of the collections, None if Redis is unreachable.
+        """
+        try:
+            versions = self.redis.mget([self._get_version_key(collection_id=collection_id) for collection_id in collection_ids])
+        except Exception as e:
+            logger.warning(msg=f"collections cache unreachable: {e}")
+            return None
+
+        return {collection_id: int(version or 0) for collection_id, version in zip(collection_ids, versions)}
+
+    def set(self, collections: List[Collection], versions: Dict[str, int]) -> None:
+        """
+        Cache the metadata of collections read from the search database.
+
+        Args:
+            collections (List[Collection]): The collections.
+            versions (Dict[str, int]): The versions of the collections read before the search database (see get), the collections
+                without version are not cached: they may have changed since.
+        """
+        collections = [collection for collection in collections if collection.id in versions]
+        if not collections:
+            return
+
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            for collection in collections:
+                value = json.dumps({"version": versions[collection.id], "collection": collection.model_dump()})
+                pipeline.setex(self._get_key(collection_id=collection.id), self.ttl, value)
+            pipeline.execute()
+        except Exception as e:
+            logger.warning(msg=f"collections cache unreachable: {e}")
+            return
+
+        # the collection may have been bumped by this instance since its versions were read: revalidated on first use
+        with self.lock:
+            for collection in collections:
+                self.memory.set(key=collection.id, value=(versions[collection.id], float("-inf"), collection.model_copy()))
+
+    def bump(self, collection_id: str) -> None:
+        """
+        Invalidate the cached metadata of a collection, on every API instance, by incrementing its version.
+
+        Args:
+            collection_id (str): The collection ID.
+        """
+        with self.lock:
+            self.memory.pop(collection_id, None)
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.incr(self._get_version_key(collection_id=collection_id))
+            pipeline.delete(self._get_key(collection_id=collection_id))
+            pipeline.execute()
+        except Exception as e:
+            logger.warning(msg=f"collections cache unreachable: {e}")
+
+    def delete(self, collection_id: str) -> None:
+        """
+        Invalidate the cached metadata of a deleted collection, on every API instance, by removing its version.
+
+        Args:
+            collection_id (str): The collection ID.
+        """
+        with self.lock:
+            self.memory.pop(collection_id, None)
+        try:
+            self.redis.delete(self._get_version_key(collection_id=collection_id), self._get_key(collection_id=collection_id))
+        except Exception as e:
+            logger.warning(msg=f"collections cache unreachable: {e}")
+
+    def _get_key(self, collection_id: str) -> str:
+        return f"{self.PREFIX}:{collection_id}"
+
+    def _get_version_key(self, collection_id: str) -> str:
+        return f"{self.PREFIX}:version:{collection_id}"
@@ -0,0 +1,111 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+import numpy as np
+from openai.types.create_embedding_response import Usage
+from prometheus_client import Histogram
+
+
+class EmbeddingsBatcher:
+    """
+    Gather the texts of concurrent embeddings requests to a model API during a short delay, or until the batch size budget is reached,
+    and send them in a single request. Each caller receives the vectors of its own texts.
+    """
+
+    batch_size = Histogram(
+        name="embeddings_batch_size",
+        documentation="Number of texts per batched embeddings request sent to the model API",
+        labelnames=["model"],
+        buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+    )
+
+    def __init__(
+        self,
+        send: Callable[[List[str]], Awaitable[Tuple[List[np.ndarray], Usage]]],
+        max_wait: float,
+        max_batch_size: int,
+    ) -> None:
+        """
+        Args:
+            send (Callable): Coroutine function sending a list of texts to the model API, returning the vectors and the usage.
+            max_wait (float): Max delay to wait for concurrent texts before sending a batch, in seconds.
+            max_batch_size (int): Max number of texts in a batch.
+        """
+        self.send = send
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+
+        self.queue: List[Tuple[List[str], asyncio.Future]] = list()
+        self.size = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def create(self, model: str, texts: List[str], max_batch_size: Optional[int] = None) -> Tuple[List[np.ndarray], Usage]:
+        """
+        Get the vectors of texts, batched with the texts of concurrent calls.
+
+        Args:
+            model (str): The model ID, used as metrics label.
+            texts (List[str]): The texts.
+            max_batch_size (Optional[int]): Max number of texts in a batch accepted by the model API, if lower than the batcher budget.
+
+        Returns:
+            Tuple[List[np.ndarray], Usage]: The vector of each text and the share of the batch usage of the texts.
+        """
+        max_batch_size = min(self.max_batch_size, max_batch_size or self.max_batch_size)
+
+        # requests already filling a batch are sent as is
+        if len(texts) >= max_batch_size:
+            self.batch_size.labels(model=model).observe(amount=len(texts))
+            return await self.send(texts)
+
+        if self.size + len(texts) > max_batch_size:
+            self._flush(model=model)
+
+        future = asyncio.get_running_loop().create_future()
+        self.queue.append((texts, future))
+        self.size += len(texts)
+
+        if self.size >= max_batch_size:
+            self._flush(model=model)
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush, model)
+
+        return await future
+
+    def _flush(self, model: str) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        batch, self.queue, self.size = self.queue, list(), 0
+        if not batch:
+            return
+
+        # keep a reference to the task until it is done, the event loop only keeps weak references
+        task = asyncio.create_task(self._send(model=model, batch=batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _send(self, model: str, batch: List[Tuple[List[str], asyncio.Future]]) -> None:
+        texts = [text for texts, _ in batch for text in texts]
+        self.batch_size.labels(model=model).observe(amount=len(texts))
+
+        try:
+            vectors, usage = await self.send(texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # the usage of the batch is shared between callers in proportion to the length of their texts
+        length = sum(len(text) for text in texts) or 1
+        start = 0
+        for texts, future in batch:
+            end = start + len(texts)
+            share = sum(len(text) for text in texts) / length
+            if not future.done():
+                prompt_tokens = round(usage.prompt_tokens * share)
+                future.set_result((vectors[start:end], Usage(prompt_tokens=prompt_tokens, total_tokens=prompt_tokens)))
+            start = end
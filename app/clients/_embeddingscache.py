@@ -0,0 +1,91 @@
+import hashlib
+from typing import List, Optional
+import unicodedata
+
+import numpy as np
+from prometheus_client import Counter
+from redis.asyncio import Redis
+
+from app.utils.cache import LRUCache
+from app.utils.logging import logger
+
+
+class EmbeddingsCache:
+    """
+    Content-addressed cache of embeddings vectors, keyed by model ID and hash of the normalized text. Vectors are stored in an
+    in-process LRU cache and in Redis as float32 bytes with a TTL.
+    """
+
+    PREFIX = "embeddings"
+
+    lookups = Counter(
+        name="embeddings_cache_lookups_total",
+        documentation="Number of embeddings cache lookups by model and result (memory, redis or miss)",
+        labelnames=["model", "result"],
+    )
+
+    def __init__(self, redis: Redis, max_size: int, ttl: int) -> None:
+        self.redis = redis
+        self.ttl = ttl
+        self.memory = LRUCache(max_size=max_size)
+
+    async def get(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Get the cached vectors of texts.
+
+        Args:
+            model (str): The model ID.
+            texts (List[str]): The texts.
+
+        Returns:
+            List[Optional[np.ndarray]]: The float32 vector of each text, None if not cached.
+        """
+        keys = [self._get_key(model=model, text=text) for text in texts]
+        vectors = [self.memory.get(key) for key in keys]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            try:
+                values = await self.redis.mget([keys[i] for i in missing])
+            except Exception as e:
+                logger.warning(msg=f"embeddings cache unreachable: {e}")
+                values = [None] * len(missing)
+
+            for i, value in zip(missing, values):
+                if value is not None:
+                    vectors[i] = np.frombuffer(value, dtype=np.float32)
+                    self.memory.set(key=keys[i], value=vectors[i])
+
+        hits = len(texts) - len(missing)
+        redis_hits = len([i for i in missing if vectors[i] is not None])
+        self.lookups.labels(model=model, result="memory").inc(hits)
+        self.lookups.labels(model=model, result="redis").inc(redis_hits)
+        self.lookups.labels(model=model, result="miss").inc(len(missing) - redis_hits)
+
+        return vectors
+
+    async def set(self, model: str, texts: List[str], vectors: List[np.ndarray]) -> None:
+        """
+        Cache the vectors of texts.
+
+        Args:
+            model (str): The model ID.
+            texts (List[str]): The texts.
+            vectors (List[np.ndarray]): The vector of each text.
+        """
+        try:
+            async with self.redis.pipeline(transaction=False) as pipeline:
+                for text, vector in zip(texts, vectors):
+                    key = self._get_key(model=model, text=text)
+                    vector = np.asarray(vector, dtype=np.float32)
+                    self.memory.set(key=key, value=vector)
+                    pipeline.setex(key, self.ttl, vector.tobytes())
+                await pipeline.execute()
+        except Exception as e:
+            logger.warning(msg=f"embeddings cache unreachable: {e}")
+
+    def _get_key(self, model: str, text: str) -> str:
+        text = unicodedata.normalize("NFC", text).strip()
+        digest = hashlib.sha256(text.encode(encoding="utf-8")).hexdigest()
+
+        return f"{self.PREFIX}:{model}:{digest}"
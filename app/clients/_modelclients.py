@@ -1,69 +1,48 @@
+import asyncio
 from functools import partial
-import json
+from hashlib import sha256
+from json import dumps
+import math
+import random
 import time
-from typing import Any, List, Literal
+from typing import Dict, List, Literal, Optional, Tuple
 
-from fastapi import HTTPException
-from openai import OpenAI
-import requests
+from openai import AsyncOpenAI
+from openai.types import Embedding
+from openai.types.create_embedding_response import Usage
+import httpx
+import numpy as np
 
+from app.clients._embeddingsbatcher import EmbeddingsBatcher
+from app.clients._embeddingscache import EmbeddingsCache
 from app.schemas.embeddings import Embeddings
 from app.schemas.chat import ChatCompletion
 from app.schemas.models import Model, Models
 from app.schemas.rerank import Rerank
+from app.schemas.settings import EmbeddingsBatching as EmbeddingsBatchingSettings
 from app.schemas.settings import Settings
-from app.utils.exceptions import ModelNotAvailableException, ModelNotFoundException
+from app.utils.cache import LRUCache
+from app.utils.exceptions import ContextLengthExceededException, ModelNotAvailableException, ModelNotFoundException
 from app.utils.logging import logger
-from app.utils.variables import AUDIO_MODEL_TYPE, DEFAULT_TIMEOUT, EMBEDDINGS_MODEL_TYPE, LANGUAGE_MODEL_TYPE, RERANK_MODEL_TYPE
+from app.utils.route import forward_request
+from app.utils.tokens import TokenCounter
+from app.utils.upstream import UpstreamState, upstream_clients
+from app.utils.vectors import decode_vector, decode_vectors, encode_vector, encode_vectors, format_vector, normalize_vectors
+from app.utils.variables import (
+    AUDIO_MODEL_TYPE,
+    DEFAULT_TIMEOUT,
+    EMBEDDINGS_MODEL_TYPE,
+    LANGUAGE_MODEL_TYPE,
+    POWER_OF_TWO_CHOICES_STRATEGY,
+    RERANK_MODEL_TYPE,
+)
 
 
 def get_models_list(self, *args, **kwargs) -> Models:
     """
-    Custom method to overwrite OpenAI's list method (client.models.list()). This method support
-    embeddings API models deployed with HuggingFace Text Embeddings Inference (see: https://github.com/huggingface/text-embeddings-inference).
+    Custom method to overwrite OpenAI's list method (client.models.list()). This method returns the last known state of the model,
+    refreshed in background by ModelClients.monitor (see ModelClient.refresh), so it never calls the model API.
     """
-    headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else None
-    data = list()
-
-    try:
-        if self.type == LANGUAGE_MODEL_TYPE:
-            endpoint = f"{self.base_url}models"
-            response = requests.get(url=endpoint, headers=headers, timeout=DEFAULT_TIMEOUT).json()
-
-            # Multiple models from one vLLM provider are not supported for now
-            assert len(response["data"]) == 1, "Only one model per model API is supported."
-
-            response = response["data"][0]
-
-            self.id = response["id"]
-            self.owned_by = response.get("owned_by", "")
-            self.created = response.get("created", round(time.time()))
-            self.max_context_length = response.get("max_model_len", None)
-
-        elif self.type == EMBEDDINGS_MODEL_TYPE or self.type == RERANK_MODEL_TYPE:
-            endpoint = str(self.base_url).replace("/v1/", "/info")
-            response = requests.get(url=endpoint, headers=headers, timeout=DEFAULT_TIMEOUT).json()
-
-            self.id = response["model_id"]
-            self.owned_by = "huggingface-text-embeddings-inference"
-            self.created = round(time.time())
-            self.max_context_length = response.get("max_input_length", None)
-
-        elif self.type == AUDIO_MODEL_TYPE:
-            endpoint = f"{self.base_url}models"
-            response = requests.get(url=endpoint, headers=headers, timeout=DEFAULT_TIMEOUT).json()
-            response = response["data"][0]
-
-            self.id = response["id"]
-            self.owned_by = response.get("owned_by", "")
-            self.created = response.get("created", round(time.time()))
-            self.max_context_length = None
-
-        self.status = "available"
-
-    except Exception:
-        self.status = "unavailable"
-
     data = Model(
         id=self.id,
         object="model",
@@ -78,47 +57,142 @@ def get_models_list(self, *args, **kwargs) -> Models:
     return Models(data=[data])
 
 
-def create_chat_completions(self, *args, **kwargs):
+async def create_chat_completions(self, *args, **kwargs) -> ChatCompletion:
     """
     Custom method to overwrite OpenAI's create method to raise HTTPException from model API.
     """
-    try:
-        url = f"{self.base_url}chat/completions"
-        headers = {"Authorization": f"Bearer {self.api_key}"}
-        response = requests.post(url=url, headers=headers, json=kwargs)
-        response.raise_for_status()
-        data = response.json()
-
-        return ChatCompletion(**data)
+    url = f"{self.base_url}chat/completions"
+    headers = {"Authorization": f"Bearer {self.api_key}"}
+    response = await forward_request(url=url, method="POST", headers=headers, json=kwargs, timeout=DEFAULT_TIMEOUT)
 
-    except Exception as e:
-        raise HTTPException(status_code=e.response.status_code, detail=json.loads(e.response.text)["message"])
+    return ChatCompletion(**response.json())
 
 
-def create_embeddings(self, *args, **kwargs):
+async def create_embeddings(self, *args, **kwargs) -> Embeddings:
     """
-    Custom method to overwrite OpenAI's create method to raise HTTPException from model API.
+    Custom method to overwrite OpenAI's create method to raise HTTPException from model API. If the embeddings cache is enabled,
+    only the texts not found in the cache are sent to the model API. If the embeddings batching is enabled, the texts are sent
+    with the texts of concurrent requests to the same model API (see EmbeddingsBatcher). Vectors are returned as lists of floats,
+    see forward_embeddings for base64 encoded vectors.
     """
-    try:
+    texts = get_embeddings_texts(**kwargs)
+    if texts is None:
         url = f"{self.base_url}embeddings"
         headers = {"Authorization": f"Bearer {self.api_key}"}
-        response = requests.post(url=url, headers=headers, json=kwargs)
-        response.raise_for_status()
-        data = response.json()
+        response = await forward_request(url=url, method="POST", headers=headers, json=kwargs, timeout=DEFAULT_TIMEOUT, coalesce=True)
+        return Embeddings(**response.json())
+
+    vectors, usage = await get_embeddings_vectors(self, texts=texts)
+    data = [Embedding(index=i, embedding=vector.tolist(), object="embedding") for i, vector in enumerate(vectors)]
 
-        return Embeddings(**data)
+    return Embeddings(object="list", data=data, model=self.id, usage=usage)
 
-    except Exception as e:
-        raise HTTPException(status_code=e.response.status_code, detail=json.loads(e.response.text)["message"])
 
+async def forward_embeddings(self, *args, **kwargs) -> bytes:
+    """
+    Same as create_embeddings, returning the JSON body of the response. The requests not served by the embeddings cache or
+    batching, nor requesting base64 encoded vectors to a model API not supporting them, are forwarded to the model API and its
+    response body is returned as is, without being decoded, unless the model API returned lists of floats for base64 encoded
+    vectors. Otherwise, vectors are encoded from their float32 values without building lists of floats: base64 encoded buffers
+    with `encoding_format="base64"`, shortest float32 representations otherwise.
+    """
+    texts = get_embeddings_texts(**kwargs)
+    encoding_format = kwargs.get("encoding_format") or "float"
+    if texts is not None and (
+        self.embeddings_cache is not None or self.embeddings_batcher is not None or (encoding_format == "base64" and self.encoding_format != "base64")
+    ):
+        vectors, usage = await get_embeddings_vectors(self, texts=texts)
+        embeddings = [dumps(encode_vector(vector)) if encoding_format == "base64" else format_vector(vector) for vector in vectors]
+        data = ", ".join([f'{{"object": "embedding", "index": {i}, "embedding": {embedding}}}' for i, embedding in enumerate(embeddings)])
+        body = f'{{"object": "list", "data": [{data}], "model": {dumps(self.id)}, "usage": {dumps(usage.model_dump())}}}'
+        return body.encode(encoding="utf-8")
+
+    url = f"{self.base_url}embeddings"
+    headers = {"Authorization": f"Bearer {self.api_key}"}
+    response = await forward_request(url=url, method="POST", headers=headers, json=kwargs, timeout=DEFAULT_TIMEOUT, coalesce=True)
+    if encoding_format == "base64":
+        # model APIs may ignore the encoding format, e.g. for token IDs input
+        return encode_vectors(content=response.content)
+
+    return response.content
+
+
+async def get_embeddings_vectors(self, texts: List[str]) -> Tuple[List[np.ndarray], Usage]:
+    """
+    Get the float32 vectors of texts, from the embeddings cache or the model API.
+    """
+    vectors = [None] * len(texts)
+    if self.embeddings_cache is not None:
+        vectors = await self.embeddings_cache.get(model=self.id, texts=texts)
+    usage = Usage(prompt_tokens=0, total_tokens=0)
+
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        if self.embeddings_batcher is None:
+            missing_vectors, usage = await self._create_embeddings(texts=missing_texts)
+        else:
+            missing_vectors, usage = await self.embeddings_batcher.create(model=self.id, texts=missing_texts, max_batch_size=self.max_batch_size)
+        for i, vector in zip(missing, missing_vectors):
+            vectors[i] = vector
+        if self.embeddings_cache is not None:
+            await self.embeddings_cache.set(model=self.id, texts=missing_texts, vectors=missing_vectors)
+
+    return vectors, usage
 
-class ModelClient(OpenAI):
-    def __init__(self, type=Literal[EMBEDDINGS_MODEL_TYPE, LANGUAGE_MODEL_TYPE, AUDIO_MODEL_TYPE, RERANK_MODEL_TYPE], *args, **kwargs) -> None:
+
+async def create_vectors(self, texts: List[str]) -> np.ndarray:
+    """
+    Internal method to get the embeddings of texts for the vector stores: a contiguous (n, d) float32 matrix of vectors normalized
+    to unit length, without building Python lists of floats.
+    """
+    if not texts:
+        return np.empty(shape=(0, self.vector_size or 0), dtype=np.float32)
+
+    vectors, _ = await get_embeddings_vectors(self, texts=texts)
+
+    return normalize_vectors(vectors=np.stack(vectors).astype(np.float32, copy=False))
+
+
+def get_embeddings_texts(**kwargs) -> Optional[List[str]]:
+    """
+    Get the texts of an embeddings request that can be served by the embeddings cache and batching: texts input, float or base64
+    encoding format and no other parameter.
+
+    Returns:
+        Optional[List[str]]: The texts, None if the request must be forwarded as is to the model API.
+    """
+    params = {key: value for key, value in kwargs.items() if value is not None}
+    texts = [params.get("input")] if isinstance(params.get("input"), str) else params.get("input")
+    if (
+        set(params.keys()) - {"input", "model", "encoding_format"}
+        or params.get("encoding_format", "float") not in ("float", "base64")
+        or not isinstance(texts, list)
+        or not all(isinstance(text, str) for text in texts)
+    ):
+        return None
+
+    return texts
+
+
+class ModelClient(AsyncOpenAI):
+    def __init__(
+        self,
+        type=Literal[EMBEDDINGS_MODEL_TYPE, LANGUAGE_MODEL_TYPE, AUDIO_MODEL_TYPE, RERANK_MODEL_TYPE],
+        embeddings_cache: Optional[EmbeddingsCache] = None,
+        embeddings_batching: Optional[EmbeddingsBatchingSettings] = None,
+        rerank_cache: Optional[LRUCache] = None,
+        *args,
+        **kwargs,
+    ) -> None:
         """
-        ModelClient class extends AsyncOpenAI class to support custom methods.
+        ModelClient class extends AsyncOpenAI class to support custom methods. All the custom methods are coroutines
+        sending requests with the pooled upstream clients (see app.utils.route.forward_request). The model API is not requested
+        by the constructor: the model is unavailable until its first health check (see refresh).
         """
         super().__init__(timeout=DEFAULT_TIMEOUT, *args, **kwargs)
         self.type = type
+        self.embeddings_cache = embeddings_cache
 
         # set attributes for unavailable models
         self.id = ""
@@ -126,87 +200,405 @@ class ModelClient(OpenAI):
         self.aliases = []
         self.created = round(number=time.time())
         self.max_context_length = None
+        self.max_batch_size = None
+        self.token_counter = TokenCounter()
+        self.status = "unavailable"
 
-        # set real attributes if model is available
         self.models.list = partial(get_models_list, self)
-        response = self.models.list()
+        self.select_replicas = lambda n: [self] * n  # replaced by the replicas selection of the models once registered
 
         if self.type == LANGUAGE_MODEL_TYPE:
             self.chat.completions.create = partial(create_chat_completions, self)
 
         if self.type == EMBEDDINGS_MODEL_TYPE:
-            response = self.embeddings.create(model=self.id, input="hello world")
-            self.vector_size = len(response.data[0].embedding)
+            self.encoding_format = "float"
+            self.vector_size = None
             self.embeddings.create = partial(create_embeddings, self)
+            self.embeddings.forward = partial(forward_embeddings, self)
+            self.embeddings.vectors = partial(create_vectors, self)
+            self.embeddings_batcher = None
+            if embeddings_batching is not None and embeddings_batching.enabled:
+                self.embeddings_batcher = EmbeddingsBatcher(
+                    send=self._create_embeddings, max_wait=embeddings_batching.max_wait, max_batch_size=embeddings_batching.max_batch_size
+                )
 
         if self.type == RERANK_MODEL_TYPE:
-
-            class RerankClient(OpenAI):
-                def __init__(self, model: str, *args, **kwargs) -> None:
-                    super().__init__(*args, **kwargs)
-                    self.model = model
-
-                def create(self, prompt: str, input: list[str], model: str) -> List[Rerank]:
-                    assert self.model == model, "Model not found."
-                    json = {"query": prompt, "texts": input}
+            model_client = self
+
+            class RerankClient(AsyncOpenAI):
+                async def create(self, prompt: str, input: list[str], model: str) -> List[Rerank]:
+                    """
+                    Rerank inputs, split into chunks of the max batch size of the model API sent concurrently and spread over the
+                    replicas of the model (see ModelClients.select_replicas). If the rerank cache is enabled, only the inputs not
+                    found in the cache are sent to the model API.
+                    """
+                    assert model_client.id == model, "Model not found."
+                    keys = [(model_client.id, sha256(dumps([prompt, text]).encode(encoding="utf-8")).hexdigest()) for text in input]
+                    scores = [rerank_cache.get(key) if rerank_cache is not None else None for key in keys]
+
+                    missing = [i for i, score in enumerate(scores) if score is None]
+                    batch_size = model_client.max_batch_size or len(missing) or 1
+                    chunks = [missing[i : i + batch_size] for i in range(0, len(missing), batch_size)]
+                    replicas = model_client.select_replicas(n=len(chunks))
+                    results = await asyncio.gather(
+                        *[replica.rerank._create(prompt=prompt, texts=[input[i] for i in chunk]) for replica, chunk in zip(replicas, chunks)]
+                    )
+
+                    for chunk, result in zip(chunks, results):
+                        for item in result:
+                            # remap the index in the chunk to the index in the input
+                            scores[chunk[item.index]] = item.score
+                            if rerank_cache is not None:
+                                rerank_cache.set(key=keys[chunk[item.index]], value=item.score)
+
+                    data = [Rerank(score=score, index=index) for index, score in enumerate(scores)]
+
+                    return sorted(data, key=lambda rerank: rerank.score, reverse=True)
+
+                async def _create(self, prompt: str, texts: List[str]) -> List[Rerank]:
+                    json = {"query": prompt, "texts": texts}
                     url = f"{str(self.base_url).replace("/v1/", "/rerank")}"
                     headers = {"Authorization": f"Bearer {self.api_key}"}
 
-                    response = requests.post(url=url, headers=headers, json=json, timeout=self.timeout)
-                    response.raise_for_status()
-                    data = response.json()
-                    data = [Rerank(**item) for item in data]
+                    response = await forward_request(url=url, method="POST", headers=headers, json=json, timeout=DEFAULT_TIMEOUT, coalesce=True)
+                    data = [Rerank(**item) for item in response.json()]
 
                     return data
 
-            self.rerank = RerankClient(model=self.id, base_url=self.base_url, api_key=self.api_key, timeout=DEFAULT_TIMEOUT)
+            self.rerank = RerankClient(base_url=self.base_url, api_key=self.api_key, timeout=DEFAULT_TIMEOUT)
+
+    async def _create_embeddings(self, texts: List[str]) -> Tuple[List[np.ndarray], Usage]:
+        url = f"{self.base_url}embeddings"
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        json = {"input": texts, "model": self.id, "encoding_format": self.encoding_format}
+        response = await forward_request(url=url, method="POST", headers=headers, json=json, timeout=DEFAULT_TIMEOUT, coalesce=True)
+        vectors, response = decode_vectors(content=response.content)
+
+        return vectors, Usage(**response["usage"])
+
+    async def _get_vector_size(self, timeout: httpx.Timeout) -> int:
+        """
+        Get the vector size of the model. The model API is also checked for base64 encoded vectors support, the most compact
+        encoding is used to get vectors from the model API.
+
+        Args:
+            timeout (httpx.Timeout): Timeout of the requests.
+        """
+        url = f"{self.base_url}embeddings"
+        client = upstream_clients.get(url=url)
+        json = {"model": self.id, "input": "hello world", "encoding_format": "base64"}
+        response = await client.post(url=url, headers=self._get_headers(), json=json, timeout=timeout)
+        if response.status_code == 200 and isinstance(response.json()["data"][0]["embedding"], str):
+            self.encoding_format = "base64"
+            return len(decode_vector(embedding=response.json()["data"][0]["embedding"]))
+
+        json.pop("encoding_format")
+        response = await client.post(url=url, headers=self._get_headers(), json=json, timeout=timeout)
+        response.raise_for_status()
+
+        return len(response.json()["data"][0]["embedding"])
+
+    async def refresh(self, timeout: float, connect_timeout: float) -> None:
+        """
+        Get the model information from the model API and update the model status, called at startup and in background by
+        ModelClients.monitor. The vector size of embeddings models is probed on their first successful health check. This
+        method support embeddings API models deployed with HuggingFace Text Embeddings Inference
+        (see: https://github.com/huggingface/text-embeddings-inference).
+
+        Args:
+            timeout (float): Timeout of the health check requests, in seconds.
+            connect_timeout (float): Timeout to connect to the model API, in seconds.
+        """
+        url = self._get_info_url()
+        timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        try:
+            response = await upstream_clients.get(url=url).get(url=url, headers=self._get_headers(), timeout=timeout)
+            response.raise_for_status()
+            self._set_info(response=response.json())
+            if self.type == EMBEDDINGS_MODEL_TYPE and self.vector_size is None:
+                self.vector_size = await self._get_vector_size(timeout=timeout)
+            status = "available"
+        except Exception as e:
+            logger.debug(msg=f"health check of model API {self.base_url} failed: {e}")
+            status = "unavailable"
+
+        if status != self.status:
+            logger.warning(msg=f"model {self.id} on {self.base_url} is now {status}.")
+        self.status = status
+
+    def _get_headers(self) -> Optional[dict]:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else None
+
+    def _get_info_url(self) -> str:
+        if self.type == EMBEDDINGS_MODEL_TYPE or self.type == RERANK_MODEL_TYPE:
+            return str(self.base_url).replace("/v1/", "/info")
+
+        return f"{self.base_url}models"
+
+    def _set_info(self, response: dict) -> None:
+        if self.type == LANGUAGE_MODEL_TYPE or self.type == AUDIO_MODEL_TYPE:
+            # Multiple models from one vLLM provider are not supported for now
+            assert self.type != LANGUAGE_MODEL_TYPE or len(response["data"]) == 1, "Only one model per model API is supported."
+            response = response["data"][0]
+            model_id = response["id"]
+        else:
+            model_id = response["model_id"]
+
+        # the model API must keep serving the same model once registered
+        assert not self.id or self.id == model_id, f"model API now serves {model_id} instead of {self.id}."
+        self.id = model_id
+
+        if self.type == LANGUAGE_MODEL_TYPE:
+            self.owned_by = response.get("owned_by", "")
+            self.created = response.get("created", self.created)
+            self.max_context_length = response.get("max_model_len", None)
+
+        elif self.type == EMBEDDINGS_MODEL_TYPE or self.type == RERANK_MODEL_TYPE:
+            self.owned_by = "huggingface-text-embeddings-inference"
+            self.max_context_length = response.get("max_input_length", None)
+            self.max_batch_size = response.get("max_client_batch_size", None)
+
+        elif self.type == AUDIO_MODEL_TYPE:
+            self.owned_by = response.get("owned_by", "")
+            self.created = response.get("created", self.created)
+            self.max_context_length = None
+
+    def check_context_length(self, prompt_tokens: int, max_tokens: Optional[int] = None) -> Optional[int]:
+        """
+        Check that a prompt fits the context length of the model and cap the number of tokens to generate to the remaining budget.
+        The number of tokens of the prompt is an estimate (see TokenCounter.SAFETY_FACTOR): the prompt is only rejected with the
+        lowest number of tokens it may have, and the number of tokens to generate, set if not given, is capped with the highest
+        number of tokens it may have, so that the model API never rejects the request for its length. Prompts that may not fit
+        the context length are sent with the number of tokens to generate capped with the lowest estimate, the model API
+        rejects them if they do not fit.
+
+        Args:
+            prompt_tokens (int): The estimated number of tokens of the prompt (see TokenCounter), 0 if not counted.
+            max_tokens (Optional[int]): The max number of tokens to generate requested by the user.
+
+        Returns:
+            Optional[int]: The max number of tokens to generate, capped to the remaining budget.
+
+        Raises:
+            ContextLengthExceededException: If the prompt clearly exceeds the context length of the model.
+        """
+        if not self.max_context_length or not prompt_tokens:
+            return max_tokens
+
+        min_prompt_tokens = math.floor(prompt_tokens / TokenCounter.SAFETY_FACTOR)
+        if min_prompt_tokens >= self.max_context_length:
+            raise ContextLengthExceededException(
+                detail=f"Prompt too long: about {prompt_tokens} tokens for a max context length of {self.max_context_length} tokens."
+            )
+
+        max_prompt_tokens = math.ceil(prompt_tokens * TokenCounter.SAFETY_FACTOR)
+        if max_prompt_tokens < self.max_context_length:
+            budget = self.max_context_length - max_prompt_tokens
+            return budget if max_tokens is None else min(max_tokens, budget)
+
+        if max_tokens is not None:
+            max_tokens = min(max_tokens, self.max_context_length - min_prompt_tokens)
+
+        return max_tokens
+
+    @property
+    def upstream(self) -> UpstreamState:
+        """
+        Requests in flight, latency and ejection state of the model API, shared by all models served by the same upstream.
+        """
+        return upstream_clients.get_state(url=str(self.base_url))
 
 
 class ModelClients(dict):
     """
-    Overwrite __getitem__ method to raise a 404 error if model is not found.
+    Overwrite __getitem__ method to raise a 404 error if model is not found and to load balance requests between the replicas of a model.
+    Each model ID is mapped to the list of the model clients (replicas) serving this model.
+
+    The model APIs are registered once they answer their health check: all the model APIs are probed concurrently at startup
+    (see setup), the model APIs not reachable at startup are kept pending and registered in background when they become healthy
+    (see monitor).
     """
 
-    def __init__(self, settings: Settings) -> None:
+    def __init__(self, settings: Settings, embeddings_cache: Optional[EmbeddingsCache] = None, rerank_cache: Optional[LRUCache] = None) -> None:
+        self.settings = settings
         self.aliases = {alias: model_id for model_id, aliases in settings.models.aliases.items() for alias in aliases}
+        self.load_balancing = settings.models.load_balancing
 
-        for model_settings in settings.clients.models:
-            model = ModelClient(
+        self.pending: List[ModelClient] = [
+            ModelClient(
                 base_url=model_settings.url,
                 api_key=model_settings.key,
                 type=model_settings.type,
+                embeddings_cache=embeddings_cache,
+                embeddings_batching=settings.models.embeddings_batching,
+                rerank_cache=rerank_cache,
             )
-            if model.status == "unavailable":
-                logger.error(msg=f"unavailable model API on {model_settings.url}, skipping.")
-                continue
-            try:
-                logger.info(msg=f"Adding model API {model_settings.url} to the client...")
-                self.__setitem__(key=model.id, value=model)
-                logger.info(msg="done.")
-            except Exception as e:
-                logger.error(msg=e)
+            for model_settings in settings.clients.models
+        ]
 
-            model.aliases = settings.models.aliases.get(model.id, [])
+    async def setup(self, timeout: float, connect_timeout: float) -> None:
+        """
+        Probe all the model APIs concurrently and register the available models, the API starts serving without waiting for the
+        unreachable model APIs.
+
+        Args:
+            timeout (float): Timeout of each health check request, in seconds.
+            connect_timeout (float): Timeout to connect to each model API, in seconds.
+        """
+        await self.refresh(timeout=timeout, connect_timeout=connect_timeout)
 
-        for alias in self.aliases.keys():
-            assert alias not in self.keys(), "Alias is already used by another model."
+        for model in self.pending:
+            logger.error(msg=f"unavailable model API on {model.base_url}, will be added once available.")
 
-        assert settings.internet.default_language_model in self.keys(), "Default internet language model not found."
-        assert settings.internet.default_embeddings_model in self.keys(), "Default internet embeddings model not found."
+        # the default models may be served by a pending model API
+        if not self.pending:
+            assert self.settings.internet.default_language_model in self.keys(), "Default internet language model not found."
+            assert self.settings.internet.default_embeddings_model in self.keys(), "Default internet embeddings model not found."
 
-    def __setitem__(self, key: str, value) -> None:
+    def __setitem__(self, key: str, value: ModelClient) -> None:
         if key in self.keys():
-            raise ValueError(f"duplicated model ID {key}, skipping.")
+            replicas = super().__getitem__(key)
+            if value.type != replicas[0].type:
+                raise ValueError(f"model ID {key} already used by a model of another type, skipping.")
+            if str(value.base_url) in [str(replica.base_url) for replica in replicas]:
+                raise ValueError(f"duplicated model API {value.base_url} for model ID {key}, skipping.")
+            replicas.append(value)
         else:
-            super().__setitem__(key, value)
+            super().__setitem__(key, [value])
+
+    def __getitem__(self, key: str) -> ModelClient:
+        return self.select_replicas(key=key, n=1)[0]
+
+    def register(self, model: ModelClient) -> None:
+        """
+        Add an available model API to the models.
+
+        Args:
+            model (ModelClient): The model client, with the information of the model API.
+        """
+        try:
+            logger.info(msg=f"Adding model API {model.base_url} to the client...")
+            if model.id in self.aliases:
+                raise ValueError(f"model ID {model.id} is already used as an alias, skipping.")
+            self.__setitem__(key=model.id, value=model)
+            model.select_replicas = partial(self.select_replicas, model.id)
+            logger.info(msg="done.")
+        except Exception as e:
+            logger.error(msg=e)
+
+        model.aliases = self.settings.models.aliases.get(model.id, [])
+
+    async def monitor(self, interval: float, timeout: float, connect_timeout: float) -> None:
+        """
+        Refresh the status of all the models in background, forever.
+
+        Args:
+            interval (float): Time between two health checks, in seconds.
+            timeout (float): Timeout of each health check request, in seconds.
+            connect_timeout (float): Timeout to connect to each model API, in seconds.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh(timeout=timeout, connect_timeout=connect_timeout)
+            except Exception as e:
+                logger.error(msg=f"models health check failed: {e}")
+
+    async def refresh(self, timeout: float, connect_timeout: float) -> None:
+        """
+        Check the health of all the replicas and pending model APIs concurrently, and register the pending model APIs now available.
+
+        Args:
+            timeout (float): Timeout of each health check request, in seconds.
+            connect_timeout (float): Timeout to connect to each model API, in seconds.
+        """
+        replicas = [replica for replicas in self.values() for replica in replicas] + self.pending
+        await asyncio.gather(*[replica.refresh(timeout=timeout, connect_timeout=connect_timeout) for replica in replicas])
+
+        for model in [model for model in self.pending if model.status == "available"]:
+            self.pending.remove(model)
+            self.register(model=model)
+
+    def list(self) -> Models:
+        """
+        Get the last known state of each model, a model is available if at least one of its replicas is available.
 
-    def __getitem__(self, key: str) -> Any:
+        Returns:
+            Models: The models.
+        """
+        data = list()
+        for model_id in self.keys():
+            rows = [row for replica in self.get_replicas(key=model_id) for row in replica.models.list().data]
+            data.append(next((row for row in rows if row.status == "available"), rows[0]))
+
+        return Models(data=data)
+
+    def get_replicas(self, key: str) -> List[ModelClient]:
+        """
+        Get all the replicas of a model, whatever their status.
+
+        Args:
+            key (str): The model ID or alias.
+
+        Returns:
+            List[ModelClient]: The model clients serving the model.
+        """
         key = self.aliases.get(key, key)
         try:
-            item = super().__getitem__(key)
-            assert item.status == "available", "Model not available."
-            return item
+            return super().__getitem__(key)
         except KeyError:
             raise ModelNotFoundException()
-        except AssertionError as e:
+
+    def select_replicas(self, key: str, n: int) -> List[ModelClient]:
+        """
+        Select the available replicas serving n concurrent requests to a model (e.g. the batches of a request): each request is
+        assigned as if the requests assigned before it were already in flight, so that the requests are spread over the replicas.
+
+        Args:
+            key (str): The model ID or alias.
+            n (int): The number of requests.
+
+        Returns:
+            List[ModelClient]: The replica selected for each request.
+        """
+        key = self.aliases.get(key, key)
+        try:
+            replicas = super().__getitem__(key)
+        except KeyError:
+            raise ModelNotFoundException()
+
+        replicas = [replica for replica in replicas if replica.status == "available"]
+        if not replicas:
             raise ModelNotAvailableException()
+
+        selected, assigned = list(), dict()
+        for _ in range(n):
+            replica = self._select_replica(replicas=replicas, assigned=assigned)
+            assigned[str(replica.base_url)] = assigned.get(str(replica.base_url), 0) + 1
+            selected.append(replica)
+
+        return selected
+
+    def _select_replica(self, replicas: List[ModelClient], assigned: Optional[Dict[str, int]] = None) -> ModelClient:
+        """
+        Select the replica with the fewest requests in flight (ties are broken by latency). Replicas ejected after consecutive
+        failures are skipped, unless all the replicas are ejected.
+
+        Args:
+            replicas (List[ModelClient]): The available replicas of a model.
+            assigned (Optional[Dict[str, int]]): The requests already assigned to each replica but not in flight yet, by base URL.
+
+        Returns:
+            ModelClient: The selected replica.
+        """
+        assigned = assigned or dict()
+        candidates = [replica for replica in replicas if not replica.upstream.ejected] or replicas
+        if self.load_balancing == POWER_OF_TWO_CHOICES_STRATEGY and len(candidates) > 2:
+            candidates = random.sample(candidates, k=2)
+        else:
+            candidates = random.sample(candidates, k=len(candidates))
+
+        return min(
+            candidates,
+            key=lambda replica: (replica.upstream.requests_in_flight + assigned.get(str(replica.base_url), 0), replica.upstream.latency or 0.0),
+        )
@@ -12,7 +12,7 @@ from app.utils.variables import HYBRID_SEARCH_TYPE, LEXICAL_SEARCH_TYPE, SEMANTI
 
 class SearchClient(ABC):
     @abstractmethod
-    def upsert(self, chunks: List[Chunk], collection_id: str, user: User) -> None:
+    async def upsert(self, chunks: List[Chunk], collection_id: str, user: User) -> None:
         """
         Add chunks to a collection.
 
@@ -24,7 +24,7 @@ class SearchClient(ABC):
         pass
 
     @abstractmethod
-    def query(
+    async def query(
         self,
         prompt: str,
         user: User,
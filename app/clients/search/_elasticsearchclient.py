@@ -1,12 +1,14 @@
-from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import functools
 import time
 from typing import Any, List, Literal, Optional
 
 from elasticsearch import Elasticsearch, NotFoundError, helpers
-from openai import APITimeoutError
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+import numpy as np
 
-from app.clients import SearchClient
+from app.clients import CollectionsCache, SearchClient
 from app.clients import ModelClients
 from app.schemas.chunks import Chunk
 from app.schemas.collections import Collection
@@ -19,6 +21,7 @@ from app.utils.exceptions import (
     InsufficientRightsException,
     WrongModelTypeException,
 )
+from app.utils.vectors import format_vector
 from app.utils.variables import (
     EMBEDDINGS_MODEL_TYPE,
     HYBRID_SEARCH_TYPE,
@@ -32,13 +35,17 @@ from app.utils.variables import (
 class ElasticSearchClient(SearchClient, Elasticsearch):
     BATCH_SIZE = 48
 
-    def __init__(self, models: ModelClients, *args, **kwargs):
+    def __init__(self, models: ModelClients, collections_cache: Optional[CollectionsCache] = None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         assert super().ping(), "Elasticsearch is not reachable"
         self.models = models
+        self.collections_cache = collections_cache
 
-    def upsert(self, chunks: List[Chunk], collection_id: str, user: User) -> None:
-        collection = self.get_collections(collection_ids=[collection_id], user=user)[0]
+    async def upsert(self, chunks: List[Chunk], collection_id: str, user: User) -> None:
+        """
+        See SearchClient.upsert
+        """
+        collection = (await run_in_threadpool(self.get_collections, collection_ids=[collection_id], user=user))[0]
 
         if user.role != Role.ADMIN and collection.type == PUBLIC_COLLECTION_TYPE:
             raise InsufficientRightsException()
@@ -47,23 +54,17 @@ class ElasticSearchClient(SearchClient, Elasticsearch):
             batched_chunks = chunks[i : i + self.BATCH_SIZE]
 
             texts = [chunk.content for chunk in batched_chunks]
-            embeddings = self._create_embeddings(input=texts, model=collection.model)
-
-            actions = [
-                {
-                    "_index": collection_id,
-                    "_source": {
-                        "body": chunk.content,
-                        "embedding": embedding,
-                        "metadata": chunk.metadata.model_dump(),
-                    },
-                }
-                for chunk, embedding in zip(batched_chunks, embeddings)
-            ]
-            helpers.bulk(self, actions, index=collection_id)
-        self.indices.refresh(index=collection_id)
+            embeddings = await self._create_embeddings(input=texts, model=collection.model)
+
+            # documents are serialized here, the vectors straight from the float32 matrix (see format_vector), and indexed in the
+            # collection of the bulk request
+            actions = [self._build_document(chunk=chunk, embedding=embedding) for chunk, embedding in zip(batched_chunks, embeddings)]
+            await run_in_threadpool(helpers.bulk, self, actions, index=collection_id)
+        await run_in_threadpool(self.indices.refresh, index=collection_id)
+        if self.collections_cache is not None:
+            await run_in_threadpool(self.collections_cache.bump, collection_id=collection_id)
 
-    def query(
+    async def query(
         self,
         prompt: str,
         user: User,
@@ -71,31 +72,33 @@ class ElasticSearchClient(SearchClient, Elasticsearch):
         method: Literal[HYBRID_SEARCH_TYPE, LEXICAL_SEARCH_TYPE, SEMANTIC_SEARCH_TYPE] = SEMANTIC_SEARCH_TYPE,
         k: Optional[int] = 4,
         rff_k: Optional[int] = 20,
+        score_threshold: Optional[float] = None,
     ) -> List[Search]:
         """
         See SearchClient.query
         """
-        collections = self.get_collections(collection_ids=collection_ids, user=user)
+        collections = await run_in_threadpool(self.get_collections, collection_ids=collection_ids, user=user)
 
         if len(set(collection.model for collection in collections)) > 1:
             raise DifferentCollectionsModelsException()
 
         if method == LEXICAL_SEARCH_TYPE:
-            searches = self._lexical_query(prompt=prompt, collection_ids=collection_ids, k=k)
+            searches = await run_in_threadpool(self._lexical_query, prompt=prompt, collection_ids=collection_ids, size=k)
         else:
             if len(set(collection.model for collection in collections)) > 1:
                 raise DifferentCollectionsModelsException()
 
-            embedding = self._create_embeddings(input=[prompt], model=collections[0].model)[0]
+            embedding = (await self._create_embeddings(input=[prompt], model=collections[0].model))[0]
 
             if method == SEMANTIC_SEARCH_TYPE:
-                searches = self._semantic_query(prompt=prompt, embedding=embedding, collection_ids=collection_ids, size=k)
+                searches = await run_in_threadpool(self._semantic_query, prompt=prompt, embedding=embedding, collection_ids=collection_ids, size=k)
 
             elif method == HYBRID_SEARCH_TYPE:
-                with ThreadPoolExecutor(max_workers=2) as executor:
-                    lexical_searches = executor.submit(self._lexical_query, prompt, collection_ids, k).result()
-                    semantic_searches = executor.submit(self._semantic_query, prompt, embedding, collection_ids, k).result()
-                    searches = self.build_ranked_searches(searches_list=[lexical_searches, semantic_searches], k=k, rff_k=rff_k)
+                lexical_searches, semantic_searches = await asyncio.gather(
+                    run_in_threadpool(self._lexical_query, prompt=prompt, collection_ids=collection_ids, size=k),
+                    run_in_threadpool(self._semantic_query, prompt=prompt, embedding=embedding, collection_ids=collection_ids, size=k),
+                )
+                searches = self.build_ranked_searches(searches_list=[lexical_searches, semantic_searches], k=k, rff_k=rff_k)
 
         return searches
 
@@ -103,6 +106,12 @@ class ElasticSearchClient(SearchClient, Elasticsearch):
         """
         See SearchClient.get_collections
         """
+        versions = dict()
+        if self.collections_cache is not None:
+            collections, versions = self.collections_cache.get(collection_ids=collection_ids, user=user)
+            if collections is not None:
+                return collections
+
         index_pattern = ",".join(collection_ids) if collection_ids else "*"
 
         try:
@@ -120,18 +129,38 @@ class ElasticSearchClient(SearchClient, Elasticsearch):
                 if collection.id not in collection_ids:
                     raise CollectionNotFoundException()
 
-        for collection in collections:
-            body = {
-                "query": {"match_all": {}},
-                "_source": ["metadata"],
-                "aggs": {"document_ids": {"terms": {"field": "metadata.document_id", "size": 100}}},
-            }
+        self._set_documents_count(collections=collections)
 
-            results = self.search(index=collection.id, body=body, size=1, from_=0)
-            collection.documents = len(results["aggregations"]["document_ids"]["buckets"])
+        if self.collections_cache is not None:
+            self.collections_cache.set(collections=collections, versions=versions)
 
         return collections
 
+    def _set_documents_count(self, collections: List[Collection]) -> None:
+        """
+        Count the documents of collections with a single multi search request, whatever the number of collections. Each document
+        has exactly one first chunk (`document_part` 1), so documents are counted exactly as the number of first chunks of the
+        collection, without aggregating the document IDs.
+
+        Raises:
+            CollectionNotFoundException: If a collection has been deleted while counting its documents.
+        """
+        if not collections:
+            return
+
+        searches = list()
+        for collection in collections:
+            searches.append({"index": collection.id})
+            searches.append({"size": 0, "track_total_hits": True, "query": {"term": {"metadata.document_part": 1}}})
+
+        results = self.msearch(searches=searches)
+        for collection, result in zip(collections, results["responses"]):
+            if "error" in result:
+                if result.get("status") == 404:
+                    raise CollectionNotFoundException()
+                raise RuntimeError(f"failed to count the documents of collection {collection.id}: {result["error"]}")
+            collection.documents = result["hits"]["total"]["value"]
+
     def create_collection(
         self,
         collection_id: str,
@@ -196,6 +225,8 @@ class ElasticSearchClient(SearchClient, Elasticsearch):
         }
 
         self.indices.create(index=collection_id, mappings=mappings, settings=settings, ignore=400)
+        if self.collections_cache is not None:
+            self.collections_cache.bump(collection_id=collection_id)
 
         return Collection(id=collection_id, **mappings["_meta"])
 
@@ -209,6 +240,8 @@ class ElasticSearchClient(SearchClient, Elasticsearch):
             raise InsufficientRightsException()
 
         self.indices.delete(index=collection_id, ignore_unavailable=True)
+        if self.collections_cache is not None:
+            self.collections_cache.delete(collection_id=collection_id)
 
     def get_chunks(self, collection_id: str, document_id: str, user: User, limit: int = 10, offset: int = 0) -> List[Chunk]:
         """
@@ -269,6 +302,13 @@ class ElasticSearchClient(SearchClient, Elasticsearch):
         body = {"query": {"match": {"metadata.document_id": document_id}}}
         self.delete_by_query(index=collection_id, body=body)
         self.indices.refresh(index=collection_id)
+        if self.collections_cache is not None:
+            self.collections_cache.bump(collection_id=collection_id)
+
+    def _build_document(self, chunk: Chunk, embedding: np.ndarray) -> bytes:
+        source = self.transport.serializers.dumps({"body": chunk.content, "metadata": chunk.metadata.model_dump()}, mimetype="application/json")
+
+        return b'{"embedding":' + format_vector(embedding).encode(encoding="utf-8") + b"," + source[1:]
 
     def _build_query_filter(self, prompt: str):
         fuzziness = {}
@@ -296,7 +336,7 @@ class ElasticSearchClient(SearchClient, Elasticsearch):
         hits = [hit for hit in results["hits"]["hits"] if hit]
         return [self._build_search(hit=hit) for hit in hits]
 
-    def _semantic_query(self, prompt: str, embedding: list[float], collection_ids: List[str], size: int) -> List[Search]:
+    def _semantic_query(self, prompt: str, embedding: np.ndarray, collection_ids: List[str], size: int) -> List[Search]:
         body = {
             "knn": {
                 "field": "embedding",
@@ -312,35 +352,37 @@ class ElasticSearchClient(SearchClient, Elasticsearch):
 
     def _retry(tries: int = 3, delay: int = 2):
         """
-        A simple retry decorator that catch exception to retry multiple times
+        A simple retry decorator that catch timeout exceptions of a coroutine to retry multiple times
 
         """
 
         def decorator_retry(func):
             @functools.wraps(wrapped=func)
-            def wrapper(*args, **kwargs) -> Any:
+            async def wrapper(*args, **kwargs) -> Any:
                 attempts = tries
                 while attempts > 1:
                     try:
-                        return func(*args, **kwargs)
-                    except APITimeoutError:
-                        time.sleep(delay)
+                        return await func(*args, **kwargs)
+                    except HTTPException as e:
+                        if e.status_code != 504:
+                            raise e
+                        await asyncio.sleep(delay)
                         attempts -= 1
 
-                return func(*args, **kwargs)
+                return await func(*args, **kwargs)
 
             return wrapper
 
         return decorator_retry
 
+    # embeddings are idempotent: unlike the upstream layer, which does not retry read timeouts, timed out requests are retried
     @_retry(tries=3, delay=2)
-    def _create_embeddings(self, input: List[str], model: str) -> list[float] | list[list[float]] | dict:
+    async def _create_embeddings(self, input: List[str], model: str) -> np.ndarray:
         """
-        Simple interface to create an embedding vector from a text input.
+        Simple interface to create the embedding vectors of text inputs, as a float32 matrix.
         """
 
-        response = self.models[model].embeddings.create(input=input, model=model)
-        return [vector.embedding for vector in response.data]
+        return await self.models[model].embeddings.vectors(texts=input)
 
     @staticmethod
     def build_ranked_searches(searches_list: List[List[Search]], k: int, rff_k: Optional[int] = 20) -> List[Search]:
@@ -1,6 +1,8 @@
 import time
 from typing import List, Literal, Optional
 from uuid import UUID
+
+from fastapi.concurrency import run_in_threadpool
 from qdrant_client import QdrantClient
 from qdrant_client.http.exceptions import ResponseHandlingException
 from qdrant_client.http.models import (
@@ -22,6 +24,7 @@ from app.schemas.documents import Document
 from app.schemas.search import Search
 from app.schemas.security import Role
 from app.schemas.security import User
+from app.clients._collectionscache import CollectionsCache
 from app.clients._modelclients import ModelClients
 from app.utils.exceptions import (
     CollectionNotFoundException,
@@ -45,9 +48,10 @@ class QdrantSearchClient(QdrantClient, SearchClient):
     METADATA_COLLECTION_ID = "collections"
     DOCUMENT_COLLECTION_ID = "documents"
 
-    def __init__(self, models: ModelClients, *args, **kwargs):
+    def __init__(self, models: ModelClients, collections_cache: Optional[CollectionsCache] = None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.models = models
+        self.collections_cache = collections_cache
 
         if not super().collection_exists(collection_name=self.METADATA_COLLECTION_ID):
             super().create_collection(collection_name=self.METADATA_COLLECTION_ID, vectors_config={}, on_disk_payload=False)
@@ -55,11 +59,11 @@ class QdrantSearchClient(QdrantClient, SearchClient):
         if not super().collection_exists(collection_name=self.DOCUMENT_COLLECTION_ID):
             super().create_collection(collection_name=self.DOCUMENT_COLLECTION_ID, vectors_config={}, on_disk_payload=False)
 
-    def upsert(self, chunks: List[Chunk], collection_id: str, user: User) -> None:
+    async def upsert(self, chunks: List[Chunk], collection_id: str, user: User) -> None:
         """
         See SearchClient.upsert
         """
-        collection = self.get_collections(collection_ids=[collection_id], user=user)[0]
+        collection = (await run_in_threadpool(self.get_collections, collection_ids=[collection_id], user=user))[0]
 
         if user.role != Role.ADMIN and collection.type == PUBLIC_COLLECTION_TYPE:
             raise InsufficientRightsException()
@@ -68,7 +72,8 @@ class QdrantSearchClient(QdrantClient, SearchClient):
             batch = chunks[i : i + self.BATCH_SIZE]
 
             # insert documents
-            super().upsert(
+            await run_in_threadpool(
+                super().upsert,
                 collection_name=self.DOCUMENT_COLLECTION_ID,
                 points=[
                     PointStruct(
@@ -86,19 +91,24 @@ class QdrantSearchClient(QdrantClient, SearchClient):
 
             # create embeddings
             texts = [chunk.content for chunk in batch]
-            response = self.models[collection.model].embeddings.create(input=texts, model=collection.model)
-            vectors = [vector.embedding for vector in response.data]
+            vectors = await self.models[collection.model].embeddings.vectors(texts=texts)
 
             # insert chunks and vectors
-            super().upsert(
+            await run_in_threadpool(
+                super().upsert,
                 collection_name=collection_id,
                 points=[
                     PointStruct(id=chunk.id, vector=vector, payload={"content": chunk.content, "metadata": chunk.metadata.model_dump()})
-                    for chunk, vector in zip(batch, vectors)
+                    for chunk, vector in zip(batch, vectors.tolist())
                 ],
             )
 
         # update collection documents count
+        await run_in_threadpool(self._update_documents_count, collection=collection)
+        if self.collections_cache is not None:
+            await run_in_threadpool(self.collections_cache.bump, collection_id=collection_id)
+
+    def _update_documents_count(self, collection: Collection) -> None:
         payload = collection.model_dump()
         payload["documents"] = (
             super()
@@ -111,7 +121,7 @@ class QdrantSearchClient(QdrantClient, SearchClient):
         payload.pop("id")
         super().upsert(collection_name=self.METADATA_COLLECTION_ID, points=[PointStruct(id=collection.id, payload=payload, vector={})])
 
-    def query(
+    async def query(
         self,
         prompt: str,
         user: User,
@@ -128,17 +138,17 @@ class QdrantSearchClient(QdrantClient, SearchClient):
         if method != SEMANTIC_SEARCH_TYPE:
             raise NotImplementedException("Lexical and hybrid search are not available for Qdrant database.")
 
-        collections = self.get_collections(collection_ids=collection_ids, user=user)
+        collections = await run_in_threadpool(self.get_collections, collection_ids=collection_ids, user=user)
         if len(set(collection.model for collection in collections)) > 1:
             raise DifferentCollectionsModelsException()
 
         model = collections[0].model
-        response = self.models[model].embeddings.create(input=[prompt], model=model)
-        vector = response.data[0].embedding
+        vector = (await self.models[model].embeddings.vectors(texts=[prompt]))[0]
 
         chunks = []
         for collection in collections:
-            results = super().search(
+            results = await run_in_threadpool(
+                super().search,
                 collection_name=collection.id,
                 query_vector=vector,
                 limit=k,
@@ -162,6 +172,12 @@ class QdrantSearchClient(QdrantClient, SearchClient):
         """
         See SearchClient.get_collections
         """
+        versions = dict()
+        if self.collections_cache is not None:
+            collections, versions = self.collections_cache.get(collection_ids=collection_ids, user=user)
+            if collections is not None:
+                return collections
+
         # if no collection ids are provided, get all collections
         must = [HasIdCondition(has_id=collection_ids)] if collection_ids else []
         should = []
@@ -203,6 +219,9 @@ class QdrantSearchClient(QdrantClient, SearchClient):
                 )
             )
 
+        if self.collections_cache is not None:
+            self.collections_cache.set(collections=collections, versions=versions)
+
         return collections
 
     def create_collection(
@@ -240,6 +259,8 @@ class QdrantSearchClient(QdrantClient, SearchClient):
         super().create_collection(
             collection_name=collection_id, vectors_config=VectorParams(size=self.models[collection_model].vector_size, distance=Distance.COSINE)
         )
+        if self.collections_cache is not None:
+            self.collections_cache.bump(collection_id=collection_id)
 
         return Collection(id=collection_id, **metadata)
 
@@ -254,6 +275,8 @@ class QdrantSearchClient(QdrantClient, SearchClient):
 
         super().delete_collection(collection_name=collection.id)
         super().delete(collection_name=self.METADATA_COLLECTION_ID, points_selector=PointIdsList(points=[collection.id]))
+        if self.collections_cache is not None:
+            self.collections_cache.delete(collection_id=collection.id)
 
     def get_chunks(self, collection_id: str, document_id: str, user: User, limit: int = 10, offset: Optional[UUID] = None) -> List[Chunk]:
         """
@@ -307,3 +330,5 @@ class QdrantSearchClient(QdrantClient, SearchClient):
 
         # delete document
         super().delete(collection_name=self.DOCUMENT_COLLECTION_ID, points_selector=PointIdsList(points=[document_id]))
+        if self.collections_cache is not None:
+            self.collections_cache.bump(collection_id=collection.id)
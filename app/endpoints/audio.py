@@ -133,7 +133,7 @@ SUPPORTED_LANGUAGES_VALUES = sorted(set(SUPPORTED_LANGUAGES.values())) + sorted(
 
 
 @router.post("/audio/transcriptions")
-@limiter.limit(settings.rate_limit.by_key, key_func=lambda request: check_rate_limit(request=request))
+@limiter.limit(lambda: settings.rate_limit.by_key, key_func=lambda request: check_rate_limit(request=request))
 async def audio_transcriptions(
     request: Request,
     file: UploadFile = File(...),
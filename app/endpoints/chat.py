@@ -1,13 +1,14 @@
+from contextlib import aclosing
 from typing import List, Tuple, Union
 
-from fastapi import APIRouter, Request, Security
-from fastapi.concurrency import run_in_threadpool
+from fastapi import APIRouter, Request, Response, Security
 
-from app.helpers import ClientsManager, InternetManager, SearchManager, StreamingResponseWithStatusCode
+from app.helpers import ClientsManager, InternetManager, ResponseCache, SearchManager, SemanticCache, StreamingResponseWithStatusCode
 from app.schemas.chat import ChatCompletion, ChatCompletionChunk, ChatCompletionRequest
 from app.schemas.search import Search
 from app.schemas.security import User
 from app.schemas.settings import Settings
+from app.utils.admission import admission_controller
 from app.utils.exceptions import WrongModelTypeException
 from app.utils.lifespan import clients, limiter
 from app.utils.route import forward_request, forward_stream
@@ -19,7 +20,7 @@ router = APIRouter()
 
 
 @router.post(path="/chat/completions")
-@limiter.limit(limit_value=settings.rate_limit.by_key, key_func=lambda request: check_rate_limit(request=request))
+@limiter.limit(limit_value=lambda: settings.rate_limit.by_key, key_func=lambda request: check_rate_limit(request=request))
 async def chat_completions(
     request: Request, body: ChatCompletionRequest, user: User = Security(dependency=check_api_key)
 ) -> Union[ChatCompletion, ChatCompletionChunk]:
@@ -27,16 +28,15 @@ async def chat_completions(
     See https://platform.openai.com/docs/api-reference/chat/create for the API specification.
     """
 
-    client = clients.models[body.model]
+    # the replica serving the request is selected once the request is admitted, with the requests in flight at that time
+    client = clients.models.get_replicas(key=body.model)[0]
     if client.type != LANGUAGE_MODEL_TYPE:
         raise WrongModelTypeException()
 
     body.model = client.id  # replace alias by model id
-    url = f"{client.base_url}chat/completions"
-    headers = {"Authorization": f"Bearer {client.api_key}"}
 
     # retrieval augmentation generation
-    def retrieval_augmentation_generation(
+    async def retrieval_augmentation_generation(
         body: ChatCompletionRequest, clients: ClientsManager, settings: Settings
     ) -> Tuple[ChatCompletionRequest, List[Search]]:
         searches = []
@@ -51,7 +51,7 @@ async def chat_completions(
                     default_embeddings_model_id=settings.internet.default_embeddings_model,
                 ),
             )
-            searches = search_manager.query(
+            searches = await search_manager.query(
                 collections=body.search_args.collections,
                 prompt=body.messages[-1]["content"],
                 method=body.search_args.method,
@@ -59,6 +59,17 @@ async def chat_completions(
                 rff_k=body.search_args.rff_k,
                 user=user,
             )
+            if searches and client.max_context_length:
+                # drop the lowest ranked chunks not fitting the context length of the model
+                prompt = body.search_args.template.format(prompt=body.messages[-1]["content"], chunks="")
+                budget = client.max_context_length - (body.max_tokens or 0)
+                budget -= client.token_counter.count_messages(messages=body.messages[:-1] + [{"role": "user", "content": prompt}])
+                for i, search in enumerate(searches):
+                    budget -= client.token_counter.count(text=search.chunk.content + "\n")
+                    if budget < 0:
+                        searches = searches[:i]
+                        break
+
             if searches:
                 body.messages[-1]["content"] = body.search_args.template.format(
                     prompt=body.messages[-1]["content"], chunks="\n".join([search.chunk.content for search in searches])
@@ -71,31 +82,90 @@ async def chat_completions(
         searches = [search.model_dump() for search in searches]
         return body, searches
 
-    body, searches = await run_in_threadpool(retrieval_augmentation_generation, body, clients, settings)
+    # semantic cache of retrieval augmented generation requests, before the search
+    semantic_query = None
+    if clients.semantic_cache is not None and SemanticCache.is_cacheable(body=body, headers=request.headers):
+        semantic_query = await clients.semantic_cache.get_query(body=body, user=user, models=clients.models, search=clients.search)
+        cached = clients.semantic_cache.get(query=semantic_query, model=client.id) if semantic_query is not None else None
+        if cached is not None and body.stream:
+            content = clients.semantic_cache.replay(value=cached)
+            return StreamingResponseWithStatusCode(content=content, media_type="text/event-stream", headers={SemanticCache.HEADER: "HIT"})
+        if cached is not None:
+            return Response(content=cached, media_type="application/json", headers={SemanticCache.HEADER: "HIT"})
+
+    body, searches = await retrieval_augmentation_generation(body=body, clients=clients, settings=settings)
+
+    prompt_tokens = client.token_counter.count_messages(messages=body["messages"])
+    body["max_tokens"] = client.check_context_length(prompt_tokens=prompt_tokens, max_tokens=body["max_tokens"])
+
+    # response cache of deterministic requests
+    cache_key = None
+    if clients.response_cache is not None and ResponseCache.is_cacheable(body=body, headers=request.headers):
+        cache_key = clients.response_cache.get_key(endpoint="chat/completions", body=body)
+        cached = await clients.response_cache.get(key=cache_key, endpoint="chat/completions", model=client.id)
+        if cached is not None and body["stream"]:
+            content = clients.response_cache.replay(value=cached)
+            return StreamingResponseWithStatusCode(content=content, media_type="text/event-stream", headers={ResponseCache.HEADER: "HIT"})
+        if cached is not None:
+            return Response(content=cached, media_type="application/json", headers={ResponseCache.HEADER: "HIT"})
 
     # not stream case
     if not body["stream"]:
-        response = await forward_request(
-            url=url,
-            method="POST",
-            headers=headers,
-            json=body,
-            timeout=DEFAULT_TIMEOUT,
-            additional_data_value=searches,
-            additional_data_key="search_results",
-        )
-        return ChatCompletion(**response.json())
-
-    # stream case
-    return StreamingResponseWithStatusCode(
-        content=forward_stream(
-            url=url,
-            method="POST",
-            headers=headers,
-            json=body,
-            timeout=DEFAULT_TIMEOUT,
-            additional_data_value=searches,
-            additional_data_key="search_results",
-        ),
-        media_type="text/event-stream",
-    )
+        async with await admission_controller.acquire(model=client.id, user=check_rate_limit(request=request), role=user.role):
+            replica = clients.models[client.id]
+            response = await forward_request(
+                url=f"{replica.base_url}chat/completions",
+                method="POST",
+                headers={"Authorization": f"Bearer {replica.api_key}"},
+                json=body,
+                timeout=DEFAULT_TIMEOUT,
+                additional_data_value=searches,
+                additional_data_key="search_results",
+                coalesce=ResponseCache.is_deterministic(body=body),
+            )
+        # the response body is forwarded as is, without being decoded
+        prompt_tokens = client.token_counter.get_prompt_tokens(content=response.content)
+        if prompt_tokens:
+            client.token_counter.calibrate_messages(messages=body["messages"], tokens=prompt_tokens)
+
+        cache_headers = dict()
+        if cache_key is not None:
+            await clients.response_cache.set(key=cache_key, value=response.content)
+            cache_headers[ResponseCache.HEADER] = "MISS"
+        if semantic_query is not None:
+            clients.semantic_cache.set(query=semantic_query, value=response.content)
+            cache_headers[SemanticCache.HEADER] = "MISS"
+
+        return Response(content=response.content, media_type="application/json", headers=cache_headers)
+
+    # stream case, the slot is acquired by the stream, so that it is not held if the response is never sent, and released once
+    # the stream is over: requests are rejected up front if the queue is full, errors while waiting are sent as the response
+    admission_controller.check(model=client.id)
+
+    async def stream():
+        async with await admission_controller.acquire(model=client.id, user=check_rate_limit(request=request), role=user.role):
+            replica = clients.models[client.id]
+            async with aclosing(
+                forward_stream(
+                    url=f"{replica.base_url}chat/completions",
+                    method="POST",
+                    headers={"Authorization": f"Bearer {replica.api_key}"},
+                    json=body,
+                    timeout=DEFAULT_TIMEOUT,
+                    additional_data_value=searches,
+                    additional_data_key="search_results",
+                    coalesce=ResponseCache.is_deterministic(body=body),
+                )
+            ) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+
+    content, cache_headers = stream(), dict()
+    if cache_key is not None:
+        content = clients.response_cache.record(key=cache_key, stream=content)
+        cache_headers[ResponseCache.HEADER] = "MISS"
+    if semantic_query is not None:
+        content = clients.semantic_cache.record(query=semantic_query, stream=content)
+        cache_headers[SemanticCache.HEADER] = "MISS"
+
+    return StreamingResponseWithStatusCode(content=content, media_type="text/event-stream", headers=cache_headers)
@@ -1,6 +1,7 @@
 from uuid import UUID
 from typing import Union
 from fastapi import APIRouter, Request, Security, Query
+from fastapi.concurrency import run_in_threadpool
 
 from app.schemas.chunks import Chunks
 from app.schemas.security import User
@@ -23,6 +24,6 @@ async def get_chunks(
     Get a single chunk.
     """
     collection, document = str(collection), str(document)
-    data = clients.search.get_chunks(collection_id=collection, document_id=document, limit=limit, offset=offset, user=user)
+    data = await run_in_threadpool(clients.search.get_chunks, collection_id=collection, document_id=document, limit=limit, offset=offset, user=user)
 
     return Chunks(data=data)
@@ -3,6 +3,7 @@ import uuid
 from uuid import UUID
 
 from fastapi import APIRouter, Request, Response, Security
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 
 from app.schemas.collections import Collection, CollectionRequest, Collections
@@ -20,7 +21,8 @@ async def create_collection(request: Request, body: CollectionRequest, user: Use
     Create a new collection.
     """
     collection_id = str(uuid.uuid4())
-    clients.search.create_collection(
+    await run_in_threadpool(
+        clients.search.create_collection,
         collection_id=collection_id,
         collection_name=body.name,
         collection_model=body.model,
@@ -44,7 +46,7 @@ async def get_collections(request: Request, user: User = Security(check_api_key)
         type=PUBLIC_COLLECTION_TYPE,
         description="Use this collection to search on the internet.",
     )
-    data = clients.search.get_collections(user=user)
+    data = await run_in_threadpool(clients.search.get_collections, user=user)
     data.append(internet_collection)
 
     return Collections(data=data)
@@ -56,6 +58,6 @@ async def delete_collections(request: Request, collection: UUID, user: User = Se
     Delete a collection.
     """
     collection = str(collection)
-    clients.search.delete_collection(collection_id=collection, user=user)
+    await run_in_threadpool(clients.search.delete_collection, collection_id=collection, user=user)
 
     return Response(status_code=204)
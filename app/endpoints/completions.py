@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Request, Security
+from fastapi import APIRouter, Request, Response, Security
 
+from app.helpers import ResponseCache
 from app.schemas.completions import CompletionRequest, Completions
 from app.schemas.security import User
+from app.utils.admission import admission_controller
 from app.utils.exceptions import WrongModelTypeException
 from app.utils.lifespan import clients, limiter
 from app.utils.route import forward_request
@@ -13,19 +15,48 @@ router = APIRouter()
 
 
 @router.post(path="/completions")
-@limiter.limit(limit_value=settings.rate_limit.by_key, key_func=lambda request: check_rate_limit(request=request))
+@limiter.limit(limit_value=lambda: settings.rate_limit.by_key, key_func=lambda request: check_rate_limit(request=request))
 async def completions(request: Request, body: CompletionRequest, user: User = Security(dependency=check_api_key)) -> Completions:
     """
     Completion API similar to OpenAI's API.
     See https://platform.openai.com/docs/api-reference/completions/create for the API specification.
     """
-    client = clients.models[body.model]
+    # the replica serving the request is selected once the request is admitted, with the requests in flight at that time
+    client = clients.models.get_replicas(key=body.model)[0]
     if client.type != LANGUAGE_MODEL_TYPE:
         raise WrongModelTypeException()
 
     body.model = client.id  # replace alias by model id
-    url = f"{client.base_url}completions"
-    headers = {"Authorization": f"Bearer {client.api_key}"}
+    prompt_tokens = client.token_counter.count_prompt(prompt=body.prompt)
+    body.max_tokens = client.check_context_length(prompt_tokens=prompt_tokens, max_tokens=body.max_tokens)
 
-    response = await forward_request(url=url, method="POST", headers=headers, json=body.model_dump(), timeout=DEFAULT_TIMEOUT)
-    return Completions(**response.json())
+    # response cache of deterministic requests
+    cache_key = None
+    if clients.response_cache is not None and ResponseCache.is_cacheable(body=body.model_dump(), headers=request.headers):
+        cache_key = clients.response_cache.get_key(endpoint="completions", body=body.model_dump())
+        cached = await clients.response_cache.get(key=cache_key, endpoint="completions", model=client.id)
+        if cached is not None:
+            return Response(content=cached, media_type="application/json", headers={ResponseCache.HEADER: "HIT"})
+
+    async with await admission_controller.acquire(model=client.id, user=check_rate_limit(request=request), role=user.role):
+        replica = clients.models[client.id]
+        response = await forward_request(
+            url=f"{replica.base_url}completions",
+            method="POST",
+            headers={"Authorization": f"Bearer {replica.api_key}"},
+            json=body.model_dump(),
+            timeout=DEFAULT_TIMEOUT,
+            coalesce=ResponseCache.is_deterministic(body=body.model_dump()),
+        )
+
+    # the response body is forwarded as is, without being decoded
+    prompt_tokens = client.token_counter.get_prompt_tokens(content=response.content)
+    if prompt_tokens and isinstance(body.prompt, str):
+        client.token_counter.calibrate(text=body.prompt, tokens=prompt_tokens)
+
+    cache_headers = dict()
+    if cache_key is not None:
+        await clients.response_cache.set(key=cache_key, value=response.content)
+        cache_headers[ResponseCache.HEADER] = "MISS"
+
+    return Response(content=response.content, media_type="application/json", headers=cache_headers)
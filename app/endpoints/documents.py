@@ -2,6 +2,7 @@ from typing import Optional, Union
 from uuid import UUID
 
 from fastapi import APIRouter, Query, Request, Response, Security
+from fastapi.concurrency import run_in_threadpool
 
 from app.schemas.documents import Documents
 from app.schemas.security import User
@@ -23,7 +24,7 @@ async def get_documents(
     Get all documents ID from a collection.
     """
     collection = str(collection)
-    data = clients.search.get_documents(collection_id=collection, limit=limit, offset=offset, user=user)
+    data = await run_in_threadpool(clients.search.get_documents, collection_id=collection, limit=limit, offset=offset, user=user)
 
     return Documents(data=data)
 
@@ -34,6 +35,6 @@ async def delete_document(request: Request, collection: UUID, document: UUID, us
     Delete a document and relative collections.
     """
     collection, document = str(collection), str(document)
-    clients.search.delete_document(collection_id=collection, document_id=document, user=user)
+    await run_in_threadpool(clients.search.delete_document, collection_id=collection, document_id=document, user=user)
 
     return Response(status_code=204)
@@ -1,12 +1,11 @@
-from fastapi import APIRouter, Request, Security
+from fastapi import APIRouter, Request, Response, Security
 
 from app.schemas.embeddings import Embeddings, EmbeddingsRequest
 from app.schemas.security import User
 from app.utils.exceptions import WrongModelTypeException
 from app.utils.lifespan import clients
-from app.utils.route import forward_request
 from app.utils.security import check_api_key
-from app.utils.variables import DEFAULT_TIMEOUT, EMBEDDINGS_MODEL_TYPE
+from app.utils.variables import EMBEDDINGS_MODEL_TYPE
 
 router = APIRouter()
 
@@ -23,8 +22,6 @@ async def embeddings(request: Request, body: EmbeddingsRequest, user: User = Sec
         raise WrongModelTypeException()
 
     body.model = client.id  # replace alias by model id
-    url = f"{client.base_url}embeddings"
-    headers = {"Authorization": f"Bearer {client.api_key}"}
+    response = await client.embeddings.forward(**body.model_dump())
 
-    response = await forward_request(url=url, method="POST", headers=headers, json=body.model_dump(), timeout=DEFAULT_TIMEOUT)
-    return Embeddings(**response.json())
+    return Response(content=response, media_type="application/json")
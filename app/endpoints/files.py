@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Body, Response, Security, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 
 from app.helpers._fileuploader import FileUploader
 from app.schemas.files import ChunkerArgs, FilesRequest
@@ -40,9 +41,9 @@ async def upload_file(file: UploadFile = File(...), request: FilesRequest = Body
 
     chunker_args["length_function"] = len if chunker_args["length_function"] == "len" else chunker_args["length_function"]
 
-    uploader = FileUploader(search_client=clients.search, user=user, collection_id=request.collection)
+    uploader = await run_in_threadpool(FileUploader, search_client=clients.search, user=user, collection_id=request.collection)
     output = uploader.parse(file=file)
     chunks = uploader.split(input=output, chunker_name=chunker_name, chunker_args=chunker_args)
-    uploader.upsert(chunks=chunks)
+    await uploader.upsert(chunks=chunks)
 
     return Response(status_code=201)
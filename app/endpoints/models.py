@@ -4,8 +4,9 @@ from fastapi import APIRouter, Request, Security
 
 from app.schemas.models import Model, Models
 from app.schemas.security import User
+from app.utils.exceptions import InvalidConfigException
 from app.utils.lifespan import clients
-from app.utils.security import check_api_key
+from app.utils.security import check_admin_api_key, check_api_key
 
 router = APIRouter()
 
@@ -21,12 +22,20 @@ async def models(request: Request, model: Optional[str] = None, user: User = Sec
         model = clients.models[model]
         response = [row for row in model.models.list().data if row.id == model.id][0]
     else:
-        response = {"object": "list", "data": []}
-        for model_id, client in clients.models.items():
-            for row in client.models.list().data:
-                row = dict(row)
-                row["type"] = client.type
-                response["data"].append(dict(row))
-        response = Models(**response)
+        response = clients.models.list()
 
     return response
+
+
+@router.post("/models/reload")
+async def reload_models(request: Request, user: User = Security(check_admin_api_key)) -> Models:
+    """
+    Reload the models, aliases and rate limits from the config file without restart (admin only). Requests in flight finish with
+    the previous models. Only the API worker receiving the request is reloaded, see `models.reload_interval` to reload all workers.
+    """
+    try:
+        await clients.reload()
+    except Exception as e:
+        raise InvalidConfigException(detail=f"Invalid config file: {e}")
+
+    return clients.models.list()
@@ -5,6 +5,7 @@ from app.schemas.rerank import RerankRequest, Reranks
 from app.schemas.security import User
 from app.utils.lifespan import clients
 from app.utils.security import check_api_key
+from app.utils.settings import settings
 from app.utils.variables import LANGUAGE_MODEL_TYPE, RERANK_MODEL_TYPE
 
 from app.utils.exceptions import WrongModelTypeException
@@ -20,10 +21,10 @@ async def rerank(request: Request, body: RerankRequest, user: User = Security(ch
     model = clients.models[body.model]
 
     if model.type == LANGUAGE_MODEL_TYPE:
-        reranker = LanguageModelReranker(model=model)
-        data = reranker.create(prompt=body.prompt, input=body.input)
+        reranker = LanguageModelReranker(model=model, max_concurrency=settings.rerank.max_concurrency, timeout=settings.rerank.timeout)
+        data = await reranker.create(prompt=body.prompt, input=body.input, method=body.method)
     elif model.type == RERANK_MODEL_TYPE:
-        data = model.rerank.create(prompt=body.prompt, input=body.input, model=model.id)
+        data = await model.rerank.create(prompt=body.prompt, input=body.input, model=model.id)
     else:
         raise WrongModelTypeException()
 
@@ -3,7 +3,9 @@ from ._fileuploader import FileUploader
 from ._internetmanager import InternetManager
 from ._languagemodelreranker import LanguageModelReranker
 from ._metricsmiddleware import MetricsMiddleware
+from ._responsecache import ResponseCache
 from ._searchmanager import SearchManager
+from ._semanticcache import SemanticCache
 from ._streamingresponsewithstatuscode import StreamingResponseWithStatusCode
 
 __all__ = [
@@ -12,6 +14,8 @@ __all__ = [
     "LanguageModelReranker",
     "InternetManager",
     "MetricsMiddleware",
+    "ResponseCache",
     "SearchManager",
+    "SemanticCache",
     "StreamingResponseWithStatusCode",
 ]
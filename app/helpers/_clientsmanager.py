@@ -1,27 +1,75 @@
+import asyncio
+import os
+
+from redis import Redis
 from redis.asyncio import Redis as CacheManager
 from redis.asyncio.connection import ConnectionPool
 
-from app.clients import AuthenticationClient, ModelClients
+from app.clients import AuthenticationClient, CollectionsCache, EmbeddingsCache, ModelClients
 from app.clients.internet import DuckDuckGoInternetClient, BraveInternetClient
 from app.clients.search import ElasticSearchClient, QdrantSearchClient
+from app.helpers._responsecache import ResponseCache
+from app.helpers._semanticcache import SemanticCache
 from app.schemas.settings import Settings
+from app.utils.cache import LRUCache
+from app.utils.logging import logger
+from app.utils.singleflight import single_flight
+from app.utils.upstream import upstream_clients
 from app.utils.variables import INTERNET_CLIENT_BRAVE_TYPE, INTERNET_CLIENT_DUCKDUCKGO_TYPE, SEARCH_CLIENT_ELASTIC_TYPE, SEARCH_CLIENT_QDRANT_TYPE
 
 
 class ClientsManager:
     def __init__(self, settings: Settings) -> None:
         self.settings = settings
+        self.reload_lock = asyncio.Lock()
 
-    def set(self):
-        self.models = ModelClients(settings=self.settings)
+    async def set(self):
+        upstream_clients.setup(urls=[model.url for model in self.settings.clients.models])
+        self.upstreams = upstream_clients
 
         self.cache = CacheManager(connection_pool=ConnectionPool(**self.settings.clients.cache.args))
         # @TODO: check if cache is reachable
 
+        self.embeddings_cache = None
+        if self.settings.cache.embeddings.enabled:
+            self.embeddings_cache = EmbeddingsCache(
+                redis=self.cache, max_size=self.settings.cache.embeddings.max_size, ttl=self.settings.cache.embeddings.ttl
+            )
+
+        self.rerank_cache = None
+        if self.settings.cache.rerank.enabled:
+            self.rerank_cache = LRUCache(max_size=self.settings.cache.rerank.max_size)
+
+        self.models = await self._get_models(settings=self.settings)
+        self.models_monitor = self._monitor_models(models=self.models, settings=self.settings)
+
+        self.response_cache = None
+        if self.settings.cache.responses.enabled:
+            self.response_cache = ResponseCache(redis=self.cache, ttl=self.settings.cache.responses.ttl)
+
+        collections_cache = None
+        if self.settings.cache.collections.enabled:
+            # search clients are synchronous, the collections cache uses a synchronous Redis client
+            collections_cache = CollectionsCache(
+                redis=Redis(**self.settings.clients.cache.args),
+                max_size=self.settings.cache.collections.max_size,
+                ttl=self.settings.cache.collections.ttl,
+                revalidate_interval=self.settings.cache.collections.revalidate_interval,
+            )
+
+        self.semantic_cache = None
+        if self.settings.cache.semantic.enabled:
+            self.semantic_cache = SemanticCache(
+                collections_cache=collections_cache,
+                max_distance=self.settings.cache.semantic.max_distance,
+                max_size=self.settings.cache.semantic.max_size,
+                ttl=self.settings.cache.semantic.ttl,
+            )
+
         if self.settings.clients.search.type == SEARCH_CLIENT_ELASTIC_TYPE:
-            self.search = ElasticSearchClient(models=self.models, **self.settings.clients.search.args)
+            self.search = ElasticSearchClient(models=self.models, collections_cache=collections_cache, **self.settings.clients.search.args)
         elif self.settings.clients.search.type == SEARCH_CLIENT_QDRANT_TYPE:
-            self.search = QdrantSearchClient(models=self.models, **self.settings.clients.search.args)
+            self.search = QdrantSearchClient(models=self.models, collections_cache=collections_cache, **self.settings.clients.search.args)
 
         if self.settings.clients.internet.type == INTERNET_CLIENT_DUCKDUCKGO_TYPE:
             self.internet = DuckDuckGoInternetClient(**self.settings.clients.internet.args)
@@ -30,5 +78,82 @@ class ClientsManager:
 
         self.auth = AuthenticationClient(cache=self.cache, **self.settings.clients.auth.args) if self.settings.clients.auth else None
 
-    def clear(self):
+        self.config_watcher = None
+        if self.settings.models.reload_interval is not None:
+            self.config_watcher = asyncio.create_task(self.watch(interval=self.settings.models.reload_interval))
+
+    async def reload(self) -> None:
+        """
+        Reload the models, the aliases, the rate limits, the reranker, internet and HTTP clients settings from the config file,
+        without restart. The config file is validated as at startup and the new models are built and probed aside, then swapped
+        with the reloaded settings at once (copy-on-write): the requests in flight finish with the previous models, new requests
+        use the new ones. The caches and the databases, auth and internet clients are not reloaded.
+
+        Raises:
+            Exception: If the config file is invalid, the previous models and settings are kept.
+        """
+        async with self.reload_lock:
+            settings = Settings(config_file=self.settings.config_file)
+            settings.cache = self.settings.cache
+            settings.clients = settings.clients.model_copy(
+                update={
+                    "auth": self.settings.clients.auth,
+                    "databases": self.settings.clients.databases,
+                    "internet": self.settings.clients.internet,
+                    "cache": self.settings.clients.cache,
+                    "search": self.settings.clients.search,
+                }
+            )
+            upstream_clients.setup(urls=[model.url for model in settings.clients.models])
+            models = await self._get_models(settings=settings)
+
+            # swap without awaiting, no request can see a partial reload
+            models_monitor, self.models_monitor = self.models_monitor, self._monitor_models(models=models, settings=settings)
+            self.models = models
+            self.search.models = models
+            self.settings.__pydantic_extra__ = settings.__pydantic_extra__
+            upstream_clients.reload(settings=settings.http)
+            single_flight.enabled = settings.http.coalesce_requests
+            models_monitor.cancel()
+
+        logger.info(msg=f"config reloaded from {self.settings.config_file}.")
+
+    async def watch(self, interval: float) -> None:
+        """
+        Reload the models and the settings when the config file is modified (see reload), forever. Unlike an admin request
+        to /models/reload, each API worker reloads its own models.
+
+        Args:
+            interval (float): Time between two checks of the config file, in seconds.
+        """
+        mtime = os.stat(self.settings.config_file).st_mtime
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if os.stat(self.settings.config_file).st_mtime != mtime:
+                    mtime = os.stat(self.settings.config_file).st_mtime
+                    await self.reload()
+            except Exception as e:
+                logger.error(msg=f"config reload failed: {e}")
+
+    async def _get_models(self, settings: Settings) -> ModelClients:
+        models = ModelClients(settings=settings, embeddings_cache=self.embeddings_cache, rerank_cache=self.rerank_cache)
+        await models.setup(timeout=settings.models.health_check_timeout, connect_timeout=settings.models.connect_timeout)
+
+        return models
+
+    def _monitor_models(self, models: ModelClients, settings: Settings) -> asyncio.Task:
+        return asyncio.create_task(
+            models.monitor(
+                interval=settings.models.health_check_interval,
+                timeout=settings.models.health_check_timeout,
+                connect_timeout=settings.models.connect_timeout,
+            )
+        )
+
+    async def clear(self):
+        if self.config_watcher is not None:
+            self.config_watcher.cancel()
+        self.models_monitor.cancel()
         self.search.close()
+        await self.upstreams.close()
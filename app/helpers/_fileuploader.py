@@ -64,8 +64,8 @@ class FileUploader:
 
         return chunks
 
-    def upsert(self, chunks: List[Chunk]) -> None:
+    async def upsert(self, chunks: List[Chunk]) -> None:
         if not chunks:
             raise NoChunksToUpsertException()
 
-        self.search_client.upsert(chunks=chunks, collection_id=self.collection_id, user=self.user)
+        await self.search_client.upsert(chunks=chunks, collection_id=self.collection_id, user=self.user)
@@ -1,8 +1,10 @@
+import asyncio
 from io import BytesIO
 from typing import List, Optional
 
 from fastapi import UploadFile
-import requests
+from fastapi.concurrency import run_in_threadpool
+import httpx
 
 from app.clients import ModelClients
 from app.clients import InternetClient
@@ -94,34 +96,44 @@ Ne donnes pas d'explication, ne mets pas de guillemets, réponds uniquement avec
             self.model_clients[self.default_embeddings_model_id].type == EMBEDDINGS_MODEL_TYPE
         ), "Default internet embeddings model is not an embeddings model."
 
-    def get_chunks(self, prompt: str, collection_id: str, n: int = 3) -> List[Chunk]:
-        query = self._get_web_query(prompt=prompt)
-        urls = self.internet_client.get_result_urls(query=query, n=n)
-        chunks = self._build_chunks(urls=urls, query=query, collection_id=collection_id)
+    async def get_chunks(self, prompt: str, collection_id: str, n: int = 3) -> List[Chunk]:
+        query = await self._get_web_query(prompt=prompt)
+        urls = await run_in_threadpool(self.internet_client.get_result_urls, query=query, n=n)
+        chunks = await self._build_chunks(urls=urls, query=query, collection_id=collection_id)
 
         return chunks
 
-    def _get_web_query(self, prompt: str) -> str:
+    async def _get_web_query(self, prompt: str) -> str:
         prompt = self.GET_WEB_QUERY_PROMPT.format(prompt=prompt)
-        response = self.model_clients[self.default_language_model_id].chat.completions.create(
+        response = await self.model_clients[self.default_language_model_id].chat.completions.create(
             messages=[{"role": "user", "content": prompt}], model=self.default_language_model_id, temperature=0.2, stream=False
         )
         query = response.choices[0].message.content
 
         return query
 
-    def _build_chunks(self, urls: List[str], query: str, collection_id: str) -> List[Chunk]:
+    async def _get_page(self, async_client: httpx.AsyncClient, url: str) -> Optional[httpx.Response]:
+        try:
+            assert not self.LIMITED_DOMAINS or any([domain in url for domain in self.LIMITED_DOMAINS])
+            response = await async_client.get(url=url)
+            assert response.status_code == 200
+        except Exception:
+            return None
+
+        return response
+
+    async def _build_chunks(self, urls: List[str], query: str, collection_id: str) -> List[Chunk]:
         chunker = LangchainRecursiveCharacterTextSplitter(
             chunk_size=self.CHUNK_SIZE, chunk_overlap=self.CHUNK_OVERLAP, chunk_min_size=self.CHUNK_MIN_SIZE
         )
         chunks = []
         parser = HTMLParser(collection_id=collection_id)
-        for url in urls:
-            try:
-                assert not self.LIMITED_DOMAINS or any([domain in url for domain in self.LIMITED_DOMAINS])
-                response = requests.get(url=url, headers={"User-Agent": self.USER_AGENT})
-                assert response.status_code == 200
-            except Exception:
+
+        async with httpx.AsyncClient(headers={"User-Agent": self.USER_AGENT}, timeout=self.PAGE_LOAD_TIMEOUT, follow_redirects=True) as async_client:
+            responses = await asyncio.gather(*[self._get_page(async_client=async_client, url=url) for url in urls])
+
+        for url, response in zip(urls, responses):
+            if response is None:
                 continue
 
             file = BytesIO(response.text.encode("utf-8"))
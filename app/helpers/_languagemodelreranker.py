@@ -1,7 +1,14 @@
-from typing import List
+import asyncio
+import math
+from typing import Dict, List, Optional, Tuple
 import re
+
+from openai.types.chat import ChatCompletionTokenLogprob
+
 from app.clients._modelclients import ModelClient
 from app.schemas.rerank import Rerank
+from app.utils.exceptions import RequestTimeoutException
+from app.utils.variables import LISTWISE_RERANK_TYPE, POINTWISE_RERANK_TYPE
 
 
 class LanguageModelReranker:
@@ -9,20 +16,160 @@ class LanguageModelReranker:
 En se basant uniquement sur ce texte, réponds 1 si ce texte peut donner des éléments de réponse à la question suivante ou 0 si aucun élément de réponse n'est présent dans le texte. Voila la question: {prompt}
 Le texte n'a pas besoin de répondre parfaitement à la question, juste d'apporter des éléments de réponses et/ou de parler du même thème. Réponds uniquement 0 ou 1."""
 
-    def __init__(self, model: ModelClient) -> None:
+    PROMPT_LISTWISE = """Voilà une liste de textes numérotés :\n{texts}\n
+En se basant uniquement sur ces textes, donne à chaque texte une note de 0 à 9 selon les éléments de réponse qu'il apporte à la question suivante : 0 si aucun élément de réponse n'est présent dans le texte, 9 si le texte répond parfaitement à la question. Voila la question: {prompt}
+Réponds uniquement avec une ligne par texte au format "[numéro] note", par exemple "[1] 7"."""
+
+    LISTWISE_TOKENS_PER_INPUT = 8  # max tokens of the answer line of a text in the listwise answer
+
+    # concurrent scoring requests per replica (base URL of the model API), shared by all rerank requests, with the max concurrency
+    # they were created with
+    semaphores: Dict[str, Tuple[int, asyncio.Semaphore]] = dict()
+
+    def __init__(self, model: ModelClient, max_concurrency: int = 8, timeout: float = 30.0) -> None:
+        """
+        Args:
+            model (ModelClient): The language model scoring the inputs, the scoring requests are spread over its replicas.
+            max_concurrency (int): Max concurrent scoring requests sent to each replica of the model.
+            timeout (float): Max duration of a rerank request, in seconds.
+        """
         self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
 
-    def create(self, prompt: str, input: list) -> List[Rerank]:
-        data = list()
-        for index, text in enumerate(input):
-            content = self.PROMPT_LLM_BASED.format(prompt=prompt, text=text)
+    async def create(self, prompt: str, input: list, method: str = POINTWISE_RERANK_TYPE) -> List[Rerank]:
+        """
+        Score the relevance of each input to the prompt.
+
+        Args:
+            prompt (str): The prompt.
+            input (list): The texts to score.
+            method (str): pointwise sends one request per text and returns scores of 0 or 1, listwise sends all the texts in one request
+                (split into windows fitting the context length of the model) and returns graded scores between 0 and 1.
 
-            response = self.model.chat.completions.create(
+        Returns:
+            List[Rerank]: The score of each text, in input order.
+        """
+        if method == LISTWISE_RERANK_TYPE:
+            windows = self._get_windows(prompt=prompt, input=input)
+            replicas = self.model.select_replicas(n=len(windows))
+            tasks = [
+                self._score_window(replica=replica, prompt=prompt, texts=[input[index] for index in window], indexes=window)
+                for replica, window in zip(replicas, windows)
+            ]
+        else:
+            replicas = self.model.select_replicas(n=len(input))
+            tasks = [
+                self._score(replica=replica, prompt=prompt, text=text, index=index) for replica, (index, text) in zip(replicas, enumerate(input))
+            ]
+
+        try:
+            results = await asyncio.wait_for(asyncio.gather(*tasks), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise RequestTimeoutException(detail=f"Rerank timed out after {self.timeout} seconds.")
+
+        if method == LISTWISE_RERANK_TYPE:
+            results = sorted([rerank for window in results for rerank in window], key=lambda rerank: rerank.index)
+
+        return results
+
+    async def _score(self, replica: ModelClient, prompt: str, text: str, index: int) -> Rerank:
+        content = self.PROMPT_LLM_BASED.format(prompt=prompt, text=text)
+
+        async with self._get_semaphore(replica=replica):
+            response = await replica.chat.completions.create(
                 messages=[{"role": "user", "content": content}], model=self.model.id, temperature=0.1, max_tokens=3, stream=False, n=1
             )
-            result = response.choices[0].message.content
-            match = re.search(r"[0-1]", result)
-            result = int(match.group(0)) if match else 0
-            data.append(Rerank(score=result, index=index))
+        result = response.choices[0].message.content
+        match = re.search(r"[0-1]", result)
+        result = int(match.group(0)) if match else 0
+
+        return Rerank(score=result, index=index)
+
+    async def _score_window(self, replica: ModelClient, prompt: str, texts: List[str], indexes: List[int]) -> List[Rerank]:
+        content = self.PROMPT_LISTWISE.format(prompt=prompt, texts=self._format_texts(texts=texts))
+
+        async with self._get_semaphore(replica=replica):
+            response = await replica.chat.completions.create(
+                messages=[{"role": "user", "content": content}],
+                model=self.model.id,
+                temperature=0.0,
+                max_tokens=self.LISTWISE_TOKENS_PER_INPUT * len(texts),
+                stream=False,
+                n=1,
+                logprobs=True,
+                top_logprobs=10,
+            )
+        choice = response.choices[0]
+        tokens = choice.logprobs.content if choice.logprobs and choice.logprobs.content else None
+        answer = "".join(token.token for token in tokens) if tokens else choice.message.content or ""
+
+        # token covering each character of the answer, to find the logprobs of the grades
+        offsets = list()
+        for token in tokens or []:
+            offsets.extend([token] * len(token.token))
+
+        scores = dict()
+        for match in re.finditer(r"\[(\d+)\]\s*(\d)", answer):
+            number, grade = int(match.group(1)), int(match.group(2))
+            if not 1 <= number <= len(texts) or number in scores:
+                continue
+            token = offsets[match.start(2)] if offsets else None
+            scores[number] = self._get_expected_grade(token=token, grade=grade) / 9
+
+        # texts missing in the answer are considered irrelevant
+        return [Rerank(score=scores.get(number, 0.0), index=index) for number, index in enumerate(indexes, start=1)]
+
+    def _get_semaphore(self, replica: ModelClient) -> asyncio.Semaphore:
+        key = str(replica.base_url)
+        if self.semaphores.get(key, (None, None))[0] != self.max_concurrency:
+            # new replica or max concurrency changed by a config reload, the requests in flight finish with the previous semaphore
+            self.semaphores[key] = (self.max_concurrency, asyncio.Semaphore(value=self.max_concurrency))
+
+        return self.semaphores[key][1]
+
+    def _get_windows(self, prompt: str, input: List[str]) -> List[List[int]]:
+        """
+        Split the input indexes into windows whose listwise prompt and answer fit the context length of the model.
+        """
+        if not self.model.max_context_length:
+            return [list(range(len(input)))]
+
+        budget = self.model.max_context_length - self.model.token_counter.count_messages(
+            messages=[{"role": "user", "content": self.PROMPT_LISTWISE.format(prompt=prompt, texts="")}]
+        )
+        windows, window, size = list(), list(), 0
+        for index, text in enumerate(input):
+            tokens = self.model.token_counter.count(text=self._format_texts(texts=[text]) + "\n") + self.LISTWISE_TOKENS_PER_INPUT
+            if window and size + tokens > budget:
+                windows.append(window)
+                window, size = list(), 0
+            window.append(index)
+            size += tokens
+        if window:
+            windows.append(window)
+
+        return windows
+
+    @staticmethod
+    def _format_texts(texts: List[str]) -> str:
+        return "\n".join(f"[{number}] {text}" for number, text in enumerate(texts, start=1))
+
+    @staticmethod
+    def _get_expected_grade(token: Optional[ChatCompletionTokenLogprob], grade: int) -> float:
+        """
+        Get the expected grade from the probabilities of the digits at the position of the grade, or the generated grade if
+        the logprobs are not available.
+        """
+        if token is None or not token.token.strip().isdigit() or not token.top_logprobs:
+            return float(grade)
+
+        probabilities = dict()
+        for top in token.top_logprobs:
+            digit = top.token.strip()
+            if len(digit) == 1 and digit.isdigit():
+                probabilities[int(digit)] = probabilities.get(int(digit), 0.0) + math.exp(top.logprob)
+        if not probabilities:
+            return float(grade)
 
-        return data
+        return sum(digit * probability for digit, probability in probabilities.items()) / sum(probabilities.values())
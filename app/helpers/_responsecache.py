@@ -0,0 +1,107 @@
+from contextlib import aclosing
+import hashlib
+import json
+from typing import AsyncIterator, List, Optional, Tuple
+
+from prometheus_client import Counter
+from redis.asyncio import Redis
+
+from app.utils.logging import logger
+
+
+class ResponseCache:
+    """
+    Cache of the responses of deterministic chat and completions requests (temperature of 0 or fixed seed), keyed by a hash of
+    the canonicalized request body, which includes the model ID. Responses are stored in Redis with a TTL, streamed responses are
+    stored as the list of their chunks to be replayed.
+    """
+
+    PREFIX = "responses"
+    HEADER = "X-Cache"
+
+    lookups = Counter(
+        name="response_cache_lookups_total",
+        documentation="Number of response cache lookups by endpoint, model and result (hit or miss)",
+        labelnames=["endpoint", "model", "result"],
+    )
+
+    def __init__(self, redis: Redis, ttl: int) -> None:
+        self.redis = redis
+        self.ttl = ttl
+
+    @staticmethod
+    def is_cacheable(body: dict, headers: dict) -> bool:
+        """
+        Whether a request is deterministic and the client accepts a cached response.
+
+        Args:
+            body (dict): The request body.
+            headers (dict): The request headers.
+        """
+        if "no-cache" in headers.get("Cache-Control", ""):
+            return False
+
+        return ResponseCache.is_deterministic(body=body)
+
+    @staticmethod
+    def is_deterministic(body: dict) -> bool:
+        """
+        Whether a chat or completions request always gets the same response, with a temperature of 0 or a fixed seed.
+
+        Args:
+            body (dict): The request body.
+        """
+        return body.get("temperature") == 0 or body.get("seed") is not None
+
+    def get_key(self, endpoint: str, body: dict) -> str:
+        body = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        digest = hashlib.sha256(body.encode(encoding="utf-8")).hexdigest()
+
+        return f"{self.PREFIX}:{endpoint}:{digest}"
+
+    async def get(self, key: str, endpoint: str, model: str) -> Optional[bytes]:
+        """
+        Get a cached response.
+
+        Returns:
+            Optional[bytes]: The response body, a JSON list of chunks for streamed responses, None if not cached.
+        """
+        try:
+            value = await self.redis.get(key)
+        except Exception as e:
+            logger.warning(msg=f"response cache unreachable: {e}")
+            value = None
+
+        self.lookups.labels(endpoint=endpoint, model=model, result="hit" if value is not None else "miss").inc()
+
+        return value
+
+    async def set(self, key: str, value: bytes) -> None:
+        try:
+            await self.redis.setex(key, self.ttl, value)
+        except Exception as e:
+            logger.warning(msg=f"response cache unreachable: {e}")
+
+    async def replay(self, value: bytes) -> AsyncIterator[Tuple[bytes, int]]:
+        """
+        Replay the chunks of a cached streamed response.
+        """
+        for chunk in json.loads(value):
+            yield chunk.encode(encoding="utf-8"), 200
+
+    async def record(self, key: str, stream: AsyncIterator[Tuple[bytes, int]]) -> AsyncIterator[Tuple[bytes, int]]:
+        """
+        Forward the chunks of a streamed response and cache them once the stream is over, if no error occurred. The
+        stream is closed when the recording is, so that the upstream stream is closed if the client disconnects.
+        """
+        chunks: List[bytes] = list()
+        succeeded = True
+        async with aclosing(stream):
+            async for chunk, status_code in stream:
+                succeeded = succeeded and status_code // 100 == 2
+                chunks.append(chunk)
+                yield chunk, status_code
+
+        if succeeded:
+            events = [f"{event}\n\n" for event in b"".join(chunks).decode(encoding="utf-8").split("\n\n") if event]
+            await self.set(key=key, value=json.dumps(events).encode(encoding="utf-8"))
@@ -1,6 +1,8 @@
 from typing import List
 import uuid
 
+from fastapi.concurrency import run_in_threadpool
+
 from app.clients import ModelClients, SearchClient
 from app.helpers import InternetManager
 from app.schemas.search import Search
@@ -14,28 +16,31 @@ class SearchManager:
         self.search_client = search_client
         self.internet_manager = internet_manager
 
-    def query(self, collections: List[str], prompt: str, method: str, k: int, rff_k: int, user: User, score_threshold: float = 0.0) -> List[Search]:
+    async def query(
+        self, collections: List[str], prompt: str, method: str, k: int, rff_k: int, user: User, score_threshold: float = 0.0
+    ) -> List[Search]:
         # internet search
         internet_chunks = []
         if INTERNET_COLLECTION_DISPLAY_ID in collections:
             internet_collection_id = str(uuid.uuid4())
-            internet_chunks = self.internet_manager.get_chunks(prompt=prompt, collection_id=internet_collection_id)
+            internet_chunks = await self.internet_manager.get_chunks(prompt=prompt, collection_id=internet_collection_id)
 
             if internet_chunks:
                 collections.remove(INTERNET_COLLECTION_DISPLAY_ID)
                 internet_embeddings_model_id = (
                     self.internet_manager.default_embeddings_model_id
                     if not collections
-                    else self.search_client.get_collections(collection_ids=collections, user=user)[0].model
+                    else (await run_in_threadpool(self.search_client.get_collections, collection_ids=collections, user=user))[0].model
                 )
 
-                self.search_client.create_collection(
+                await run_in_threadpool(
+                    self.search_client.create_collection,
                     collection_id=internet_collection_id,
                     collection_name=internet_collection_id,
                     collection_model=internet_embeddings_model_id,
                     user=user,
                 )
-                self.search_client.upsert(chunks=internet_chunks, collection_id=internet_collection_id, user=user)
+                await self.search_client.upsert(chunks=internet_chunks, collection_id=internet_collection_id, user=user)
 
                 collections.append(internet_collection_id)
 
@@ -43,12 +48,12 @@ class SearchManager:
             elif collections == [INTERNET_COLLECTION_DISPLAY_ID]:
                 return []
 
-        searches = self.search_client.query(
+        searches = await self.search_client.query(
             prompt=prompt, collection_ids=collections, method=method, k=k, rff_k=rff_k, score_threshold=score_threshold, user=user
         )
 
         if internet_chunks:
-            self.search_client.delete_collection(collection_id=internet_collection_id, user=user)
+            await run_in_threadpool(self.search_client.delete_collection, collection_id=internet_collection_id, user=user)
 
         if score_threshold:
             searches = [search for search in searches if search.score >= score_threshold]
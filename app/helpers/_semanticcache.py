@@ -0,0 +1,187 @@
+from collections import OrderedDict
+from contextlib import aclosing
+import hashlib
+import json
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from fastapi.concurrency import run_in_threadpool
+import numpy as np
+from prometheus_client import Counter
+
+from app.clients import CollectionsCache, ModelClients, SearchClient
+from app.schemas.chat import ChatCompletionRequest
+from app.schemas.security import User
+from app.utils.variables import INTERNET_COLLECTION_DISPLAY_ID
+
+
+class VectorIndex:
+    """
+    Normalized vectors of a cache scope, searched by cosine similarity with a single matrix product.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.ids: List[int] = list()
+        self.vectors = np.empty(shape=(0, size), dtype=np.float32)
+
+    def add(self, id: int, vector: np.ndarray) -> None:
+        self.ids.append(id)
+        self.vectors = np.vstack([self.vectors, vector[np.newaxis, :]])
+
+    def remove(self, id: int) -> None:
+        i = self.ids.index(id)
+        self.ids.pop(i)
+        self.vectors = np.delete(self.vectors, i, axis=0)
+
+    def search(self, vector: np.ndarray) -> Tuple[Optional[int], float]:
+        """
+        Get the nearest vector.
+
+        Returns:
+            Tuple[Optional[int], float]: The ID of the nearest vector and its cosine similarity, None if the index is empty.
+        """
+        if not self.ids:
+            return None, 0.0
+        similarities = self.vectors @ vector
+        i = int(np.argmax(similarities))
+
+        return self.ids[i], float(similarities[i])
+
+
+class SemanticCache:
+    """
+    Semantic cache of the responses of retrieval augmented generation chat requests. A response is returned for a new request if
+    the embedding of its prompt is within a cosine distance of the prompt of a cached request with the same scope: same model,
+    collections, parameters and previous messages.
+
+    Responses are stored in memory with a LRU eviction, in a vector index per scope. The version of each collection in the
+    collections cache, incremented when its documents change (see CollectionsCache.bump), is part of the scope: the cached
+    responses of a collection are invalidated on every API instance when documents are upserted or deleted.
+    """
+
+    HEADER = "X-Semantic-Cache"
+
+    lookups = Counter(
+        name="semantic_cache_lookups_total",
+        documentation="Number of semantic cache lookups by model and result (hit or miss)",
+        labelnames=["model", "result"],
+    )
+
+    def __init__(self, collections_cache: CollectionsCache, max_distance: float, max_size: int, ttl: int) -> None:
+        self.collections_cache = collections_cache
+        self.max_distance = max_distance
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.counter = 0
+        self.entries: OrderedDict[int, Tuple[str, float, Union[bytes, List[str]]]] = OrderedDict()  # scope, expiry, value
+        self.indexes: Dict[str, VectorIndex] = dict()
+
+    @staticmethod
+    def is_cacheable(body: ChatCompletionRequest, headers: dict) -> bool:
+        """
+        Whether a chat request is a retrieval augmented generation request on collections and the client accepts a cached response.
+        Internet search results change over time and are not cached.
+
+        Args:
+            body (ChatCompletionRequest): The request body.
+            headers (dict): The request headers.
+        """
+        if "no-cache" in headers.get("Cache-Control", ""):
+            return False
+
+        return (
+            body.search and INTERNET_COLLECTION_DISPLAY_ID not in body.search_args.collections and isinstance(body.messages[-1].get("content"), str)
+        )
+
+    async def get_query(
+        self, body: ChatCompletionRequest, user: User, models: ModelClients, search: SearchClient
+    ) -> Optional[Tuple[str, np.ndarray]]:
+        """
+        Get the scope and the prompt embedding of a request, with the embeddings model of the collections.
+
+        Returns:
+            Optional[Tuple[str, np.ndarray]]: The scope and the normalized embedding of the request, None if the request cannot be
+            cached.
+        """
+        collections = sorted(body.search_args.collections)
+        models_ids = set(collection.model for collection in await run_in_threadpool(search.get_collections, collection_ids=collections, user=user))
+        if len(models_ids) != 1:
+            return None
+
+        versions = await run_in_threadpool(self.collections_cache.get_versions, collection_ids=collections)
+        if versions is None:
+            return None
+
+        model = models_ids.pop()
+        vector = (await models[model].embeddings.vectors(texts=[body.messages[-1]["content"]]))[0]
+
+        params = body.model_dump(exclude={"messages", "search"})
+        params["search_args"]["collections"] = collections
+        params["messages"] = body.messages[:-1]
+        params["versions"] = [versions[collection] for collection in collections]
+        scope = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode(encoding="utf-8")).hexdigest()
+
+        return scope, vector
+
+    def get(self, query: Tuple[str, np.ndarray], model: str) -> Optional[Union[bytes, List[str]]]:
+        """
+        Get the cached response of the nearest prompt in the scope of a request.
+
+        Returns:
+            Optional[Union[bytes, List[str]]]: The response body, the list of events for streamed responses, None if not cached.
+        """
+        scope, vector = query
+        value = None
+        if scope in self.indexes:
+            id, similarity = self.indexes[scope].search(vector=vector)
+            if id is not None and 1.0 - similarity <= self.max_distance:
+                if self.entries[id][1] < time.time():
+                    self._remove(id=id)
+                else:
+                    self.entries.move_to_end(id)
+                    value = self.entries[id][2]
+
+        self.lookups.labels(model=model, result="hit" if value is not None else "miss").inc()
+
+        return value
+
+    def set(self, query: Tuple[str, np.ndarray], value: Union[bytes, List[str]]) -> None:
+        scope, vector = query
+        while len(self.entries) >= self.max_size:
+            self._remove(id=next(iter(self.entries)))
+
+        self.counter += 1
+        self.entries[self.counter] = (scope, time.time() + self.ttl, value)
+        if scope not in self.indexes:
+            self.indexes[scope] = VectorIndex(size=vector.shape[0])
+        self.indexes[scope].add(id=self.counter, vector=vector)
+
+    async def replay(self, value: List[str]) -> AsyncIterator[Tuple[bytes, int]]:
+        """
+        Replay the events of a cached streamed response.
+        """
+        for event in value:
+            yield event.encode(encoding="utf-8"), 200
+
+    async def record(self, query: Tuple[str, np.ndarray], stream: AsyncIterator[Tuple[bytes, int]]) -> AsyncIterator[Tuple[bytes, int]]:
+        """
+        Forward the chunks of a streamed response and cache its events once the stream is over, if no error occurred. The
+        stream is closed when the recording is, so that the upstream stream is closed if the client disconnects.
+        """
+        chunks: List[bytes] = list()
+        succeeded = True
+        async with aclosing(stream):
+            async for chunk, status_code in stream:
+                succeeded = succeeded and status_code // 100 == 2
+                chunks.append(chunk)
+                yield chunk, status_code
+
+        if succeeded:
+            self.set(query=query, value=[f"{event}\n\n" for event in b"".join(chunks).decode(encoding="utf-8").split("\n\n") if event])
+
+    def _remove(self, id: int) -> None:
+        scope = self.entries.pop(id)[0]
+        self.indexes[scope].remove(id=id)
+        if not self.indexes[scope].ids:
+            del self.indexes[scope]
@@ -1,7 +1,9 @@
 import json
 from typing import AsyncIterator
 
-from fastapi.responses import StreamingResponse
+import anyio
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from starlette.types import Send
 
 
@@ -11,6 +13,11 @@ class StreamingResponseWithStatusCode(StreamingResponse):
     based on the return value of the content iterator (parameter `content`).
     Expects the content to yield either just str content as per the original `StreamingResponse`
     or else tuples of (`content`: `str`, `status_code`: `int`).
+
+    HTTP exceptions raised by the content iterator before its first chunk are sent as error responses, with their status code.
+
+    The content iterator is closed as soon as the response ends, including when the client disconnects and the response is
+    cancelled, so that the upstream stream is closed and the model API aborts the generation.
     """
 
     body_iterator: AsyncIterator[str | bytes]
@@ -51,12 +58,23 @@ class StreamingResponseWithStatusCode(StreamingResponse):
                 more_body = True
                 await send({"type": "http.response.body", "body": content, "more_body": more_body})
 
-        except Exception:
+        except Exception as e:
             more_body = False
-            error_resp = {"error": {"message": "Internal Server Error"}}
-            error_event = f"event: error\ndata: {json.dumps(error_resp)}\n\n".encode(self.charset)
-            if not self.response_started:
-                await send({"type": "http.response.start", "status": 500, "headers": self.raw_headers})
-            await send({"type": "http.response.body", "body": error_event, "more_body": more_body})
+            if isinstance(e, HTTPException) and not self.response_started:
+                # an HTTP error raised before the first chunk (e.g. while waiting for a slot of the model) is sent as is
+                response = JSONResponse(content={"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+                await send({"type": "http.response.start", "status": response.status_code, "headers": response.raw_headers})
+                await send({"type": "http.response.body", "body": response.body, "more_body": more_body})
+            else:
+                error_resp = {"error": {"message": "Internal Server Error"}}
+                error_event = f"event: error\ndata: {json.dumps(error_resp)}\n\n".encode(self.charset)
+                if not self.response_started:
+                    await send({"type": "http.response.start", "status": 500, "headers": self.raw_headers})
+                await send({"type": "http.response.body", "body": error_event, "more_body": more_body})
+        finally:
+            # shielded: the response is cancelled on client disconnection, closing the iterator must not be cancelled too
+            if hasattr(self.body_iterator, "aclose"):
+                with anyio.CancelScope(shield=True):
+                    await self.body_iterator.aclose()
         if more_body:
             await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -1,12 +1,18 @@
 from typing import List, Literal
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from app.utils.variables import LISTWISE_RERANK_TYPE, POINTWISE_RERANK_TYPE
 
 
 class RerankRequest(BaseModel):
     prompt: str
     input: List[str]
     model: str
+    method: Literal[LISTWISE_RERANK_TYPE, POINTWISE_RERANK_TYPE] = Field(
+        default=POINTWISE_RERANK_TYPE,
+        description="Rerank method of language models: pointwise (one request per input, binary scores) or listwise (one request, graded scores).",
+    )
 
 
 class Rerank(BaseModel):
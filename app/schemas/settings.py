@@ -11,6 +11,8 @@ from app.utils.variables import (
     INTERNET_CLIENT_BRAVE_TYPE,
     INTERNET_CLIENT_DUCKDUCKGO_TYPE,
     LANGUAGE_MODEL_TYPE,
+    LEAST_OUTSTANDING_REQUESTS_STRATEGY,
+    POWER_OF_TWO_CHOICES_STRATEGY,
     RERANK_MODEL_TYPE,
     SEARCH_CLIENT_ELASTIC_TYPE,
     SEARCH_CLIENT_QDRANT_TYPE,
@@ -27,13 +29,102 @@ class RateLimit(ConfigBaseModel):
     by_ip: str = "100/minute"
 
 
+class HTTPClient(ConfigBaseModel):
+    max_connections: int = Field(default=100, ge=1)
+    max_keepalive_connections: int = Field(default=20, ge=0)
+    keepalive_expiry: float = Field(default=30.0, ge=0.0)
+    http2: bool = False
+    ejection_threshold: int = Field(default=3, ge=1)
+    ejection_duration: float = Field(default=30.0, ge=0.0)
+    max_retries: int = Field(default=2, ge=0)
+    retry_backoff: float = Field(default=0.1, ge=0.0)
+    retry_max_backoff: float = Field(default=2.0, ge=0.0)
+    retry_budget: float = Field(default=0.2, ge=0.0)
+    coalesce_requests: bool = True
+
+
+class EmbeddingsCache(ConfigBaseModel):
+    enabled: bool = True
+    max_size: int = Field(default=10000, ge=0)
+    ttl: int = Field(default=86400, ge=1)
+
+
+class RerankCache(ConfigBaseModel):
+    enabled: bool = True
+    max_size: int = Field(default=100000, ge=0)
+
+
+class CollectionsCache(ConfigBaseModel):
+    enabled: bool = True
+    max_size: int = Field(default=1000, ge=0)
+    ttl: int = Field(default=3600, ge=1)
+    revalidate_interval: float = Field(default=5.0, ge=0.0)
+
+
+class ResponsesCache(ConfigBaseModel):
+    enabled: bool = False
+    ttl: int = Field(default=3600, ge=1)
+
+
+class SemanticCache(ConfigBaseModel):
+    enabled: bool = False
+    max_distance: float = Field(default=0.05, ge=0.0, le=2.0)
+    max_size: int = Field(default=1000, ge=1)
+    ttl: int = Field(default=3600, ge=1)
+
+
+class Cache(ConfigBaseModel):
+    embeddings: EmbeddingsCache = Field(default_factory=EmbeddingsCache)
+    rerank: RerankCache = Field(default_factory=RerankCache)
+    collections: CollectionsCache = Field(default_factory=CollectionsCache)
+    responses: ResponsesCache = Field(default_factory=ResponsesCache)
+    semantic: SemanticCache = Field(default_factory=SemanticCache)
+
+    @model_validator(mode="after")
+    def validate_semantic(cls, values):
+        assert not values.semantic.enabled or values.collections.enabled, "Semantic cache requires the collections cache."
+        return values
+
+
+class Reranker(ConfigBaseModel):
+    max_concurrency: int = Field(default=8, ge=1)
+    timeout: float = Field(default=30.0, gt=0.0)
+
+
 class Internet(ConfigBaseModel):
     default_language_model: str
     default_embeddings_model: str
 
 
+class EmbeddingsBatching(ConfigBaseModel):
+    enabled: bool = True
+    max_wait: float = Field(default=0.005, ge=0.0)
+    max_batch_size: int = Field(default=32, ge=1)
+
+
+class Admission(ConfigBaseModel):
+    enabled: bool = True
+    max_concurrency: int = Field(default=64, ge=1)
+    max_queue_size: int = Field(default=256, ge=0)
+    queue_timeout: float = Field(default=30.0, gt=0.0)
+    priority_users: List[str] = []
+    weights: Dict[str, float] = {}
+
+    @field_validator("weights", mode="after")
+    def validate_weights(cls, weights):
+        assert all(weight > 0 for weight in weights.values()), "Weights must be positive."
+        return weights
+
+
 class Models(ConfigBaseModel):
     aliases: Dict[str, List[str]] = {}
+    load_balancing: Literal[LEAST_OUTSTANDING_REQUESTS_STRATEGY, POWER_OF_TWO_CHOICES_STRATEGY] = LEAST_OUTSTANDING_REQUESTS_STRATEGY
+    health_check_interval: float = Field(default=30.0, gt=0.0)
+    health_check_timeout: float = Field(default=5.0, gt=0.0)
+    connect_timeout: float = Field(default=2.0, gt=0.0)
+    reload_interval: Optional[float] = Field(default=None, gt=0.0)
+    embeddings_batching: EmbeddingsBatching = Field(default_factory=EmbeddingsBatching)
+    admission: Admission = Field(default_factory=Admission)
 
     @field_validator("aliases", mode="before")
     def validate_aliases(cls, aliases):
@@ -106,6 +197,9 @@ class Clients(ConfigBaseModel):
 
 class Config(ConfigBaseModel):
     rate_limit: RateLimit = Field(default_factory=RateLimit)
+    http: HTTPClient = Field(default_factory=HTTPClient)
+    cache: Cache = Field(default_factory=Cache)
+    rerank: Reranker = Field(default_factory=Reranker)
     internet: Internet
     models: Models = Field(default_factory=Models)
     clients: Clients
@@ -136,9 +230,12 @@ class Settings(BaseSettings):
 
     @model_validator(mode="after")
     def setup_config(cls, values):
-        config = Config(**yaml.safe_load(stream=open(file=values.config_file, mode="r")))
+        config = values.load_config()
 
         values.rate_limit = config.rate_limit
+        values.http = config.http
+        values.cache = config.cache
+        values.rerank = config.rerank
         values.internet = config.internet
         values.models = config.models
         values.clients = config.clients
@@ -146,3 +243,10 @@ class Settings(BaseSettings):
         values.clients.search = config.clients.databases.search
 
         return values
+
+    def load_config(self) -> Config:
+        """
+        Read and validate the config file.
+        """
+        with open(file=self.config_file, mode="r") as file:
+            return Config(**yaml.safe_load(stream=file))
@@ -0,0 +1,134 @@
+"""
+Microbenchmark of the ingestion of embeddings vectors, from the JSON response body of the model API to the body of the request
+writing the vectors in the vector store (Qdrant points or Elasticsearch bulk documents), with Python lists of floats (previous
+pipeline) and with float32 NumPy matrices. The matrices pipeline must be faster than the lists pipeline for each vector store.
+
+Usage: python -m app.tests.benchmarks.vectors [--batch-size 48] [--dims 1024] [--iterations 50]
+"""
+
+import argparse
+from json import dumps, loads
+import statistics
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from elastic_transport import JsonSerializer
+import numpy as np
+from qdrant_client.http.api.points_api import jsonable_encoder
+from qdrant_client.http.models import PointsList, PointStruct
+
+from app.schemas.embeddings import Embeddings
+from app.utils.vectors import decode_vectors, encode_vector, format_vector, normalize_vectors
+
+CONTENT = "Albert est un modèle de langage. " * 30  # chunk of about 1000 characters
+METADATA = {"collection_id": "collection", "document_id": "document", "document_name": "document.pdf", "document_part": 1}
+
+
+def get_response(vectors: np.ndarray, encoding_format: str) -> bytes:
+    data = [
+        {"object": "embedding", "index": i, "embedding": encode_vector(vector) if encoding_format == "base64" else vector.tolist()}
+        for i, vector in enumerate(vectors)
+    ]
+
+    return dumps({"object": "list", "data": data, "model": "model", "usage": {"prompt_tokens": 0, "total_tokens": 0}}).encode()
+
+
+def get_lists(content: bytes) -> List[List[float]]:
+    response = Embeddings(**loads(content))
+
+    return [vector.embedding for vector in response.data]
+
+
+def get_arrays(content: bytes) -> np.ndarray:
+    vectors, _ = decode_vectors(content=content)
+
+    return normalize_vectors(vectors=np.stack(vectors))
+
+
+def qdrant_lists_pipeline(content: bytes) -> str:
+    points = [PointStruct(id=i, vector=vector, payload={"content": CONTENT, "metadata": METADATA}) for i, vector in enumerate(get_lists(content))]
+
+    return jsonable_encoder(PointsList(points=points))
+
+
+def qdrant_arrays_pipeline(content: bytes) -> str:
+    # same as QdrantSearchClient.upsert
+    points = [
+        PointStruct(id=i, vector=vector, payload={"content": CONTENT, "metadata": METADATA}) for i, vector in enumerate(get_arrays(content).tolist())
+    ]
+
+    return jsonable_encoder(PointsList(points=points))
+
+
+def elasticsearch_lists_pipeline(content: bytes) -> List[bytes]:
+    serializer = JsonSerializer()
+
+    return [serializer.dumps({"body": CONTENT, "embedding": vector, "metadata": METADATA}) for vector in get_lists(content)]
+
+
+def elasticsearch_arrays_pipeline(content: bytes) -> List[bytes]:
+    # same as ElasticSearchClient._build_document
+    serializer = JsonSerializer()
+    source = serializer.dumps({"body": CONTENT, "metadata": METADATA})
+
+    return [b'{"embedding":' + format_vector(vector).encode(encoding="utf-8") + b"," + source[1:] for vector in get_arrays(content)]
+
+
+def measure(pipelines: Dict[str, Tuple[Callable[[bytes], object], bytes]], iterations: int) -> Dict[str, Tuple[float, int]]:
+    """
+    The pipelines are run in turn at each iteration, so that they are compared under the same load of the machine.
+
+    Returns:
+        Dict[str, Tuple[float, int]]: The median CPU time in milliseconds and the peak of allocated memory in bytes of a run of each pipeline.
+    """
+    times = {name: list() for name in pipelines}
+    for pipeline, content in pipelines.values():
+        pipeline(content)  # warm up
+
+    for _ in range(iterations):
+        for name, (pipeline, content) in pipelines.items():
+            start = time.process_time()
+            pipeline(content)
+            times[name].append((time.process_time() - start) * 1000)
+
+    results = dict()
+    for name, (pipeline, content) in pipelines.items():
+        tracemalloc.start()
+        pipeline(content)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = (statistics.median(times[name]), peak)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=48)
+    parser.add_argument("--dims", type=int, default=1024)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    vectors = np.random.default_rng(seed=0).standard_normal(size=(args.batch_size, args.dims), dtype=np.float32)
+    responses = {encoding_format: get_response(vectors=vectors, encoding_format=encoding_format) for encoding_format in ("float", "base64")}
+
+    print(f"{args.batch_size} vectors of {args.dims} dimensions, {args.iterations} iterations")
+    print(f"{'pipeline':<32} {'cpu (ms)':>10} {'peak memory (MiB)':>18}")
+    for store, lists_pipeline, arrays_pipeline in (
+        ("qdrant", qdrant_lists_pipeline, qdrant_arrays_pipeline),
+        ("elasticsearch", elasticsearch_lists_pipeline, elasticsearch_arrays_pipeline),
+    ):
+        results = measure(
+            pipelines={
+                "lists (float)": (lists_pipeline, responses["float"]),
+                "arrays (float)": (arrays_pipeline, responses["float"]),
+                "arrays (base64)": (arrays_pipeline, responses["base64"]),
+            },
+            iterations=args.iterations,
+        )
+        for name, (cpu, peak) in results.items():
+            print(f"{store + ' ' + name:<32} {cpu:>10.2f} {peak / 2**20:>18.2f}")
+
+        # same float response body, the matrices pipeline must not cost more than the lists pipeline
+        assert results["arrays (float)"][0] < results["lists (float)"][0], f"{store}: arrays pipeline slower than lists pipeline"
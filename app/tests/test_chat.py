@@ -149,6 +149,14 @@ class TestChat:
         response = session_user.post(f"{args["base_url"]}/chat/completions", json=params)
         assert response.status_code == 400, f"error: retrieve chat completions ({response.status_code})"
 
+    def test_chat_completions_context_far_too_large(self, args, session_user, setup):
+        """Test the POST /chat/completions with a prompt rejected without calling the model API."""
+        MODEL_ID, MAX_CONTEXT_LENGTH, _, _ = setup
+        prompt = "test " * (MAX_CONTEXT_LENGTH * 4)
+        params = {"model": MODEL_ID, "messages": [{"role": "user", "content": prompt}], "stream": False, "n": 1, "max_tokens": 10}
+        response = session_user.post(f"{args["base_url"]}/chat/completions", json=params)
+        assert response.status_code == 400, f"error: retrieve chat completions ({response.status_code})"
+
     def test_chat_completions_search_unstreamed_response(self, args, session_user, setup):
         """Test the GET /chat/completions search unstreamed response."""
         MODEL_ID, _, DOCUMENT_IDS, COLLECTION_ID = setup
@@ -1,3 +1,6 @@
+import base64
+
+import numpy as np
 import pytest
 
 from app.utils.settings import settings
@@ -65,6 +68,22 @@ class TestEmbeddings:
         response = session_user.post(f"{args['base_url']}/embeddings", json=params)
         assert response.status_code == 200, f"error: create embeddings ({response.status_code})"
 
+    def test_embeddings_with_base64_encoding_format(self, args, session_user, setup):
+        """Test the POST /embeddings endpoint with base64 encoding format."""
+        MODEL_ID = setup
+        params = {"model": MODEL_ID, "input": "Test text", "encoding_format": "float"}
+        response = session_user.post(f"{args['base_url']}/embeddings", json=params)
+        assert response.status_code == 200, f"error: create embeddings ({response.status_code})"
+        vector = response.json()["data"][0]["embedding"]
+
+        params["encoding_format"] = "base64"
+        response = session_user.post(f"{args['base_url']}/embeddings", json=params)
+        assert response.status_code == 200, f"error: create embeddings ({response.status_code})"
+
+        embedding = response.json()["data"][0]["embedding"]
+        assert isinstance(embedding, str)
+        assert np.allclose(np.frombuffer(base64.b64decode(embedding), dtype="<f4"), vector, atol=1e-6)
+
     def test_embeddings_invalid_encoding_format(self, args, session_user, setup):
         """Test the POST /embeddings endpoint with invalid encoding format."""
         MODEL_ID = setup
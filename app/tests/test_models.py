@@ -57,3 +57,16 @@ class TestModels:
                 assert response.status_code == 200
 
         assert check
+
+    def test_reload_models(self, args, session_admin):
+        """Test the POST /models/reload response status code and content."""
+        models = session_admin.get(f"{args["base_url"]}/models").json()["data"]
+
+        response = session_admin.post(f"{args["base_url"]}/models/reload")
+        assert response.status_code == 200, f"error: reload models ({response.status_code})"
+        assert sorted(model["id"] for model in response.json()["data"]) == sorted(model["id"] for model in models)
+
+    def test_reload_models_with_user(self, args, session_user):
+        """Test the POST /models/reload response status code with a user API key."""
+        response = session_user.post(f"{args["base_url"]}/models/reload")
+        assert response.status_code == 403, f"error: reload models with user ({response.status_code})"
@@ -37,6 +37,23 @@ class TestRerank:
         reranks = Reranks(**response_json)
         assert isinstance(reranks, Reranks)
 
+    def test_rerank_with_language_model_listwise(self, args, session_user, setup):
+        """Test the POST /rerank with a language model and the listwise method."""
+        LANGUAGE_MODEL_ID, _, _ = setup
+        params = {
+            "model": LANGUAGE_MODEL_ID,
+            "prompt": "Sort these sentences by relevance.",
+            "input": ["Sentence 1", "Sentence 2", "Sentence 3"],
+            "method": "listwise",
+        }
+        response = session_user.post(f"{args["base_url"]}/rerank", json=params)
+        assert response.status_code == 200, f"error: rerank with language model listwise ({response.status_code})"
+
+        response_json = response.json()
+        reranks = Reranks(**response_json)
+        assert [rerank.index for rerank in reranks.data] == [0, 1, 2]
+        assert all(0.0 <= rerank.score <= 1.0 for rerank in reranks.data)
+
     def test_rerank_with_rerank_model(self, args, session_user, setup):
         """Test the POST /rerank with a rerank model."""
         _, RERANK_MODEL_ID, _ = setup
@@ -0,0 +1,23 @@
+import fakeredis
+import pytest
+
+
+@pytest.fixture(scope="module", autouse=True)
+def sleep_between_tests():
+    # unit tests do not call the API, no rate limit to wait for
+    yield
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture
+def async_redis():
+    return fakeredis.FakeAsyncRedis()
@@ -0,0 +1,163 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.schemas.security import Role
+from app.schemas.settings import Admission
+from app.utils.admission import AdmissionController, AdmissionQueue
+from app.utils.exceptions import QueueTimeoutException, TooManyRequestsException
+
+
+async def wait_queued(queue: AdmissionQueue, size: int) -> None:
+    while len(queue.waiters) < size:
+        await asyncio.sleep(0)
+
+
+@pytest.mark.anyio
+async def test_full_queue_rejected_with_retry_after():
+    queue = AdmissionQueue(model="model", max_concurrency=1, max_queue_size=1, queue_timeout=10.0)
+    await queue.acquire(user="a")
+    waiter = asyncio.create_task(queue.acquire(user="b"))
+    await wait_queued(queue=queue, size=1)
+
+    with pytest.raises(TooManyRequestsException) as e:
+        await queue.acquire(user="c")
+    assert e.value.status_code == 429
+    assert int(e.value.headers["Retry-After"]) >= 1
+
+    queue.release()
+    await waiter
+    queue.release()
+    assert queue.requests_in_flight == 0 and not queue.waiters
+
+
+@pytest.mark.anyio
+async def test_queue_timeout_rejected_with_retry_after():
+    queue = AdmissionQueue(model="model", max_concurrency=1, max_queue_size=1, queue_timeout=0.05)
+    await queue.acquire(user="a")
+
+    with pytest.raises(QueueTimeoutException) as e:
+        await queue.acquire(user="b")
+    assert e.value.status_code == 503
+    assert int(e.value.headers["Retry-After"]) >= 1
+    assert not queue.waiters
+
+    queue.release()
+    assert queue.requests_in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_cancelled_waiter_leaves_the_queue():
+    queue = AdmissionQueue(model="model", max_concurrency=1, max_queue_size=2, queue_timeout=10.0)
+    await queue.acquire(user="a")
+    cancelled = asyncio.create_task(queue.acquire(user="b"))
+    waiter = asyncio.create_task(queue.acquire(user="c"))
+    await wait_queued(queue=queue, size=2)
+
+    cancelled.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+    assert len(queue.waiters) == 1
+
+    # the slot goes to the remaining waiter
+    queue.release()
+    await waiter
+    assert queue.requests_in_flight == 1 and not queue.waiters
+    queue.release()
+    assert queue.requests_in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_waiter_cancelled_after_being_granted_hands_over_the_slot():
+    queue = AdmissionQueue(model="model", max_concurrency=1, max_queue_size=2, queue_timeout=10.0)
+    await queue.acquire(user="a")
+    cancelled = asyncio.create_task(queue.acquire(user="b"))
+    waiter = asyncio.create_task(queue.acquire(user="c"))
+    await wait_queued(queue=queue, size=2)
+
+    # the slot is granted to the first waiter, cancelled before it resumes
+    queue.release()
+    cancelled.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+
+    await waiter
+    assert queue.requests_in_flight == 1 and not queue.waiters
+    queue.release()
+    assert queue.requests_in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_controller_slot_released():
+    settings = SimpleNamespace(models=SimpleNamespace(admission=Admission(max_concurrency=1, max_queue_size=0, queue_timeout=1.0)))
+    controller = AdmissionController(settings=settings)
+
+    async with await controller.acquire(model="model", user="a", role=Role.USER):
+        with pytest.raises(TooManyRequestsException):
+            controller.check(model="model")
+    assert controller.get(model="model").requests_in_flight == 0
+    controller.check(model="model")
+
+
+async def serve(queue: AdmissionQueue, order: list, user: str, priority: bool = False, weight: float = 1.0) -> None:
+    await queue.acquire(user=user, priority=priority, weight=weight)
+    order.append(user)
+
+
+async def release_next(queue: AdmissionQueue, order: list) -> None:
+    # release the slot of the request being served and wait for the next request to get it
+    served = len(order)
+    queue.release()
+    while len(order) == served:
+        await asyncio.sleep(0)
+
+
+@pytest.mark.anyio
+async def test_priority_lane_gets_the_next_slot():
+    queue = AdmissionQueue(model="model", max_concurrency=1, max_queue_size=10, queue_timeout=10.0)
+    order = list()
+    tasks = [asyncio.create_task(serve(queue=queue, order=order, user="a")) for _ in range(4)]
+    await wait_queued(queue=queue, size=3)
+    tasks.append(asyncio.create_task(serve(queue=queue, order=order, user="admin", priority=True)))
+    await wait_queued(queue=queue, size=4)
+
+    await release_next(queue=queue, order=order)
+    assert order == ["a", "admin"]
+
+    for _ in range(3):
+        await release_next(queue=queue, order=order)
+    await asyncio.gather(*tasks)
+    assert order == ["a", "admin", "a", "a", "a"]
+
+
+@pytest.mark.anyio
+async def test_new_user_served_before_the_backlog_of_another_user():
+    queue = AdmissionQueue(model="model", max_concurrency=1, max_queue_size=10, queue_timeout=10.0)
+    order = list()
+    tasks = [asyncio.create_task(serve(queue=queue, order=order, user="a")) for _ in range(4)]
+    await wait_queued(queue=queue, size=3)
+    await release_next(queue=queue, order=order)
+
+    # b arrives while the second request of a is served
+    tasks.append(asyncio.create_task(serve(queue=queue, order=order, user="b")))
+    await wait_queued(queue=queue, size=3)
+    for _ in range(3):
+        await release_next(queue=queue, order=order)
+    await asyncio.gather(*tasks)
+    assert order == ["a", "a", "b", "a", "a"]
+
+
+@pytest.mark.anyio
+async def test_weighted_users():
+    queue = AdmissionQueue(model="model", max_concurrency=1, max_queue_size=10, queue_timeout=10.0)
+    order = list()
+    await queue.acquire(user="holder")
+    tasks = [asyncio.create_task(serve(queue=queue, order=order, user="a", weight=2.0)) for _ in range(4)]
+    tasks += [asyncio.create_task(serve(queue=queue, order=order, user="b")) for _ in range(2)]
+    await wait_queued(queue=queue, size=6)
+
+    for _ in range(6):
+        await release_next(queue=queue, order=order)
+    await asyncio.gather(*tasks)
+    assert order == ["a", "b", "a", "a", "b", "a"]
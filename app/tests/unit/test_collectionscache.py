@@ -0,0 +1,43 @@
+import pytest
+
+from app.clients._collectionscache import CollectionsCache
+from app.schemas.collections import Collection
+from app.schemas.security import Role, User
+from app.utils.variables import PRIVATE_COLLECTION_TYPE
+
+USER = User(id="user", role=Role.USER)
+
+
+@pytest.fixture
+def cache(redis):
+    return CollectionsCache(redis=redis, max_size=16, ttl=60, revalidate_interval=0)
+
+
+def get_collection(collection_id: str) -> Collection:
+    return Collection(id=collection_id, name=collection_id, model="model", type=PRIVATE_COLLECTION_TYPE, user=USER.id)
+
+
+def test_bump_invalidates_cached_collection(cache):
+    cache.bump(collection_id="collection")
+    collections, versions = cache.get(collection_ids=["collection"], user=USER)
+    assert collections is None and versions == {"collection": 1}
+
+    cache.set(collections=[get_collection(collection_id="collection")], versions=versions)
+    collections, _ = cache.get(collection_ids=["collection"], user=USER)
+    assert [collection.id for collection in collections] == ["collection"]
+
+    cache.bump(collection_id="collection")
+    collections, versions = cache.get(collection_ids=["collection"], user=USER)
+    assert collections is None and versions == {"collection": 2}
+
+
+def test_delete_leaves_no_key(cache, redis):
+    cache.bump(collection_id="collection")
+    _, versions = cache.get(collection_ids=["collection"], user=USER)
+    cache.set(collections=[get_collection(collection_id="collection")], versions=versions)
+    assert redis.keys("collections:*")
+
+    cache.delete(collection_id="collection")
+    assert redis.keys("collections:*") == []
+    collections, _ = cache.get(collection_ids=["collection"], user=USER)
+    assert collections is None
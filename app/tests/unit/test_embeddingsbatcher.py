@@ -0,0 +1,92 @@
+import asyncio
+
+import numpy as np
+from openai.types.create_embedding_response import Usage
+import pytest
+
+from app.clients._embeddingsbatcher import EmbeddingsBatcher
+
+
+class Upstream:
+    """
+    Fake model API embedding each text as a vector of its length, recording the texts of each request.
+    """
+
+    def __init__(self, error: bool = False) -> None:
+        self.batches = list()
+        self.error = error
+
+    async def __call__(self, texts):
+        self.batches.append(texts)
+        await asyncio.sleep(0)
+        if self.error:
+            raise ValueError("model API error")
+
+        return [np.array([len(text)], dtype=np.float32) for text in texts], Usage(prompt_tokens=len(texts) * 10, total_tokens=len(texts) * 10)
+
+
+def get_texts(n: int, prefix: str):
+    return [f"{prefix}{i}" for i in range(n)]
+
+
+@pytest.mark.anyio
+async def test_concurrent_requests_sent_in_one_batch():
+    upstream = Upstream()
+    batcher = EmbeddingsBatcher(send=upstream, max_wait=0.05, max_batch_size=16)
+
+    results = await asyncio.gather(*[batcher.create(model="model", texts=get_texts(n=2, prefix=f"text {i}-")) for i in range(3)])
+
+    assert [len(batch) for batch in upstream.batches] == [6]
+    for i, (vectors, usage) in enumerate(results):
+        assert [vector[0] for vector in vectors] == [len(text) for text in get_texts(n=2, prefix=f"text {i}-")]
+        assert usage.prompt_tokens == 20
+
+
+@pytest.mark.anyio
+async def test_batch_flushed_when_full():
+    upstream = Upstream()
+    batcher = EmbeddingsBatcher(send=upstream, max_wait=10.0, max_batch_size=4)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(*[batcher.create(model="model", texts=get_texts(n=2, prefix=f"{i}-")) for i in range(4)]), timeout=1.0
+    )
+
+    assert [len(batch) for batch in upstream.batches] == [4, 4]
+    assert all(len(vectors) == 2 for vectors, _ in results)
+
+
+@pytest.mark.anyio
+async def test_batch_flushed_before_exceeding_the_max_batch_size():
+    upstream = Upstream()
+    batcher = EmbeddingsBatcher(send=upstream, max_wait=0.05, max_batch_size=4)
+
+    await asyncio.gather(
+        batcher.create(model="model", texts=get_texts(n=3, prefix="a")), batcher.create(model="model", texts=get_texts(n=2, prefix="b"))
+    )
+
+    assert upstream.batches == [get_texts(n=3, prefix="a"), get_texts(n=2, prefix="b")]
+
+
+@pytest.mark.anyio
+async def test_max_batch_size_of_the_model_api():
+    upstream = Upstream()
+    batcher = EmbeddingsBatcher(send=upstream, max_wait=10.0, max_batch_size=16)
+
+    # a request filling the batch of the model API is sent as is
+    vectors, _ = await batcher.create(model="model", texts=get_texts(n=4, prefix="a"), max_batch_size=4)
+    assert len(vectors) == 4
+
+    await asyncio.wait_for(
+        asyncio.gather(*[batcher.create(model="model", texts=get_texts(n=1, prefix=f"{i}-"), max_batch_size=2) for i in range(4)]), timeout=1.0
+    )
+
+    assert [len(batch) for batch in upstream.batches] == [4, 2, 2]
+
+
+@pytest.mark.anyio
+async def test_model_api_error_raised_to_each_caller():
+    batcher = EmbeddingsBatcher(send=Upstream(error=True), max_wait=0.01, max_batch_size=16)
+
+    results = await asyncio.gather(*[batcher.create(model="model", texts=["text"]) for _ in range(2)], return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in results)
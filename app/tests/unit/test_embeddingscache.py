@@ -0,0 +1,57 @@
+import fakeredis
+import numpy as np
+import pytest
+
+from app.clients import EmbeddingsCache
+
+
+@pytest.fixture
+def cache(async_redis):
+    return EmbeddingsCache(redis=async_redis, max_size=2, ttl=60)
+
+
+def test_key_of_the_normalized_text(cache):
+    key = cache._get_key(model="model", text="café")
+
+    assert key == cache._get_key(model="model", text="cafe\u0301")  # decomposed é
+    assert key == cache._get_key(model="model", text="  café\n")
+    assert key != cache._get_key(model="model", text="Café")
+    assert key != cache._get_key(model="other-model", text="café")
+    assert key.startswith("embeddings:model:")
+
+
+@pytest.mark.anyio
+async def test_vectors_cached_with_ttl(cache, async_redis):
+    vectors = [np.array([0.1, 0.2], dtype=np.float32), np.array([0.3, 0.4], dtype=np.float32)]
+    assert await cache.get(model="model", texts=["a", "b"]) == [None, None]
+
+    await cache.set(model="model", texts=["a", "b"], vectors=vectors)
+
+    cached = await cache.get(model="model", texts=["b", "c", "a"])
+    np.testing.assert_array_equal(cached[0], vectors[1])
+    assert cached[1] is None
+    np.testing.assert_array_equal(cached[2], vectors[0])
+    assert 0 < await async_redis.ttl(cache._get_key(model="model", text="a")) <= 60
+
+
+@pytest.mark.anyio
+async def test_vectors_read_from_redis_once_evicted_from_memory(cache, async_redis):
+    await cache.set(model="model", texts=["a", "b", "c"], vectors=[np.array([float(i)], dtype=np.float32) for i in range(3)])
+
+    # the memory cache holds 2 vectors, the first one is read from Redis, as by another API worker
+    other_cache = EmbeddingsCache(redis=async_redis, max_size=2, ttl=60)
+    for cache in (cache, other_cache):
+        vectors = await cache.get(model="model", texts=["a", "b", "c"])
+        assert [vector[0] for vector in vectors] == [0.0, 1.0, 2.0]
+
+
+@pytest.mark.anyio
+async def test_unreachable_redis():
+    server = fakeredis.FakeServer()
+    server.connected = False
+    cache = EmbeddingsCache(redis=fakeredis.FakeAsyncRedis(server=server), max_size=2, ttl=60)
+
+    await cache.set(model="model", texts=["a"], vectors=[np.array([1.0], dtype=np.float32)])
+
+    assert (await cache.get(model="model", texts=["a"]))[0][0] == 1.0  # from memory
+    assert await cache.get(model="model", texts=["b"]) == [None]
@@ -0,0 +1,45 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.helpers import LanguageModelReranker
+
+
+class Replica:
+    """
+    Fake replica of a language model answering 1 to every scoring request, recording its max concurrent requests.
+    """
+
+    def __init__(self, base_url: str) -> None:
+        self.id = "model"
+        self.base_url = base_url
+        self.max_context_length = None
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="1"))])
+
+
+@pytest.mark.anyio
+async def test_scoring_requests_spread_over_the_replicas_with_a_limit_per_replica():
+    replicas = [Replica(base_url=f"http://replica-{i}:8000/v1/") for i in range(2)]
+    model = replicas[0]
+    model.select_replicas = lambda n: [replicas[i % 2] for i in range(n)]
+
+    reranker = LanguageModelReranker(model=model, max_concurrency=2, timeout=10.0)
+    data = await reranker.create(prompt="prompt", input=[f"text {i}" for i in range(10)])
+
+    assert [rerank.index for rerank in data] == list(range(10))
+    assert [replica.calls for replica in replicas] == [5, 5]
+    assert [replica.max_in_flight for replica in replicas] == [2, 2]
+    assert all(str(replica.base_url) in LanguageModelReranker.semaphores for replica in replicas)
@@ -0,0 +1,109 @@
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.clients._modelclients import ModelClient, ModelClients
+from app.schemas.settings import Internet, Models
+from app.schemas.settings import ModelClient as ModelClientSettings
+from app.utils.exceptions import ContextLengthExceededException
+from app.utils.upstream import upstream_clients
+from app.utils.variables import LANGUAGE_MODEL_TYPE
+
+UPSTREAMS = ["http://model-1:8000", "http://model-2:8000"]
+
+
+class Upstream:
+    """
+    Fake vLLM API serving the model "model" when available, refusing connections otherwise.
+    """
+
+    def __init__(self) -> None:
+        self.available = True
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if not self.available:
+            raise httpx.ConnectError("connection refused", request=request)
+
+        return httpx.Response(status_code=200, json={"data": [{"id": "model", "max_model_len": 2048}]})
+
+
+@pytest.fixture
+def client():
+    client = ModelClient(base_url="http://model:8000/v1", api_key="key", type=LANGUAGE_MODEL_TYPE)
+    client.max_context_length = 2048
+
+    return client
+
+
+def test_max_tokens_capped_with_the_highest_prompt_estimate(client):
+    # a prompt estimated to 1000 tokens may have up to 1500 tokens
+    assert client.check_context_length(prompt_tokens=1000, max_tokens=1000) == 2048 - 1500
+    assert client.check_context_length(prompt_tokens=100, max_tokens=100) == 100
+
+
+def test_max_tokens_bounded_when_not_given(client):
+    assert client.check_context_length(prompt_tokens=1000, max_tokens=None) == 2048 - 1500
+    assert client.check_context_length(prompt_tokens=100, max_tokens=None) == 2048 - 150
+
+
+def test_prompt_that_may_fit_sent_with_the_lowest_prompt_estimate(client):
+    # a prompt estimated to 2000 tokens may have from 1333 to 3000 tokens
+    assert client.check_context_length(prompt_tokens=2000, max_tokens=1000) == 2048 - 1333
+    assert client.check_context_length(prompt_tokens=2000, max_tokens=None) is None
+
+
+def test_prompt_that_cannot_fit_rejected(client):
+    with pytest.raises(ContextLengthExceededException):
+        client.check_context_length(prompt_tokens=3100, max_tokens=None)
+
+
+def test_max_tokens_unchanged_without_prompt_count_or_context_length(client):
+    assert client.check_context_length(prompt_tokens=0, max_tokens=None) is None
+    assert client.check_context_length(prompt_tokens=0, max_tokens=4096) == 4096
+
+    client.max_context_length = None
+    assert client.check_context_length(prompt_tokens=1000, max_tokens=None) is None
+
+
+@pytest.fixture
+def upstreams():
+    upstreams = [Upstream() for _ in UPSTREAMS]
+    for url, upstream in zip(UPSTREAMS, upstreams):
+        upstream_clients.clients[url] = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+    yield upstreams
+    for url in UPSTREAMS:
+        upstream_clients.clients.pop(url)
+
+
+def get_models(default_model: str = "model") -> ModelClients:
+    settings = SimpleNamespace(
+        models=Models(),
+        internet=Internet(default_language_model=default_model, default_embeddings_model=default_model),
+        clients=SimpleNamespace(models=[ModelClientSettings(url=f"{url}/v1", type=LANGUAGE_MODEL_TYPE) for url in UPSTREAMS]),
+    )
+
+    return ModelClients(settings=settings)
+
+
+@pytest.mark.anyio
+async def test_model_api_not_reachable_at_startup_registered_once_available(upstreams):
+    upstreams[1].available = False
+    models = get_models(default_model="other-model")  # not checked while a model API is pending
+
+    await models.setup(timeout=1.0, connect_timeout=1.0)
+    assert [str(replica.base_url) for replica in models.get_replicas(key="model")] == [f"{UPSTREAMS[0]}/v1/"]
+    assert [str(model.base_url) for model in models.pending] == [f"{UPSTREAMS[1]}/v1/"]
+
+    upstreams[1].available = True
+    await models.refresh(timeout=1.0, connect_timeout=1.0)
+    assert len(models.get_replicas(key="model")) == 2
+    assert models.pending == []
+
+
+@pytest.mark.anyio
+async def test_default_internet_models_checked_once_all_model_apis_registered(upstreams):
+    await get_models().setup(timeout=1.0, connect_timeout=1.0)
+
+    with pytest.raises(AssertionError):
+        await get_models(default_model="other-model").setup(timeout=1.0, connect_timeout=1.0)
@@ -0,0 +1,67 @@
+from json import loads
+
+import httpx
+import pytest
+
+from app.clients._modelclients import ModelClient
+from app.utils.cache import LRUCache
+from app.utils.upstream import upstream_clients
+from app.utils.variables import RERANK_MODEL_TYPE
+
+UPSTREAM = "http://rerank:8000"
+
+
+class Upstream:
+    """
+    Fake Text Embeddings Inference API scoring each text with its number, in reverse order, recording the texts of each request.
+    """
+
+    def __init__(self) -> None:
+        self.batches = list()
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        texts = loads(request.content)["texts"]
+        self.batches.append(texts)
+        scores = [{"index": index, "score": float(text.split(" ")[1])} for index, text in enumerate(texts)]
+
+        return httpx.Response(status_code=200, json=list(reversed(scores)))
+
+
+@pytest.fixture
+def upstream():
+    upstream = Upstream()
+    upstream_clients.clients[UPSTREAM] = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+    yield upstream
+    upstream_clients.clients.pop(UPSTREAM)
+
+
+def get_client(max_batch_size: int, rerank_cache: LRUCache = None) -> ModelClient:
+    client = ModelClient(base_url=f"{UPSTREAM}/v1", api_key="key", type=RERANK_MODEL_TYPE, rerank_cache=rerank_cache)
+    client.id = "rerank"
+    client.max_batch_size = max_batch_size
+
+    return client
+
+
+@pytest.mark.anyio
+async def test_inputs_split_by_max_batch_size(upstream):
+    client = get_client(max_batch_size=4)
+    input = [f"text {i}" for i in range(10)]
+
+    data = await client.rerank.create(prompt="prompt", input=input, model="rerank")
+
+    assert sorted(len(batch) for batch in upstream.batches) == [2, 4, 4]
+    assert sorted(text for batch in upstream.batches for text in batch) == sorted(input)
+    # the index in each chunk is remapped to the index in the input
+    assert [(item.index, item.score) for item in data] == [(i, float(i)) for i in reversed(range(10))]
+
+
+@pytest.mark.anyio
+async def test_only_missing_inputs_sent(upstream):
+    client = get_client(max_batch_size=4, rerank_cache=LRUCache(max_size=100))
+    await client.rerank.create(prompt="prompt", input=["text 1", "text 2"], model="rerank")
+
+    data = await client.rerank.create(prompt="prompt", input=["text 3", "text 2", "text 1", "text 0"], model="rerank")
+
+    assert upstream.batches[1:] == [["text 3", "text 0"]]
+    assert [(item.index, item.score) for item in data] == [(0, 3.0), (1, 2.0), (2, 1.0), (3, 0.0)]
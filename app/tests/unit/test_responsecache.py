@@ -0,0 +1,75 @@
+import fakeredis
+import pytest
+
+from app.helpers import ResponseCache
+
+BODY = {"model": "model", "messages": [{"role": "user", "content": "Hello"}], "temperature": 0}
+
+
+@pytest.fixture
+def cache(async_redis):
+    return ResponseCache(redis=async_redis, ttl=60)
+
+
+async def stream(*chunks: bytes, status_code: int = 200):
+    for chunk in chunks:
+        yield chunk, status_code
+
+
+def test_cacheable_requests():
+    assert ResponseCache.is_cacheable(body=BODY, headers={})
+    assert ResponseCache.is_cacheable(body=BODY | {"temperature": 0.7, "seed": 42}, headers={})
+    assert not ResponseCache.is_cacheable(body=BODY | {"temperature": 0.7}, headers={})
+    assert not ResponseCache.is_cacheable(body=BODY, headers={"Cache-Control": "no-cache"})
+
+
+def test_key_of_the_canonicalized_body(cache):
+    key = cache.get_key(endpoint="chat/completions", body=BODY)
+
+    assert key == cache.get_key(endpoint="chat/completions", body=dict(reversed(BODY.items())))
+    assert key != cache.get_key(endpoint="chat/completions", body=BODY | {"model": "other-model"})
+    assert key != cache.get_key(endpoint="completions", body=BODY)
+
+
+@pytest.mark.anyio
+async def test_response_cached_with_ttl(cache, async_redis):
+    key = cache.get_key(endpoint="chat/completions", body=BODY)
+    assert await cache.get(key=key, endpoint="chat/completions", model="model") is None
+
+    await cache.set(key=key, value=b'{"id": "response"}')
+
+    assert await cache.get(key=key, endpoint="chat/completions", model="model") == b'{"id": "response"}'
+    assert 0 < await async_redis.ttl(key) <= 60
+
+
+@pytest.mark.anyio
+async def test_streamed_response_recorded_and_replayed(cache):
+    key = cache.get_key(endpoint="chat/completions", body=BODY | {"stream": True})
+    chunks = [b'data: {"id": "1"}\n\ndata: {"id"', b': "2"}\n\n', b"data: [DONE]\n\n"]
+
+    forwarded = [chunk async for chunk, _ in cache.record(key=key, stream=stream(*chunks))]
+    assert forwarded == chunks
+
+    cached = await cache.get(key=key, endpoint="chat/completions", model="model")
+    replayed = [chunk async for chunk, _ in cache.replay(value=cached)]
+    assert replayed == [b'data: {"id": "1"}\n\n', b'data: {"id": "2"}\n\n', b"data: [DONE]\n\n"]
+
+
+@pytest.mark.anyio
+async def test_failed_stream_not_cached(cache):
+    key = cache.get_key(endpoint="chat/completions", body=BODY | {"stream": True})
+
+    _ = [chunk async for chunk in cache.record(key=key, stream=stream(b'data: {"detail": "error"}\n\n', status_code=500))]
+
+    assert await cache.get(key=key, endpoint="chat/completions", model="model") is None
+
+
+@pytest.mark.anyio
+async def test_unreachable_redis_is_a_miss():
+    server = fakeredis.FakeServer()
+    server.connected = False
+    cache = ResponseCache(redis=fakeredis.FakeAsyncRedis(server=server), ttl=60)
+    key = cache.get_key(endpoint="chat/completions", body=BODY)
+
+    await cache.set(key=key, value=b"{}")
+    assert await cache.get(key=key, endpoint="chat/completions", model="model") is None
@@ -0,0 +1,104 @@
+from json import loads
+
+import httpx
+from prometheus_client import REGISTRY
+import pytest
+
+from app.utils.route import forward_request, forward_stream
+from app.utils.upstream import upstream_clients
+
+UPSTREAM = "http://route:8000"
+URL = f"{UPSTREAM}/v1/chat/completions"
+EVENTS = [b'data: {"choices": [{"delta": {"content": "token"}}]}\n\n'] * 3 + [b"data: [DONE]\n\n"]
+
+
+class Upstream:
+    """
+    Fake model API answering with the given status code, streamed responses event by event.
+    """
+
+    def __init__(self, status_code: int = 200) -> None:
+        self.status_code = status_code
+        self.closed = False
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if not loads(request.content).get("stream"):
+            content = b'{"message": "error"}' if self.status_code != 200 else b'{"id": "response", "choices": []}\n'
+            return httpx.Response(status_code=self.status_code, content=content)
+
+        upstream = self
+
+        class Stream(httpx.AsyncByteStream):
+            async def __aiter__(self):
+                for event in EVENTS:
+                    yield event
+
+            async def aclose(self):
+                upstream.closed = True
+
+        return httpx.Response(status_code=self.status_code, stream=Stream())
+
+
+@pytest.fixture
+def upstream():
+    upstream = Upstream()
+    upstream_clients.clients[UPSTREAM] = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+    yield upstream
+    upstream_clients.clients.pop(UPSTREAM)
+
+
+def get_aborted(name: str) -> float:
+    return REGISTRY.get_sample_value(f"http_upstream_aborted_{name}_total", {"upstream": UPSTREAM}) or 0.0
+
+
+@pytest.mark.anyio
+async def test_additional_data_spliced_in_the_response(upstream):
+    response = await forward_request(url=URL, method="POST", json={}, additional_data_value=[{"id": 1}], additional_data_key="search_results")
+
+    assert loads(response.content) == {"id": "response", "choices": [], "search_results": [{"id": 1}]}
+
+
+@pytest.mark.anyio
+async def test_additional_data_sent_as_a_first_event(upstream):
+    json = {"model": "model", "stream": True}
+    chunks = [
+        chunk
+        async for chunk, _ in forward_stream(
+            url=URL, method="POST", json=json, additional_data_value=[{"id": 1}], additional_data_key="search_results"
+        )
+    ]
+
+    event = loads(chunks[0].removeprefix(b"data: "))
+    assert event["object"] == "chat.completion.chunk"
+    assert event["choices"] == []
+    assert event["model"] == "model"
+    assert event["search_results"] == [{"id": 1}]
+    assert b"".join(chunks[1:]) == b"".join(EVENTS)
+
+
+@pytest.mark.anyio
+async def test_no_additional_data_for_errors(upstream):
+    upstream.status_code = 400
+
+    chunks = [
+        chunk
+        async for chunk, _ in forward_stream(
+            url=URL, method="POST", json={"stream": True}, additional_data_value=[1], additional_data_key="search_results"
+        )
+    ]
+
+    assert b"search_results" not in b"".join(chunks)
+
+
+@pytest.mark.anyio
+async def test_upstream_stream_closed_when_the_client_disconnects(upstream):
+    streams, tokens = get_aborted(name="streams"), get_aborted(name="tokens")
+
+    response = forward_stream(url=URL, method="POST", json={"stream": True})
+    async for chunk, _ in response:
+        break  # the client disconnects after the first token
+    await response.aclose()
+
+    assert upstream.closed
+    assert get_aborted(name="streams") == streams + 1
+    assert get_aborted(name="tokens") == tokens + 1
@@ -0,0 +1,123 @@
+from types import SimpleNamespace
+import uuid
+
+import numpy as np
+import pytest
+
+from app.clients._collectionscache import CollectionsCache
+from app.helpers import SemanticCache
+from app.schemas.chat import ChatCompletionRequest
+from app.schemas.collections import Collection
+from app.schemas.security import Role, User
+from app.utils.variables import INTERNET_COLLECTION_DISPLAY_ID
+
+USER = User(id="user", role=Role.USER)
+COLLECTION_ID = str(uuid.uuid4())
+VECTORS = {
+    "Qui est Albert ?": [1.0, 0.0, 0.0],
+    "Qui est Albert ?!": [0.99, 0.1, 0.0],  # near the first prompt
+    "Quelle heure est-il ?": [0.0, 1.0, 0.0],
+}
+
+
+class Embeddings:
+    async def vectors(self, texts: list) -> np.ndarray:
+        vectors = np.array([VECTORS[text] for text in texts], dtype=np.float32)
+
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class Search:
+    def get_collections(self, collection_ids: list, user: User) -> list:
+        return [Collection(id=collection_id, model="embeddings-model") for collection_id in collection_ids]
+
+
+@pytest.fixture
+def collections_cache(redis):
+    return CollectionsCache(redis=redis, max_size=16, ttl=60, revalidate_interval=0)
+
+
+@pytest.fixture
+def cache(collections_cache):
+    return SemanticCache(collections_cache=collections_cache, max_distance=0.05, max_size=2, ttl=60)
+
+
+def get_body(prompt: str, **params) -> ChatCompletionRequest:
+    params = {"search_args": {"collections": [COLLECTION_ID], "k": 3, "method": "semantic"}} | params
+    return ChatCompletionRequest(model="model", messages=[{"role": "user", "content": prompt}], search=True, **params)
+
+
+async def get_query(cache: SemanticCache, body: ChatCompletionRequest):
+    models = {"embeddings-model": SimpleNamespace(embeddings=Embeddings())}
+
+    return await cache.get_query(body=body, user=USER, models=models, search=Search())
+
+
+def test_cacheable_requests():
+    assert SemanticCache.is_cacheable(body=get_body(prompt="Qui est Albert ?"), headers={})
+    assert not SemanticCache.is_cacheable(body=get_body(prompt="Qui est Albert ?"), headers={"Cache-Control": "no-cache"})
+    body = get_body(prompt="Qui est Albert ?", search_args={"collections": [INTERNET_COLLECTION_DISPLAY_ID]})
+    assert not SemanticCache.is_cacheable(body=body, headers={})
+
+
+@pytest.mark.anyio
+async def test_near_prompt_served_from_the_cache(cache):
+    query = await get_query(cache=cache, body=get_body(prompt="Qui est Albert ?"))
+    assert cache.get(query=query, model="model") is None
+    cache.set(query=query, value=b'{"id": "response"}')
+
+    near_query = await get_query(cache=cache, body=get_body(prompt="Qui est Albert ?!"))
+    assert cache.get(query=near_query, model="model") == b'{"id": "response"}'
+
+    other_query = await get_query(cache=cache, body=get_body(prompt="Quelle heure est-il ?"))
+    assert cache.get(query=other_query, model="model") is None
+
+
+@pytest.mark.anyio
+async def test_scope_includes_the_parameters(cache):
+    query = await get_query(cache=cache, body=get_body(prompt="Qui est Albert ?"))
+    cache.set(query=query, value=b'{"id": "response"}')
+
+    query = await get_query(cache=cache, body=get_body(prompt="Qui est Albert ?", temperature=0.5))
+    assert cache.get(query=query, model="model") is None
+
+
+@pytest.mark.anyio
+async def test_collection_version_change_invalidates_the_cache(cache, collections_cache):
+    query = await get_query(cache=cache, body=get_body(prompt="Qui est Albert ?"))
+    cache.set(query=query, value=b'{"id": "response"}')
+
+    # documents upserted in the collection
+    collections_cache.bump(collection_id=COLLECTION_ID)
+
+    query = await get_query(cache=cache, body=get_body(prompt="Qui est Albert ?"))
+    assert cache.get(query=query, model="model") is None
+
+
+@pytest.mark.anyio
+async def test_least_recently_used_response_evicted(cache):
+    queries = [await get_query(cache=cache, body=get_body(prompt=prompt)) for prompt in ("Qui est Albert ?", "Quelle heure est-il ?")]
+    for i, query in enumerate(queries):
+        cache.set(query=query, value=f"response {i}".encode())
+    assert cache.get(query=queries[0], model="model") == b"response 0"
+
+    query = await get_query(cache=cache, body=get_body(prompt="Qui est Albert ?", temperature=0.5))
+    cache.set(query=query, value=b"response 2")
+
+    assert cache.get(query=queries[0], model="model") == b"response 0"
+    assert cache.get(query=queries[1], model="model") is None
+
+
+@pytest.mark.anyio
+async def test_streamed_response_recorded_and_replayed(cache):
+    query = await get_query(cache=cache, body=get_body(prompt="Qui est Albert ?", stream=True))
+
+    async def stream():
+        yield b'data: {"id": "1"}\n\ndata: {"id"', 200
+        yield b': "2"}\n\ndata: [DONE]\n\n', 200
+
+    _ = [chunk async for chunk in cache.record(query=query, stream=stream())]
+
+    cached = cache.get(query=query, model="model")
+    replayed = [chunk async for chunk, _ in cache.replay(value=cached)]
+    assert replayed == [b'data: {"id": "1"}\n\n', b'data: {"id": "2"}\n\n', b"data: [DONE]\n\n"]
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from app.utils.singleflight import SingleFlight
+
+URL = "http://model:8000/v1/chat/completions"
+
+
+class Upstream:
+    """
+    Fake model API counting its calls, the responses are sent once released.
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.cancelled = 0
+        self.released = asyncio.Event()
+
+    async def call(self) -> str:
+        self.calls += 1
+        try:
+            await self.released.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+        return f"response {self.calls}"
+
+    async def stream(self):
+        self.calls += 1
+        yield b"chunk 0", 200
+        await self.released.wait()
+        for i in range(1, 3):
+            yield f"chunk {i}".encode(), 200
+
+
+async def wait_callers(single_flight: SingleFlight, key: str, callers: int) -> None:
+    while key not in single_flight.flights or single_flight.flights[key].callers < callers:
+        await asyncio.sleep(0)
+
+
+@pytest.mark.anyio
+async def test_concurrent_identical_requests_send_one_call():
+    single_flight, upstream = SingleFlight(enabled=True), Upstream()
+    key = single_flight.get_key(url=URL, method="POST", json={"model": "model", "temperature": 0})
+
+    tasks = [asyncio.create_task(single_flight.do(url=URL, key=key, call=upstream.call)) for _ in range(8)]
+    await wait_callers(single_flight=single_flight, key=key, callers=8)
+    upstream.released.set()
+
+    assert await asyncio.gather(*tasks) == ["response 1"] * 8
+    assert upstream.calls == 1
+    assert key not in single_flight.flights
+
+    # the flight is over: a new request is sent
+    assert await single_flight.do(url=URL, key=key, call=upstream.call) == "response 2"
+
+
+@pytest.mark.anyio
+async def test_different_requests_are_not_coalesced():
+    single_flight, upstream = SingleFlight(enabled=True), Upstream()
+    upstream.released.set()
+    keys = [single_flight.get_key(url=URL, method="POST", json={"model": "model", "prompt": prompt}) for prompt in ("a", "b")]
+
+    await asyncio.gather(*[single_flight.do(url=URL, key=key, call=upstream.call) for key in keys])
+
+    assert upstream.calls == 2
+
+
+@pytest.mark.anyio
+async def test_cancelled_caller_does_not_cancel_the_shared_call():
+    single_flight, upstream = SingleFlight(enabled=True), Upstream()
+    key = single_flight.get_key(url=URL, method="POST", json={})
+
+    tasks = [asyncio.create_task(single_flight.do(url=URL, key=key, call=upstream.call)) for _ in range(3)]
+    await wait_callers(single_flight=single_flight, key=key, callers=3)
+    tasks[0].cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await tasks[0]
+    upstream.released.set()
+
+    assert await asyncio.gather(*tasks[1:]) == ["response 1"] * 2
+    assert upstream.calls == 1 and upstream.cancelled == 0
+
+
+@pytest.mark.anyio
+async def test_shared_call_cancelled_once_all_callers_left():
+    single_flight, upstream = SingleFlight(enabled=True), Upstream()
+    key = single_flight.get_key(url=URL, method="POST", json={})
+
+    tasks = [asyncio.create_task(single_flight.do(url=URL, key=key, call=upstream.call)) for _ in range(2)]
+    await wait_callers(single_flight=single_flight, key=key, callers=2)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await asyncio.sleep(0)
+
+    assert upstream.cancelled == 1
+    assert key not in single_flight.flights
+
+
+@pytest.mark.anyio
+async def test_streamed_response_shared_between_subscribers():
+    single_flight, upstream = SingleFlight(enabled=True), Upstream()
+    key = single_flight.get_key(url=URL, method="POST", json={"stream": True})
+
+    async def read() -> list:
+        return [chunk async for chunk, _ in single_flight.stream(url=URL, key=key, stream=upstream.stream)]
+
+    first = asyncio.create_task(read())
+    while key not in single_flight.broadcasts or not single_flight.broadcasts[key].chunks:
+        await asyncio.sleep(0)
+    # late subscriber: replays the chunks already received
+    second = asyncio.create_task(read())
+    await asyncio.sleep(0)
+    upstream.released.set()
+
+    expected = [b"chunk 0", b"chunk 1", b"chunk 2"]
+    assert await first == expected
+    assert await second == expected
+    assert upstream.calls == 1
+
+
+def test_key_does_not_depend_on_the_order_of_the_parameters():
+    key = SingleFlight.get_key(url=URL, method="POST", headers={"a": "1", "b": "2"}, json={"model": "model", "temperature": 0})
+
+    assert key == SingleFlight.get_key(url=URL, method="POST", headers={"b": "2", "a": "1"}, json={"temperature": 0, "model": "model"})
+    assert key != SingleFlight.get_key(url=URL, method="POST", headers={"a": "1", "b": "2"}, json={"model": "model", "temperature": 1})
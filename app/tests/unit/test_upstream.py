@@ -0,0 +1,149 @@
+import time
+
+from fastapi import HTTPException
+import httpx
+import pytest
+
+from app.schemas.settings import HTTPClient as HTTPClientSettings
+from app.utils.exceptions import UpstreamUnavailableException
+from app.utils.upstream import UpstreamClients, UpstreamState
+
+URL = "http://model:8000/v1/embeddings"
+
+
+class Upstream:
+    """
+    Fake model API answering with the given status codes, in order, the last one repeated.
+    """
+
+    def __init__(self, *status_codes: int) -> None:
+        self.status_codes = list(status_codes)
+        self.calls = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        status_code = self.status_codes[min(self.calls, len(self.status_codes) - 1)]
+        self.calls += 1
+
+        return httpx.Response(status_code=status_code, json={})
+
+
+def get_clients(upstream: Upstream, **settings) -> UpstreamClients:
+    settings = {"ejection_threshold": 2, "ejection_duration": 60.0, "max_retries": 2, "retry_backoff": 0.0, "retry_budget": 1.0} | settings
+    clients = UpstreamClients(settings=HTTPClientSettings(**settings))
+    clients.setup(urls=["http://model:8000/v1"])
+    clients.clients[clients.get_upstream(url=URL)] = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+
+    return clients
+
+
+@pytest.mark.anyio
+async def test_retried_request_counts_one_failure():
+    upstream = Upstream(503)
+    clients = get_clients(upstream=upstream)
+
+    response = await clients.send(url=URL, method="POST")
+
+    assert response.status_code == 503
+    assert upstream.calls == 3  # first attempt and 2 retries
+    state = clients.get_state(url=URL)
+    assert state.failures == 1
+    assert state.circuit == UpstreamState.CLOSED
+
+
+@pytest.mark.anyio
+async def test_retry_success_closes_circuit():
+    upstream = Upstream(502, 200)
+    clients = get_clients(upstream=upstream)
+
+    response = await clients.send(url=URL, method="POST")
+
+    assert response.status_code == 200
+    assert clients.get_state(url=URL).failures == 0
+
+
+@pytest.mark.anyio
+async def test_circuit_opens_after_consecutive_failed_requests():
+    upstream = Upstream(500)
+    clients = get_clients(upstream=upstream)
+
+    for _ in range(2):
+        response = await clients.send(url=URL, method="POST")
+        assert response.status_code == 500
+    assert clients.get_state(url=URL).circuit == UpstreamState.OPEN
+
+    with pytest.raises(UpstreamUnavailableException) as e:
+        await clients.send(url=URL, method="POST")
+    assert int(e.value.headers["Retry-After"]) > 0
+    assert upstream.calls == 2
+
+
+@pytest.mark.anyio
+async def test_half_open_circuit_probe():
+    upstream = Upstream(500, 500, 503, 200)
+    clients = get_clients(upstream=upstream)
+    state = clients.get_state(url=URL)
+    for _ in range(2):
+        await clients.send(url=URL, method="POST")
+
+    # failed probe, not retried: the circuit opens again
+    state.ejected_until = time.monotonic() - 1
+    assert state.circuit == UpstreamState.HALF_OPEN
+    response = await clients.send(url=URL, method="POST")
+    assert response.status_code == 503
+    assert upstream.calls == 3
+    assert state.circuit == UpstreamState.OPEN
+
+    # successful probe: the circuit closes
+    state.ejected_until = time.monotonic() - 1
+    response = await clients.send(url=URL, method="POST")
+    assert response.status_code == 200
+    assert state.circuit == UpstreamState.CLOSED
+
+
+@pytest.mark.anyio
+async def test_connection_error_reported_once():
+    def upstream(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("connection refused", request=request)
+
+    clients = get_clients(upstream=upstream, ejection_threshold=3)
+
+    with pytest.raises(HTTPException) as e:
+        await clients.send(url=URL, method="POST")
+    assert e.value.status_code == 500
+    assert clients.get_state(url=URL).failures == 1
+
+
+@pytest.mark.anyio
+async def test_reload_replaces_pools_with_new_limits():
+    clients = UpstreamClients(settings=HTTPClientSettings())
+    clients.setup(urls=["http://model:8000/v1"])
+    client = clients.get(url=URL)
+    state = clients.get_state(url=URL)
+
+    # settings of the upstreams only: the pools are kept
+    clients.reload(settings=HTTPClientSettings(ejection_threshold=5))
+    assert clients.get(url=URL) is client
+    assert state.ejection_threshold == 5
+
+    # new limits: the pools are replaced, the previous ones closed later
+    clients.reload(settings=HTTPClientSettings(max_connections=7))
+    assert clients.get(url=URL) is not client
+    assert len(clients.closing_tasks) == 1
+    assert not client.is_closed
+
+    for task in clients.closing_tasks:
+        task.cancel()
+    await clients.close()
+
+
+@pytest.mark.anyio
+async def test_one_pool_per_upstream():
+    clients = UpstreamClients(settings=HTTPClientSettings())
+    clients.setup(urls=["http://model:8000/v1", "http://model:8000/other/v1"])
+
+    client = clients.get(url=URL)
+    assert clients.get(url="http://model:8000/rerank") is client
+    assert clients.get(url="http://other-model:8000/v1/embeddings") is not client
+    assert len(clients.clients) == 2
+
+    await clients.close()
@@ -0,0 +1,47 @@
+from json import dumps, loads
+
+import numpy as np
+
+from app.utils.vectors import decode_vectors, encode_vector, encode_vectors, format_vector
+
+VECTORS = [[0.1, -2.5, 3.0], [1e-8, 0.0, -1.0]]
+
+
+def get_body(embeddings: list) -> bytes:
+    data = [{"object": "embedding", "index": i, "embedding": embedding} for i, embedding in reversed(list(enumerate(embeddings)))]
+
+    return dumps({"object": "list", "data": data, "model": "model", "usage": {"prompt_tokens": 2, "total_tokens": 2}}).encode()
+
+
+def test_decode_vectors_sorted_by_index():
+    for embeddings in (VECTORS, [encode_vector(vector=np.array(vector, dtype=np.float32)) for vector in VECTORS]):
+        vectors, response = decode_vectors(content=get_body(embeddings=embeddings))
+
+        np.testing.assert_array_equal(np.stack(vectors), np.array(VECTORS, dtype=np.float32))
+        assert response["usage"] == {"prompt_tokens": 2, "total_tokens": 2}
+
+
+def test_encode_vectors_of_floats():
+    response = loads(encode_vectors(content=get_body(embeddings=VECTORS)))
+
+    assert all(isinstance(data["embedding"], str) for data in response["data"])
+    vectors, _ = decode_vectors(content=dumps(response).encode())
+    np.testing.assert_array_equal(np.stack(vectors), np.array(VECTORS, dtype=np.float32))
+
+
+def test_encode_vectors_already_encoded():
+    content = get_body(embeddings=[encode_vector(vector=np.array(vector, dtype=np.float32)) for vector in VECTORS])
+
+    assert encode_vectors(content=content) is content
+
+
+def test_format_vector_read_back_as_float32():
+    vector = np.array(VECTORS[0], dtype=np.float32)
+
+    np.testing.assert_array_equal(np.array(loads(format_vector(vector=vector)), dtype=np.float32), vector)
+
+
+def test_format_vector_non_finite_values():
+    vector = np.array([1.0, np.nan, np.inf, -np.inf], dtype=np.float32)
+
+    assert loads(format_vector(vector=vector)) == [1.0, None, None, None]
@@ -0,0 +1,256 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.schemas.security import Role
+from app.schemas.settings import Settings
+from app.utils.exceptions import QueueTimeoutException, TooManyRequestsException
+from app.utils.settings import settings
+
+
+class AdmissionSlot:
+    """
+    Slot granted to a request by the admission controller of a model, released once the response is sent.
+    """
+
+    def __init__(self, queue: "AdmissionQueue") -> None:
+        self.queue = queue
+        self.start = time.monotonic()
+        self.released = False
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        self.queue.report_duration(duration=time.monotonic() - self.start)
+        self.queue.release()
+
+    async def __aenter__(self) -> "AdmissionSlot":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self.release()
+
+
+class AdmissionQueue:
+    """
+    Concurrency limiter of a model with a bounded wait queue. Waiting requests of the priority lane are served first, then
+    the requests of the default lane. In each lane, requests are served by start-time fair queuing between users: each request
+    gets a virtual start time, the virtual time of the lane or the finish time of the previous request of the same user if later,
+    and the request with the lowest start time is served first. A user sending many requests therefore waits for its own
+    requests rather than delaying other users, and the first request of a user is served before the next one of a busy user.
+    """
+
+    DURATION_SMOOTHING = 0.2  # weight of the last request in the request duration moving average
+
+    PRIORITY_LANE = 0
+    DEFAULT_LANE = 1
+
+    def __init__(self, model: str, max_concurrency: int, max_queue_size: int, queue_timeout: float) -> None:
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self.queue_timeout = queue_timeout
+
+        self.requests_in_flight = 0
+        self.waiters: List[Tuple[int, float, int, asyncio.Future]] = list()  # heap of (lane, start time, arrival order, future)
+        self.duration: Optional[float] = None
+
+        self.counter = itertools.count()
+        self.virtual_time = {self.PRIORITY_LANE: 0.0, self.DEFAULT_LANE: 0.0}
+        self.finish_times: Dict[Tuple[int, str], float] = dict()
+
+    @property
+    def retry_after(self) -> int:
+        """
+        Estimated time to serve the queued requests, in seconds.
+        """
+        return max(1, math.ceil(len(self.waiters) * (self.duration or 1.0) / self.max_concurrency))
+
+    async def acquire(self, user: str, priority: bool = False, weight: float = 1.0) -> None:
+        """
+        Wait for a slot of the model.
+
+        Args:
+            user (str): The user ID, requests are fairly shared between users.
+            priority (bool): Whether the request is served in the priority lane.
+            weight (float): The weight of the user, a user with a weight of 2 is served twice as often as a user with a weight of 1.
+        """
+        if self.requests_in_flight < self.max_concurrency and not self.waiters:
+            self.requests_in_flight += 1
+            return
+
+        self.check()
+
+        lane = self.PRIORITY_LANE if priority else self.DEFAULT_LANE
+        start_time = max(self.virtual_time[lane], self.finish_times.get((lane, user), 0.0))
+        self.finish_times[(lane, user)] = start_time + 1.0 / weight
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (lane, start_time, next(self.counter), future)
+        heapq.heappush(self.waiters, waiter)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done():
+                # the slot was granted while the request was leaving the queue: hand it over to the next request
+                self.release()
+            else:
+                future.cancel()
+                self.waiters.remove(waiter)
+                heapq.heapify(self.waiters)
+            if isinstance(e, asyncio.TimeoutError):
+                AdmissionController.rejected.labels(model=self.model, reason="queue_timeout").inc()
+                raise QueueTimeoutException(retry_after=self.retry_after)
+            raise
+        finally:
+            AdmissionController.wait_duration.labels(model=self.model).observe(amount=time.monotonic() - start)
+
+    def check(self) -> None:
+        """
+        Reject the request if it would have to wait while the queue is full.
+
+        Raises:
+            TooManyRequestsException: If the queue is full.
+        """
+        if self.requests_in_flight < self.max_concurrency and not self.waiters:
+            return
+
+        if len(self.waiters) >= self.max_queue_size:
+            AdmissionController.rejected.labels(model=self.model, reason="queue_full").inc()
+            raise TooManyRequestsException(retry_after=self.retry_after)
+
+    def resize(self, max_concurrency: int, max_queue_size: int, queue_timeout: float) -> None:
+        """
+        Update the limits of the queue (see ClientsManager.reload), waiting requests are admitted if the max concurrency increased.
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self.queue_timeout = queue_timeout
+        while self.waiters and self.requests_in_flight < self.max_concurrency:
+            # take a new slot and hand it over to the next waiting request
+            self.requests_in_flight += 1
+            self.release()
+
+    def release(self) -> None:
+        # the slot is handed over to the next waiting request, if any, unless the max concurrency decreased
+        while self.waiters and self.requests_in_flight <= self.max_concurrency:
+            lane, start_time, _, future = heapq.heappop(self.waiters)
+            if not self.waiters:
+                # no backlog: finish times of the users are not needed anymore
+                self.virtual_time = {self.PRIORITY_LANE: 0.0, self.DEFAULT_LANE: 0.0}
+                self.finish_times = dict()
+            else:
+                self.virtual_time[lane] = start_time
+            if not future.done():
+                future.set_result(None)
+                return
+        self.requests_in_flight -= 1
+
+    def report_duration(self, duration: float) -> None:
+        self.duration = duration if self.duration is None else self.DURATION_SMOOTHING * duration + (1 - self.DURATION_SMOOTHING) * self.duration
+
+
+class AdmissionController:
+    """
+    Registry of the admission queues of the models. Each model accepts a max number of concurrent requests, other requests wait
+    in a bounded queue: requests are rejected with a 429 status code if the queue is full and with a 503 status code if they
+    wait longer than the queue timeout.
+    """
+
+    queue_size = Gauge(
+        name="model_admission_queue_size",
+        documentation="Number of requests waiting for a slot of the model",
+        labelnames=["model"],
+    )
+    requests_in_flight = Gauge(
+        name="model_admission_requests_in_flight",
+        documentation="Number of requests holding a slot of the model",
+        labelnames=["model"],
+    )
+    wait_duration = Histogram(
+        name="model_admission_wait_seconds",
+        documentation="Time spent by requests waiting for a slot of the model",
+        labelnames=["model"],
+    )
+    rejected = Counter(
+        name="model_admission_rejected_total",
+        documentation="Number of requests rejected by the admission control of the model by reason (queue_full or queue_timeout)",
+        labelnames=["model", "reason"],
+    )
+
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings  # the admission settings are read at each request, to follow the config reloads
+        self.limits = settings.models.admission  # the admission settings the queues were sized with
+        self.queues: Dict[str, AdmissionQueue] = dict()
+
+    async def acquire(self, model: str, user: str, role: Role) -> AdmissionSlot:
+        """
+        Wait for a slot of a model, the slot must be released by the caller once the response is sent. Admin users and priority
+        users are served in the priority lane.
+
+        Args:
+            model (str): The model ID.
+            user (str): The user ID (see AuthenticationClient.api_key_to_user_id).
+            role (Role): The role of the user.
+
+        Returns:
+            AdmissionSlot: The slot.
+
+        Raises:
+            TooManyRequestsException: If the queue of the model is full.
+            QueueTimeoutException: If the request waited longer than the queue timeout.
+        """
+        queue = self.get(model=model)
+        settings = self.settings.models.admission
+        if settings.enabled:
+            priority = role == Role.ADMIN or user in settings.priority_users
+            await queue.acquire(user=user, priority=priority, weight=settings.weights.get(user, 1.0))
+        else:
+            queue.requests_in_flight += 1
+
+        return AdmissionSlot(queue=queue)
+
+    def check(self, model: str) -> None:
+        """
+        Reject a request up front if the queue of the model is full, for requests acquiring their slot later (see acquire).
+
+        Args:
+            model (str): The model ID.
+
+        Raises:
+            TooManyRequestsException: If the queue of the model is full.
+        """
+        if self.settings.models.admission.enabled:
+            self.get(model=model).check()
+
+    def get(self, model: str) -> AdmissionQueue:
+        settings = self.settings.models.admission
+        if settings is not self.limits:
+            # the config has been reloaded
+            self.limits = settings
+            for queue in self.queues.values():
+                queue.resize(max_concurrency=settings.max_concurrency, max_queue_size=settings.max_queue_size, queue_timeout=settings.queue_timeout)
+
+        if model not in self.queues:
+            queue = AdmissionQueue(
+                model=model,
+                max_concurrency=settings.max_concurrency,
+                max_queue_size=settings.max_queue_size,
+                queue_timeout=settings.queue_timeout,
+            )
+            self.queues[model] = queue
+
+            self.queue_size.labels(model=model).set_function(lambda: len(queue.waiters))
+            self.requests_in_flight.labels(model=model).set_function(lambda: queue.requests_in_flight)
+
+        return self.queues[model]
+
+
+admission_controller = AdmissionController(settings=settings)
@@ -0,0 +1,27 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache(OrderedDict):
+    """
+    In-process cache evicting the least recently used entry once the max size is reached.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        super().__init__()
+        self.max_size = max_size
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        if key not in self:
+            return default
+        self.move_to_end(key)
+
+        return super().__getitem__(key)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.max_size:
+            self.popitem(last=False)
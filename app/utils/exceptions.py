@@ -17,6 +17,11 @@ class ModelNotAvailableException(HTTPException):
         super().__init__(status_code=400, detail=detail)
 
 
+class ContextLengthExceededException(HTTPException):
+    def __init__(self, detail: str = "Context length exceeded.") -> None:
+        super().__init__(status_code=400, detail=detail)
+
+
 class SearchMethodNotAvailableException(HTTPException):
     def __init__(self, detail: str = "Method not available."):
         super().__init__(status_code=400, detail=detail)
@@ -88,6 +93,34 @@ class UnsupportedFileTypeException(HTTPException):
         super().__init__(status_code=422, detail=detail)
 
 
+class InvalidConfigException(HTTPException):
+    def __init__(self, detail: str = "Invalid config file.") -> None:
+        super().__init__(status_code=422, detail=detail)
+
+
 class NotImplementedException(HTTPException):
     def __init__(self, detail: str = "Not implemented.") -> None:
         super().__init__(status_code=400, detail=detail)
+
+
+# 429
+class TooManyRequestsException(HTTPException):
+    def __init__(self, detail: str = "Too many requests waiting for this model.", retry_after: int = 1) -> None:
+        super().__init__(status_code=429, detail=detail, headers={"Retry-After": str(retry_after)})
+
+
+# 503
+class QueueTimeoutException(HTTPException):
+    def __init__(self, detail: str = "Model overloaded, request timed out in queue.", retry_after: int = 1) -> None:
+        super().__init__(status_code=503, detail=detail, headers={"Retry-After": str(retry_after)})
+
+
+class UpstreamUnavailableException(HTTPException):
+    def __init__(self, detail: str = "Model API temporarily unavailable.", retry_after: int = 1) -> None:
+        super().__init__(status_code=503, detail=detail, headers={"Retry-After": str(retry_after)})
+
+
+# 504
+class RequestTimeoutException(HTTPException):
+    def __init__(self, detail: str = "Request timed out.") -> None:
+        super().__init__(status_code=504, detail=detail)
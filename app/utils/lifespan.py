@@ -7,21 +7,40 @@ from slowapi.util import get_ipaddr
 from app.helpers import ClientsManager
 from app.utils.settings import settings
 
+
+class RouteLimiter(Limiter):
+    """
+    Limiter whose routes with limits read from the settings at request time (to follow config reloads) are left to their
+    decorator by the middleware, like the routes with static limits: otherwise the middleware also applies the default limits
+    to them and breaks streamed responses. Such routes are also decorated with a static limit, never applied, for the middleware
+    to find them.
+    """
+
+    def limit(self, *args, **kwargs):
+        decorator = super().limit(*args, **kwargs)
+        static_decorator = super().limit(limit_value="1/second", exempt_when=lambda: True)
+
+        def wrapper(func):
+            return decorator(static_decorator(func))
+
+        return wrapper
+
+
 clients = ClientsManager(settings=settings)
-limiter = Limiter(
+limiter = RouteLimiter(
     key_func=get_ipaddr,
     storage_uri=f"redis://{settings.clients.cache.args.get("username", "")}:{settings.clients.cache.args.get("password", "")}@{settings.clients.cache.args["host"]}:{settings.clients.cache.args["port"]}",
-    default_limits=[settings.rate_limit.by_ip],
+    default_limits=[lambda: settings.rate_limit.by_ip],
 )
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Lifespan event to initialize clients (models API and databases)."""
+    """Lifespan event to initialize clients (models API, upstream connection pools and databases)."""
 
     app.state.limiter = limiter
-    clients.set()
+    await clients.set()
 
     yield
 
-    clients.clear()
+    await clients.clear()
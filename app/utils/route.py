@@ -1,10 +1,17 @@
 import ast
+import asyncio
+from contextlib import aclosing
 from json import dumps, loads
+import time
 from typing import Optional
+import uuid
 
 from fastapi import HTTPException
 import httpx
 
+from app.utils.singleflight import single_flight
+from app.utils.upstream import upstream_clients
+
 
 async def forward_request(
     url: str,
@@ -16,6 +23,7 @@ async def forward_request(
     timeout: Optional[int] = None,
     additional_data_value: Optional[list] = None,
     additional_data_key: Optional[str] = None,
+    coalesce: bool = False,
 ) -> httpx.Response:
     """
     Forward a request to an API and add additional data to the response if provided.
@@ -30,35 +38,42 @@ async def forward_request(
         timeout(int): The timeout to use for the request.
         additional_data_value(list): The value to add to the response.
         additional_data_key(str): The key to add the value to.
+        coalesce(bool): Whether the request is idempotent and can share the response of an identical request in flight.
 
     Returns:
         httpx.Response: The response from the API.
     """
-    async with httpx.AsyncClient(timeout=timeout) as async_client:
-        try:
-            response = await async_client.request(method=method, url=url, headers=headers, json=json, files=files, data=data, timeout=timeout)
-        except httpx.TimeoutException or httpx.ReadTimeout or httpx.ConnectTimeout or httpx.WriteTimeout or httpx.PoolTimeout as e:
-            raise HTTPException(status_code=504, detail="Request timed out, model is not available.")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=type(e).__name__)
-        try:
-            response.raise_for_status()
-        except httpx.HTTPStatusError:
-            message = loads(response.text)
-
-            # format error message
-            if "message" in message:
-                try:
-                    message = ast.literal_eval(message["message"])
-                except Exception:
-                    message = message["message"]
-            raise HTTPException(status_code=response.status_code, detail=message)
-
-    # add additional data to the response
+
+    async def send() -> httpx.Response:
+        with upstream_clients.track(url=url):
+            return await upstream_clients.send(url=url, method=method, headers=headers, json=json, files=files, data=data, timeout=timeout)
+
+    if coalesce and single_flight.enabled and not files and not data:
+        key = single_flight.get_key(url=url, method=method, headers=headers, json=json)
+        response = await single_flight.do(url=url, key=key, call=send)
+    else:
+        response = await send()
+
+    try:
+        response.raise_for_status()
+    except httpx.HTTPStatusError:
+        message = loads(response.text)
+
+        # format error message
+        if "message" in message:
+            try:
+                message = ast.literal_eval(message["message"])
+            except Exception:
+                message = message["message"]
+        raise HTTPException(status_code=response.status_code, detail=message)
+
+    # add additional data to the response, spliced at the end of the JSON object without decoding the response
     if additional_data_value and additional_data_key:
-        data = response.json()
-        data[additional_data_key] = additional_data_value
-        response = httpx.Response(status_code=response.status_code, content=dumps(data))
+        content = response.content.rstrip()
+        end = content.rindex(b"}")
+        separator = b"" if content[:end].rstrip().endswith(b"{") else b","
+        data = dumps({additional_data_key: additional_data_value})[1:-1].encode(encoding="utf-8")
+        response = httpx.Response(status_code=response.status_code, content=content[:end] + separator + data + content[end:])
 
     return response
 
@@ -73,9 +88,12 @@ async def forward_stream(
     timeout: Optional[int] = None,
     additional_data_value: Optional[list] = None,
     additional_data_key: Optional[str] = None,
+    coalesce: bool = False,
 ):
     """
-    Streams the response from the API and adds additional data to the response if provided.
+    Streams the response from the API and adds additional data to the response if provided. The additional data is sent as a
+    dedicated event, a chunk without choices, as soon as the API accepted the request and before its first chunk. The chunks
+    of the API are then forwarded as is.
 
     Args:
         url(str): The URL to forward the request to.
@@ -85,36 +103,87 @@ async def forward_stream(
         files(dict): The files to use for the request.
         data(dict): The data to use for the request.
         timeout(int): The timeout to use for the request.
-        additional_data_value(list): The value to add to the response (only on the first chunk).
-        additional_data_key(str): The key to add the value to (only on the first chunk).
+        additional_data_value(list): The value to add to the response (only in the first event).
+        additional_data_key(str): The key to add the value to (only in the first event).
+        coalesce(bool): Whether the request is idempotent and can subscribe to the stream of an identical request in flight.
     """
-    async with httpx.AsyncClient(timeout=timeout) as async_client:
+
+    def stream():
+        return _stream(url=url, method=method, headers=headers, json=json, files=files, data=data, timeout=timeout)
+
+    if coalesce and single_flight.enabled and not files and not data:
+        key = single_flight.get_key(url=url, method=method, headers=headers, json=json)
+        response = single_flight.stream(url=url, key=key, stream=stream)
+    else:
+        response = stream()
+
+    async with aclosing(response):
+        async for chunk, status_code in response:
+            # the API accepted the request: send the additional data before the first chunk
+            if not chunk:
+                if status_code // 100 == 2 and additional_data_value and additional_data_key:
+                    event = {
+                        "id": f"chatcmpl-{uuid.uuid4().hex}",
+                        "object": "chat.completion.chunk",
+                        "created": round(time.time()),
+                        "model": (json or {}).get("model"),
+                        "choices": [],
+                        additional_data_key: additional_data_value,
+                    }
+                    yield f"data: {dumps(event)}\n\n".encode(encoding="utf-8"), status_code
+                continue
+
+            yield chunk, status_code
+
+
+async def _stream(
+    url: str,
+    method: str,
+    headers: Optional[dict] = None,
+    json: Optional[dict] = None,
+    files: Optional[dict] = None,
+    data: Optional[dict] = None,
+    timeout: Optional[int] = None,
+):
+    with upstream_clients.track(url=url) as upstream:
         try:
-            async with async_client.stream(method=method, url=url, headers=headers, json=json, files=files, data=data) as response:
-                first_chunk = True
-                async for chunk in response.aiter_raw():
-                    # format error message
-                    if response.status_code // 100 != 2:
-                        chunks = loads(chunk.decode(encoding="utf-8"))
-                        if "message" in chunks:
-                            try:
-                                chunks["message"] = ast.literal_eval(chunks["message"])
-                            except Exception:
-                                pass
-                        chunk = dumps(chunks).encode(encoding="utf-8")
-
-                    # add additional data to the first chunk
-                    elif first_chunk and additional_data_value and additional_data_key:
-                        chunks = chunk.decode(encoding="utf-8").split(sep="\n\n")
-                        chunk = loads(chunks[0].lstrip("data: "))
-                        chunk[additional_data_key] = additional_data_value
-                        chunks[0] = f"data: {dumps(chunk)}"
-                        chunk = "\n\n".join(chunks).encode(encoding="utf-8")
-
-                    first_chunk = False
-                    yield chunk, response.status_code
+            response = await upstream_clients.send(
+                url=url, method=method, headers=headers, json=json, files=files, data=data, timeout=timeout, stream=True
+            )
+        except HTTPException as e:
+            yield dumps({"detail": e.detail}).encode(), e.status_code
+            return
+
+        tokens = 0
+        try:
+            # empty chunk sent once the response headers are received, with the status code of the response
+            yield b"", response.status_code
+
+            async for chunk in response.aiter_raw():
+                # format error message
+                if response.status_code // 100 != 2:
+                    chunks = loads(chunk.decode(encoding="utf-8"))
+                    if "message" in chunks:
+                        try:
+                            chunks["message"] = ast.literal_eval(chunks["message"])
+                        except Exception:
+                            pass
+                    chunk = dumps(chunks).encode(encoding="utf-8")
+
+                # each event of a streamed generation holds a token
+                tokens += chunk.count(b"data: ")
+                yield chunk, response.status_code
 
+        except (asyncio.CancelledError, GeneratorExit):
+            # the client disconnected: closing the upstream stream aborts the generation
+            if response.status_code // 100 == 2:
+                upstream_clients.report_abort(state=upstream, tokens=tokens)
+            raise
         except httpx.TimeoutException or httpx.ReadTimeout or httpx.ConnectTimeout or httpx.WriteTimeout or httpx.PoolTimeout as e:
+            upstream.report_failure()
             yield dumps({"detail": "Request timed out, model is not available."}).encode(), 504
         except Exception as e:
+            upstream.report_failure()
             yield dumps({"detail": type(e).__name__}).encode(), 500
+        finally:
+            await response.aclose()
@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+from json import dumps
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter
+
+from app.utils.settings import settings
+from app.utils.upstream import upstream_clients
+
+
+class Flight:
+    """
+    Upstream request shared by the callers of identical requests. The request runs in its own task: a caller leaving (e.g. client
+    disconnection) does not cancel the request of the other callers, the request is cancelled once all callers left.
+    """
+
+    def __init__(self, call: Callable[[], Awaitable[Any]]) -> None:
+        self.callers = 0
+        self.task = asyncio.create_task(call())
+        # the exception is raised to the callers, retrieve it even if all callers left to avoid "exception never retrieved" logs
+        self.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    async def wait(self) -> Any:
+        self.callers += 1
+        try:
+            return await asyncio.shield(self.task)
+        finally:
+            self.callers -= 1
+            if self.callers == 0 and not self.task.done():
+                self.task.cancel()
+
+
+class Broadcast:
+    """
+    Streamed upstream response shared by the subscribers of identical requests. Chunks are buffered until the end of the stream,
+    a late subscriber replays the chunks already received then follows the stream. The upstream stream is closed once all
+    subscribers left.
+    """
+
+    def __init__(self, stream: Callable[[], AsyncIterator[Tuple[bytes, int]]]) -> None:
+        self.chunks: List[Tuple[bytes, int]] = list()
+        self.done = False
+        self.subscribers = 0
+        self.updated = asyncio.Event()
+        self.task = asyncio.create_task(self._run(stream=stream()))
+
+    async def subscribe(self) -> AsyncIterator[Tuple[bytes, int]]:
+        self.subscribers += 1
+        i = 0
+        try:
+            while True:
+                if i < len(self.chunks):
+                    yield self.chunks[i]
+                    i += 1
+                elif self.done:
+                    return
+                else:
+                    await self.updated.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self.task.cancel()
+
+    async def _run(self, stream: AsyncIterator[Tuple[bytes, int]]) -> None:
+        try:
+            async for chunk in stream:
+                self.chunks.append(chunk)
+                self._notify()
+        finally:
+            self.done = True
+            self._notify()
+            await stream.aclose()
+
+    def _notify(self) -> None:
+        self.updated.set()
+        self.updated = asyncio.Event()
+
+
+class SingleFlight:
+    """
+    Coalescing of identical requests in flight to the models API: the first request is sent to the upstream, identical requests
+    received before its response wait for the same response instead of being sent. Only idempotent requests must be coalesced
+    (deterministic chat and completions, embeddings, rerank).
+    """
+
+    coalesced = Counter(
+        name="http_upstream_coalesced_requests_total",
+        documentation="Number of requests not sent to the upstream because an identical request was in flight",
+        labelnames=["upstream"],
+    )
+
+    def __init__(self, enabled: bool) -> None:
+        self.enabled = enabled
+        self.flights: Dict[str, Flight] = dict()
+        self.broadcasts: Dict[str, Broadcast] = dict()
+
+    async def do(self, url: str, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run a call, or wait for the result of the identical call in flight.
+
+        Args:
+            url (str): URL of the request, used as metrics label.
+            key (str): Key of the request (see get_key).
+            call (Callable): Coroutine function sending the request.
+
+        Returns:
+            Any: The result of the call.
+        """
+        if key in self.flights:
+            self.coalesced.labels(upstream=upstream_clients.get_base_url(url=url)).inc()
+        else:
+            flight = Flight(call=call)
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda _: self.flights.pop(key) if self.flights.get(key) is flight else None)
+
+        return await self.flights[key].wait()
+
+    def stream(self, url: str, key: str, stream: Callable[[], AsyncIterator[Tuple[bytes, int]]]) -> AsyncIterator[Tuple[bytes, int]]:
+        """
+        Subscribe to a streamed response, or to the identical streamed response in flight.
+
+        Args:
+            url (str): URL of the request, used as metrics label.
+            key (str): Key of the request (see get_key).
+            stream (Callable): Function returning the stream of (chunk, status code) of the request.
+
+        Returns:
+            AsyncIterator[Tuple[bytes, int]]: The chunks and status codes of the response, from its start.
+        """
+        if key in self.broadcasts:
+            self.coalesced.labels(upstream=upstream_clients.get_base_url(url=url)).inc()
+        else:
+            broadcast = Broadcast(stream=stream)
+            self.broadcasts[key] = broadcast
+            broadcast.task.add_done_callback(lambda _: self.broadcasts.pop(key) if self.broadcasts.get(key) is broadcast else None)
+
+        return self.broadcasts[key].subscribe()
+
+    @staticmethod
+    def get_key(url: str, method: str, headers: Optional[dict] = None, json: Optional[dict] = None) -> str:
+        request = dumps([method, url, headers, json], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+        return hashlib.sha256(request.encode(encoding="utf-8")).hexdigest()
+
+
+single_flight = SingleFlight(enabled=settings.http.coalesce_requests)
@@ -0,0 +1,82 @@
+import math
+import re
+from typing import Iterable, List, Optional, Union
+
+from openai.types.chat import ChatCompletionMessageParam
+
+
+class TokenCounter:
+    """
+    Approximate token counter of a model, estimating the number of tokens of a text from its number of characters. The ratio
+    of characters per token is calibrated with the prompt tokens reported by the model API in the usage of its responses.
+    """
+
+    CHARS_PER_TOKEN = 4.0  # initial ratio, before calibration
+    MESSAGE_TOKENS = 4  # tokens added by the chat template around each message
+    SMOOTHING = 0.1  # weight of the last response in the ratio moving average
+    SAFETY_FACTOR = 1.5  # max ratio between an estimate and the actual number of tokens
+    PROMPT_TOKENS_PATTERN = re.compile(rb'"prompt_tokens"\s*:\s*(\d+)')
+
+    def __init__(self) -> None:
+        self.chars_per_token = self.CHARS_PER_TOKEN
+
+    def count(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def count_messages(self, messages: List[ChatCompletionMessageParam]) -> int:
+        return sum(self.count(text=self.get_messages_text(messages=[message])) + self.MESSAGE_TOKENS for message in messages)
+
+    def count_prompt(self, prompt: Union[str, List[str], Iterable[int], Iterable[Iterable[int]]]) -> int:
+        """
+        Count the tokens of a completions prompt, the largest prompt if several prompts are given. Prompts of token IDs are not
+        counted: they are validated lazily by pydantic and can only be read once.
+        """
+        if isinstance(prompt, str):
+            return self.count(text=prompt)
+        if isinstance(prompt, list) and all(isinstance(item, str) for item in prompt):
+            return max([self.count(text=item) for item in prompt], default=0)
+
+        return 0
+
+    def calibrate(self, text: str, tokens: int) -> None:
+        """
+        Update the ratio of characters per token from a response of the model API.
+
+        Args:
+            text (str): The prompt.
+            tokens (int): Number of tokens of the prompt, as reported by the model API.
+        """
+        if not text or tokens <= 0:
+            return
+        self.chars_per_token = self.SMOOTHING * (len(text) / tokens) + (1 - self.SMOOTHING) * self.chars_per_token
+
+    def calibrate_messages(self, messages: List[ChatCompletionMessageParam], tokens: int) -> None:
+        self.calibrate(text=self.get_messages_text(messages=messages), tokens=tokens - self.MESSAGE_TOKENS * len(messages))
+
+    @staticmethod
+    def get_messages_text(messages: List[ChatCompletionMessageParam]) -> str:
+        texts = list()
+        for message in messages:
+            content = message.get("content") or ""
+            if isinstance(content, str):
+                texts.append(content)
+            else:
+                texts.extend(part.get("text", "") for part in content if isinstance(part, dict))
+
+        return "".join(texts)
+
+    @staticmethod
+    def get_prompt_tokens(content: bytes) -> Optional[int]:
+        """
+        Get the prompt tokens of the usage of a JSON response body of the model API, without decoding the body. Quotes are escaped
+        in JSON strings, so the key can not be matched in the content of the response.
+
+        Args:
+            content (bytes): The response body.
+
+        Returns:
+            Optional[int]: The number of prompt tokens, None if the response has no usage.
+        """
+        match = TokenCounter.PROMPT_TOKENS_PATTERN.search(content)
+
+        return int(match.group(1)) if match else None
@@ -0,0 +1,422 @@
+import asyncio
+from contextlib import contextmanager
+import random
+import time
+from typing import Dict, Iterator, List, Optional, Set
+from urllib.parse import urlsplit
+
+from fastapi import HTTPException
+import httpx
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.schemas.settings import HTTPClient as HTTPClientSettings
+from app.utils.exceptions import UpstreamUnavailableException
+from app.utils.logging import logger
+from app.utils.settings import settings
+from app.utils.variables import DEFAULT_TIMEOUT
+
+
+class UpstreamState:
+    """
+    Outstanding requests, latency, circuit breaker and retry budget of an upstream.
+
+    The circuit opens after consecutive failures: requests are rejected without being sent to the upstream until the end
+    of the ejection duration. The circuit is then half-open, a single request is sent to probe the upstream: the circuit
+    closes if it succeeds and opens again if it fails.
+    """
+
+    LATENCY_SMOOTHING = 0.2  # weight of the last request in the latency moving average
+    MAX_RETRY_TOKENS = 10.0  # max retries allowed in a burst
+
+    CLOSED = "closed"
+    HALF_OPEN = "half-open"
+    OPEN = "open"
+
+    def __init__(self, upstream: str, ejection_threshold: int, ejection_duration: float, retry_budget: float) -> None:
+        self.upstream = upstream
+        self.ejection_threshold = ejection_threshold
+        self.ejection_duration = ejection_duration
+        self.retry_budget = retry_budget
+
+        self.requests_in_flight = 0
+        self.latency: Optional[float] = None
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.probe_started: Optional[float] = None
+        self.retry_tokens = self.MAX_RETRY_TOKENS
+
+    @property
+    def circuit(self) -> str:
+        if self.ejected_until == 0.0:
+            return self.CLOSED
+        if time.monotonic() < self.ejected_until:
+            return self.OPEN
+
+        return self.HALF_OPEN
+
+    @property
+    def probing(self) -> bool:
+        # a probe request that never reported (e.g. cancelled) does not block the circuit longer than the ejection duration
+        return self.probe_started is not None and time.monotonic() - self.probe_started < self.ejection_duration
+
+    @property
+    def ejected(self) -> bool:
+        """
+        Whether the upstream should be skipped by load balancing: the circuit is open or a probe request is in flight.
+        """
+        circuit = self.circuit
+
+        return circuit == self.OPEN or (circuit == self.HALF_OPEN and self.probing)
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, round(self.ejected_until - time.monotonic()))
+
+    def allow_request(self) -> bool:
+        circuit = self.circuit
+        if circuit == self.OPEN:
+            return False
+        if circuit == self.HALF_OPEN:
+            if self.probing:
+                return False
+            self.probe_started = time.monotonic()
+
+        return True
+
+    def allow_retry(self) -> bool:
+        """
+        Withdraw a retry from the retry budget, each request deposits a fraction of a retry so that retries stay below this
+        fraction of the requests.
+        """
+        if self.retry_tokens < 1.0:
+            return False
+        self.retry_tokens -= 1.0
+
+        return True
+
+    def deposit_retry(self) -> None:
+        self.retry_tokens = min(self.MAX_RETRY_TOKENS, self.retry_tokens + self.retry_budget)
+
+    def report_success(self, latency: float) -> None:
+        if self.circuit != self.CLOSED:
+            logger.info(msg=f"upstream {self.upstream} circuit closed.")
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.probe_started = None
+        self.latency = latency if self.latency is None else self.LATENCY_SMOOTHING * latency + (1 - self.LATENCY_SMOOTHING) * self.latency
+
+    def report_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.ejection_threshold or self.probing:
+            self.ejected_until = time.monotonic() + self.ejection_duration
+            self.probe_started = None
+            logger.warning(msg=f"upstream {self.upstream} circuit opened for {self.ejection_duration}s after {self.failures} consecutive failures.")
+
+
+class UpstreamClients:
+    """
+    Registry of long-lived HTTP clients, one connection pool per upstream (scheme, host and port) to reuse TCP/TLS connections
+    between requests to the models API. The registry also tracks the state of each model API, keyed by its base URL, to load
+    balance requests between replicas: model APIs served behind the same host and port (e.g. a gateway routing on the path)
+    share a connection pool but have their own circuit breaker, requests in flight and latency.
+    """
+
+    connections = Gauge(
+        name="http_upstream_connections",
+        documentation="Number of connections opened in the upstream connection pool by state",
+        labelnames=["upstream", "state"],
+    )
+    requests_in_flight = Gauge(
+        name="http_upstream_requests_in_flight",
+        documentation="Number of requests in flight to the upstream",
+        labelnames=["upstream"],
+    )
+    circuit = Gauge(
+        name="http_upstream_circuit_state",
+        documentation="Circuit breaker state of the upstream (0: closed, 1: half-open, 2: open)",
+        labelnames=["upstream"],
+    )
+    retries = Counter(
+        name="http_upstream_retries_total",
+        documentation="Number of requests retried to the upstream",
+        labelnames=["upstream"],
+    )
+    rejected = Counter(
+        name="http_upstream_rejected_total",
+        documentation="Number of requests rejected without being sent to the upstream because its circuit is open",
+        labelnames=["upstream"],
+    )
+    aborted_streams = Counter(
+        name="http_upstream_aborted_streams_total",
+        documentation="Number of streamed responses closed before their end because the client disconnected",
+        labelnames=["upstream"],
+    )
+    aborted_tokens = Counter(
+        name="http_upstream_aborted_tokens_total",
+        documentation="Number of tokens generated by the upstream for streamed responses closed before their end (one token per event)",
+        labelnames=["upstream"],
+    )
+    request_duration = Histogram(
+        name="http_upstream_request_duration_seconds",
+        documentation="Time to receive the response headers from the upstream",
+        labelnames=["upstream"],
+    )
+
+    CIRCUIT_STATES = {UpstreamState.CLOSED: 0, UpstreamState.HALF_OPEN: 1, UpstreamState.OPEN: 2}
+    RETRY_STATUS_CODES = (502, 503, 504)
+
+    def __init__(self, settings: HTTPClientSettings) -> None:
+        self.settings = settings
+        self.clients: Dict[str, httpx.AsyncClient] = dict()
+        self.states: Dict[str, UpstreamState] = dict()
+        self.base_urls: List[str] = list()
+        self.closing_tasks: Set[asyncio.Task] = set()
+
+    def setup(self, urls: List[str]) -> None:
+        """
+        Register the model APIs and open a connection pool for each upstream.
+
+        Args:
+            urls (List[str]): Base URLs of the model APIs.
+        """
+        for url in urls:
+            base_url = str(url).rstrip("/")
+            if base_url not in self.base_urls:
+                self.base_urls.append(base_url)
+            self.get(url=url)
+
+    def reload(self, settings: HTTPClientSettings) -> None:
+        """
+        Apply reloaded settings (see ClientsManager.reload). The connection pools are replaced if their limits changed: the
+        requests in flight finish with the previous pools, closed after the request timeout.
+
+        Args:
+            settings (HTTPClientSettings): The reloaded settings.
+        """
+        pool_settings = ("max_connections", "max_keepalive_connections", "keepalive_expiry", "http2")
+        previous_clients = None
+        if any(getattr(settings, name) != getattr(self.settings, name) for name in pool_settings):
+            previous_clients, self.clients = self.clients, dict()
+
+        self.settings = settings
+        for state in self.states.values():
+            state.ejection_threshold = settings.ejection_threshold
+            state.ejection_duration = settings.ejection_duration
+            state.retry_budget = settings.retry_budget
+
+        if previous_clients:
+            for upstream in previous_clients:
+                self.get(url=upstream)
+            task = asyncio.create_task(self._close_clients(clients=list(previous_clients.values()), delay=DEFAULT_TIMEOUT))
+            self.closing_tasks.add(task)
+            task.add_done_callback(self.closing_tasks.discard)
+
+    def get(self, url: str) -> httpx.AsyncClient:
+        """
+        Get the pooled client of an upstream, the pool is created on first use if the upstream was not declared at startup.
+
+        Args:
+            url (str): Any URL of the upstream.
+
+        Returns:
+            httpx.AsyncClient: The pooled client.
+        """
+        upstream = self.get_upstream(url=url)
+        if upstream not in self.clients:
+            limits = httpx.Limits(
+                max_connections=self.settings.max_connections,
+                max_keepalive_connections=self.settings.max_keepalive_connections,
+                keepalive_expiry=self.settings.keepalive_expiry,
+            )
+            transport = httpx.AsyncHTTPTransport(limits=limits, http2=self.settings.http2, retries=0)
+            self.clients[upstream] = httpx.AsyncClient(transport=transport, timeout=DEFAULT_TIMEOUT)
+
+            self.connections.labels(upstream=upstream, state="active").set_function(lambda: self._count_connections(upstream=upstream, idle=False))
+            self.connections.labels(upstream=upstream, state="idle").set_function(lambda: self._count_connections(upstream=upstream, idle=True))
+            logger.debug(msg=f"connection pool opened for {upstream}.")
+
+        return self.clients[upstream]
+
+    def get_state(self, url: str) -> UpstreamState:
+        """
+        Get the state of a model API.
+
+        Args:
+            url (str): Any URL of the model API.
+
+        Returns:
+            UpstreamState: The state of the model API.
+        """
+        upstream = self.get_base_url(url=url)
+        if upstream not in self.states:
+            state = UpstreamState(
+                upstream=upstream,
+                ejection_threshold=self.settings.ejection_threshold,
+                ejection_duration=self.settings.ejection_duration,
+                retry_budget=self.settings.retry_budget,
+            )
+            self.states[upstream] = state
+
+            self.requests_in_flight.labels(upstream=upstream).set_function(lambda: state.requests_in_flight)
+            self.circuit.labels(upstream=upstream).set_function(lambda: self.CIRCUIT_STATES[state.circuit])
+
+        return self.states[upstream]
+
+    @contextmanager
+    def track(self, url: str) -> Iterator[UpstreamState]:
+        """
+        Count a request in flight to an upstream during the context, including the time to read a streamed response.
+
+        Args:
+            url (str): URL of the request.
+        """
+        state = self.get_state(url=url)
+        state.requests_in_flight += 1
+        try:
+            yield state
+        finally:
+            state.requests_in_flight -= 1
+
+    async def send(self, url: str, method: str, timeout: Optional[float] = None, stream: bool = False, **kwargs) -> httpx.Response:
+        """
+        Send a request to an upstream through its circuit breaker. Requests not received by the upstream (connection errors) and
+        responses with a 502, 503 or 504 status code are retried with exponential backoff and jitter, within the retry budget of
+        the upstream. The circuit breaker counts the result of the last attempt only, one failure per request.
+
+        Args:
+            url (str): URL of the request.
+            method (str): The method of the request.
+            timeout (Optional[float]): The timeout of the request, in seconds.
+            stream (bool): Whether to stream the response body, the caller must close the response.
+            **kwargs: Other arguments of httpx.AsyncClient.build_request (headers, json, files, data).
+
+        Returns:
+            httpx.Response: The response of the upstream.
+
+        Raises:
+            HTTPException: 503 if the circuit of the upstream is open, 504 if the request timed out and 500 for other errors.
+        """
+        client = self.get(url=url)
+        state = self.get_state(url=url)
+        state.deposit_retry()
+
+        attempt = 0
+        while True:
+            if not state.allow_request():
+                self.rejected.labels(upstream=state.upstream).inc()
+                raise UpstreamUnavailableException(retry_after=state.retry_after)
+
+            response, error, retryable, latency = None, None, True, None
+            try:
+                start = time.perf_counter()
+                request = client.build_request(method=method, url=url, timeout=timeout, **kwargs)
+                response = await client.send(request=request, stream=stream)
+            except httpx.TimeoutException as e:
+                error = HTTPException(status_code=504, detail="Request timed out, model is not available.")
+                # the request may have been processed by the upstream if the timeout occurred after sending it
+                retryable = isinstance(e, (httpx.ConnectTimeout, httpx.PoolTimeout))
+            except Exception as e:
+                error = HTTPException(status_code=500, detail=type(e).__name__)
+                retryable = isinstance(e, httpx.ConnectError)
+            else:
+                latency = time.perf_counter() - start
+                retryable = response.status_code in self.RETRY_STATUS_CODES
+
+            # a probe of a half-open circuit is not retried, the circuit closes or opens again on its result
+            if not retryable or attempt >= self.settings.max_retries or state.probing or not state.allow_retry():
+                # the request is reported once, on its last attempt: retried attempts do not count as failures of the upstream
+                if error is not None:
+                    state.report_failure()
+                    raise error
+                self.report_response(state=state, status_code=response.status_code, latency=latency)
+                return response
+
+            if response is not None:
+                await response.aclose()
+            attempt += 1
+            self.retries.labels(upstream=state.upstream).inc()
+            # full jitter: wait a random duration between 0 and the exponential backoff
+            await asyncio.sleep(random.uniform(0, min(self.settings.retry_max_backoff, self.settings.retry_backoff * 2**attempt)))
+
+    def report_response(self, state: UpstreamState, status_code: int, latency: float) -> None:
+        """
+        Report the response of an upstream, server errors are reported as failures.
+
+        Args:
+            state (UpstreamState): The state of the upstream.
+            status_code (int): The status code of the response.
+            latency (float): The time to receive the response headers, in seconds.
+        """
+        self.request_duration.labels(upstream=state.upstream).observe(amount=latency)
+        if status_code >= 500:
+            state.report_failure()
+        else:
+            state.report_success(latency=latency)
+
+    def report_abort(self, state: UpstreamState, tokens: int) -> None:
+        """
+        Report a streamed response closed before its end because the client disconnected.
+
+        Args:
+            state (UpstreamState): The state of the upstream.
+            tokens (int): The number of tokens already generated, nobody will read the response.
+        """
+        self.aborted_streams.labels(upstream=state.upstream).inc()
+        self.aborted_tokens.labels(upstream=state.upstream).inc(tokens)
+
+    async def close(self) -> None:
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients = dict()
+
+    @staticmethod
+    async def _close_clients(clients: List[httpx.AsyncClient], delay: float) -> None:
+        await asyncio.sleep(delay)
+        for client in clients:
+            await client.aclose()
+
+    def _count_connections(self, upstream: str, idle: bool) -> int:
+        client = self.clients.get(upstream)
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        if pool is None:
+            return 0
+
+        return len([connection for connection in pool.connections if connection.is_idle() == idle])
+
+    def get_base_url(self, url: str) -> str:
+        """
+        Get the base URL of the model API of an URL: the longest registered base URL the URL belongs to, routes beside the `/v1`
+        path of a base URL included (e.g. the `/rerank` route of Text Embeddings Inference), else its upstream.
+
+        Args:
+            url (str): The URL.
+
+        Returns:
+            str: The base URL, for example "http://localhost:8000/v1".
+        """
+        url = str(url)
+        matches = list()
+        for base_url in self.base_urls:
+            root = base_url.removesuffix("/v1")
+            if url == root or url.startswith(f"{root}/"):
+                matches.append(base_url)
+
+        return max(matches, key=len) if matches else self.get_upstream(url=url)
+
+    @staticmethod
+    def get_upstream(url: str) -> str:
+        """
+        Get the upstream (scheme, host and port) of an URL.
+
+        Args:
+            url (str): The URL.
+
+        Returns:
+            str: The upstream, for example "http://localhost:8000".
+        """
+        url = urlsplit(str(url))
+
+        return f"{url.scheme}://{url.netloc}"
+
+
+upstream_clients = UpstreamClients(settings=settings.http)
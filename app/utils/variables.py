@@ -14,6 +14,12 @@ EMBEDDINGS_MODEL_TYPE = "text-embeddings-inference"
 LANGUAGE_MODEL_TYPE = "text-generation"
 RERANK_MODEL_TYPE = "text-classification"
 
+LISTWISE_RERANK_TYPE = "listwise"
+POINTWISE_RERANK_TYPE = "pointwise"
+
+LEAST_OUTSTANDING_REQUESTS_STRATEGY = "least-outstanding-requests"
+POWER_OF_TWO_CHOICES_STRATEGY = "power-of-two-choices"
+
 CHUNKERS = ["LangchainRecursiveCharacterTextSplitter", "NoChunker"]
 DEFAULT_CHUNKER = "LangchainRecursiveCharacterTextSplitter"
 
@@ -0,0 +1,134 @@
+import base64
+from json import dumps, loads
+import re
+from typing import List, Tuple, Union
+
+import numpy as np
+
+FLOAT_ARRAY = re.compile(rb'"embedding"\s*:\s*\[([^\]]*)\]')
+
+
+def decode_vector(embedding: Union[str, List[float]]) -> np.ndarray:
+    """
+    Decode an embedding of an OpenAI compatible API, either a list of floats or a base64 encoded buffer of little-endian float32.
+
+    Args:
+        embedding (Union[str, List[float]]): The embedding.
+
+    Returns:
+        np.ndarray: The float32 vector.
+    """
+    if isinstance(embedding, str):
+        return np.frombuffer(base64.b64decode(embedding), dtype="<f4")
+
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def decode_vectors(content: bytes) -> Tuple[List[np.ndarray], dict]:
+    """
+    Decode the JSON body of an embeddings response of an OpenAI compatible API. The arrays of floats are parsed by NumPy straight
+    from the body, without building a Python float per value, only the rest of the body is decoded as JSON. Base64 encoded
+    vectors are decoded from their buffer.
+
+    Args:
+        content (bytes): The body of the response.
+
+    Returns:
+        Tuple[List[np.ndarray], dict]: The float32 vectors sorted by index and the response without the vectors (e.g. its usage).
+    """
+    arrays = list()
+
+    def extract(match: re.Match) -> bytes:
+        arrays.append(match.group(1))
+        return b'"embedding":null'
+
+    response = loads(FLOAT_ARRAY.sub(extract, content))
+
+    rows = None
+    if arrays and all(arrays):
+        try:
+            rows = iter(np.loadtxt(arrays, dtype=np.float32, delimiter=",", ndmin=2))
+        except ValueError:
+            # vectors of different sizes or arrays split over lines
+            pass
+    if rows is None:
+        rows = iter([decode_vector(embedding=loads(b"[" + array + b"]")) for array in arrays])
+
+    vectors = dict()
+    for data in response["data"]:
+        vectors[data["index"]] = next(rows) if data["embedding"] is None else decode_vector(embedding=data["embedding"])
+
+    return [vectors[index] for index in sorted(vectors)], response
+
+
+def encode_vector(vector: np.ndarray) -> str:
+    """
+    Encode a vector as a base64 encoded buffer of little-endian float32, as the OpenAI API with `encoding_format="base64"`.
+
+    Args:
+        vector (np.ndarray): The vector.
+
+    Returns:
+        str: The base64 encoded vector.
+    """
+    return base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode(encoding="ascii")
+
+
+def encode_vectors(content: bytes) -> bytes:
+    """
+    Encode as base64 the arrays of floats of the JSON body of an embeddings response of an OpenAI compatible API, for model APIs
+    ignoring `encoding_format="base64"`. Bodies without arrays of floats are returned as is.
+
+    Args:
+        content (bytes): The body of the response.
+
+    Returns:
+        bytes: The body of the response with base64 encoded vectors.
+    """
+    if FLOAT_ARRAY.search(content) is None:
+        return content
+
+    vectors, response = decode_vectors(content=content)
+    vectors = dict(zip(sorted(data["index"] for data in response["data"]), vectors))
+    for data in response["data"]:
+        data["embedding"] = encode_vector(vector=vectors[data["index"]])
+
+    return dumps(response).encode(encoding="utf-8")
+
+
+def format_vector(vector: np.ndarray) -> str:
+    """
+    Format a float32 vector as a JSON array of floats, each value with the shortest representation read back as the same float32:
+    about half the size of the float64 representations of `json.dumps(vector.tolist())`. Non-finite values, not valid JSON, are
+    formatted as null.
+
+    Args:
+        vector (np.ndarray): The vector.
+
+    Returns:
+        str: The JSON array.
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    values = vector.astype(str).tolist()
+    for i in np.flatnonzero(~np.isfinite(vector)):
+        values[i] = "null"
+
+    return "[" + ",".join(values) + "]"
+
+
+def normalize_vectors(vectors: np.ndarray) -> np.ndarray:
+    """
+    Normalize in place the rows of a float32 matrix of vectors to unit length, with a single pass over the matrix. Null vectors
+    are left unchanged.
+
+    Args:
+        vectors (np.ndarray): The (n, d) matrix of vectors, writable.
+
+    Returns:
+        np.ndarray: The normalized matrix.
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    vectors /= norms
+
+    return vectors